@@ -24,6 +24,11 @@ from app.models import (
     IntegrationConfig,
     ProcessingQueue,
     AuditLog,
+    OCRCacheEntry,
+    InvoiceDuplicateKey,
+    VendorAlias,
+    InvoiceRollup,
+    ExpenseForecast,
 )
 
 # this is the Alembic Config object
@@ -0,0 +1,49 @@
+from typing import Optional, Dict, Any, Tuple
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.client import Client
+
+
+def organization_id_from(payload: Dict[str, Any]) -> uuid.UUID:
+    """Organization of the authenticated user (``organization_id`` claim)."""
+    try:
+        return uuid.UUID(str(payload["organization_id"]))
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=401, detail="Token has no organization")
+
+
+async def resolve_client(
+    payload: Dict[str, Any],
+    client_id: Optional[uuid.UUID],
+    db: AsyncSession,
+) -> Tuple[uuid.UUID, uuid.UUID]:
+    """
+    Client a request acts on, as (client_id, organization_id).
+
+    Client users are pinned to their own ``client_id`` claim; admins must
+    name a client that belongs to their organization.
+    """
+    role = payload.get("role")
+    if role == "client":
+        own = payload.get("client_id")
+        if not own:
+            raise HTTPException(status_code=403, detail="User is not linked to a client")
+        if client_id is not None and str(client_id) != str(own):
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+        client_id = uuid.UUID(str(own))
+    elif client_id is None:
+        raise HTTPException(status_code=400, detail="client_id is required")
+
+    query = select(Client.id, Client.organization_id).where(
+        Client.id == client_id, Client.deleted_at.is_(None)
+    )
+    if role != "super_admin":
+        query = query.where(Client.organization_id == organization_id_from(payload))
+    row = (await db.execute(query)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return row.id, row.organization_id
@@ -0,0 +1,86 @@
+from typing import Dict, Any, Optional
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import organization_id_from, resolve_client
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import get_current_user, require_admin
+from app.models.expense_forecast import ExpenseForecast
+from app.schemas.ai import CategorizeRequest, CategorizeResponse, CategorizeResult, ForecastResponse, ForecastResult
+from app.services.categorizer import CategorizeInput, get_categorizer_cache, recategorize_client
+from app.services.forecasting import ALL_CATEGORIES
+
+router = APIRouter()
+
+
+@router.post("/categorize", response_model=CategorizeResponse)
+async def categorize(
+    request: CategorizeRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """Categorize a batch of invoices or line items with the organization's categories."""
+    if not settings.ENABLE_ML_CATEGORIZATION:
+        raise HTTPException(status_code=503, detail="Categorization is disabled")
+    if len(request.items) > settings.CATEGORIZE_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.CATEGORIZE_BATCH_LIMIT} items per request",
+        )
+    categorizer = await get_categorizer_cache().get(db, organization_id_from(current_user))
+    matches = categorizer.categorize_many([
+        CategorizeInput(item.vendor_name, item.description, item.amount) for item in request.items
+    ])
+    results = [
+        CategorizeResult(
+            category_id=m.category_id,
+            category=m.name,
+            account_code=m.account_code,
+            confidence=m.confidence,
+            matched=m.matched,
+        ) if m else CategorizeResult()
+        for m in matches
+    ]
+    return CategorizeResponse(results=results, categorized=sum(1 for m in matches if m))
+
+
+@router.post("/recategorize/{client_id}")
+async def recategorize(
+    client_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Re-run categorization over all of a client's invoices (after a chart-of-accounts change)."""
+    if not settings.ENABLE_ML_CATEGORIZATION:
+        raise HTTPException(status_code=503, detail="Categorization is disabled")
+    client_id, _ = await resolve_client(current_user, client_id, db)
+    return await recategorize_client(db, client_id)
+
+
+@router.get("/forecasts", response_model=ForecastResponse)
+async def get_forecast(
+    client_id: Optional[uuid.UUID] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """Latest stored expense forecast of a client, overall and per category."""
+    client_id, _ = await resolve_client(current_user, client_id, db)
+    latest = (await db.execute(
+        select(func.max(ExpenseForecast.forecast_month)).where(ExpenseForecast.client_id == client_id)
+    )).scalar_one()
+    if latest is None:
+        return ForecastResponse(client_id=client_id)
+
+    forecasts = (await db.execute(
+        select(ExpenseForecast)
+        .where(ExpenseForecast.client_id == client_id, ExpenseForecast.forecast_month == latest)
+        .order_by(ExpenseForecast.forecast_amount.desc())
+    )).scalars().all()
+    results = {f.category: ForecastResult.model_validate(f, from_attributes=True) for f in forecasts}
+    total = results.pop(ALL_CATEGORIES, None)
+    return ForecastResponse(client_id=client_id, forecast_month=latest, total=total,
+                            categories=list(results.values()))
@@ -0,0 +1,59 @@
+from typing import Optional, Dict, Any
+import uuid
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import organization_id_from, resolve_client
+from app.core.cache import client_tag, get_cache, organization_tag
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import get_current_user, require_admin
+from app.services import invoice_stats
+
+router = APIRouter()
+
+
+@router.get("/admin")
+async def admin_dashboard(
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Organization-wide invoice statistics."""
+    organization_id = organization_id_from(current_user)
+
+    async def compute():
+        return {
+            "clients": await invoice_stats.active_client_count(db, organization_id),
+            "summary": await invoice_stats.summarize(db, organization_id=organization_id),
+            "top_clients": await invoice_stats.top_clients(db, organization_id),
+        }
+
+    return await get_cache().get_or_compute(
+        "dashboard:admin",
+        {"organization_id": organization_id},
+        compute,
+        tags=[organization_tag(organization_id)],
+        ttl=settings.STATS_CACHE_TTL,
+    )
+
+
+@router.get("/client")
+async def client_dashboard(
+    client_id: Optional[uuid.UUID] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """Invoice statistics of one client (the caller's own for client users)."""
+    client_id, _ = await resolve_client(current_user, client_id, db)
+
+    async def compute():
+        return {"summary": await invoice_stats.summarize(db, client_id=client_id)}
+
+    return await get_cache().get_or_compute(
+        "dashboard:client",
+        {"client_id": client_id},
+        compute,
+        tags=[client_tag(client_id)],
+        ttl=settings.STATS_CACHE_TTL,
+    )
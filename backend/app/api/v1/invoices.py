@@ -0,0 +1,260 @@
+from datetime import date
+from typing import Optional, Dict, Any, Tuple
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import organization_id_from, resolve_client
+from app.core.cache import client_tag, get_cache
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import get_current_user
+from app.models.integration_config import IntegrationConfig
+from app.models.invoice import Invoice
+from app.schemas.invoice import (
+    InvoiceIngestRequest, InvoiceIngestResponse, InvoiceListResponse, InvoiceSearchResponse, InvoiceUploadResponse,
+)
+from app.services import invoice_stats, storage
+from app.services.accounting_export import PROVIDERS, enqueue_export
+from app.services.ingest import ingest_invoices
+from app.services.invoice_listing import COUNT_MODES, InvalidCursor, InvoiceFilters, count_invoices, list_invoices
+from app.services.search import search_invoices
+from app.workers import queue
+
+router = APIRouter()
+
+
+async def _listing_scope(current_user: Dict[str, Any], client_id: Optional[uuid.UUID],
+                         db: AsyncSession) -> Tuple[Optional[uuid.UUID], uuid.UUID]:
+    """(client_id, organization_id) to list; admins may leave client_id out for the whole organization."""
+    if client_id is not None or current_user.get("role") == "client":
+        return await resolve_client(current_user, client_id, db)
+    return None, organization_id_from(current_user)
+
+
+@router.get("", response_model=InvoiceListResponse)
+async def list_invoices_endpoint(
+    client_id: Optional[uuid.UUID] = Query(None, description="Required for admins to narrow to one client"),
+    status: Optional[str] = Query(None),
+    needs_review: Optional[bool] = Query(None),
+    source: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.INVOICE_PAGE_SIZE, ge=1, le=settings.INVOICE_PAGE_SIZE_MAX),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    count: str = Query("none", pattern=f"^({'|'.join(COUNT_MODES)})$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    Invoices of a client (or of the whole organization, for admins), newest
+    first, a page at a time. Pass ``next_cursor`` back as ``cursor`` for the
+    next page; every page costs the same however deep it is.
+    """
+    client_id, organization_id = await _listing_scope(current_user, client_id, db)
+
+    filters = InvoiceFilters(
+        organization_id=organization_id,
+        client_id=client_id,
+        status=status,
+        needs_review=needs_review,
+        source=source,
+        category=category,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    try:
+        items, next_cursor = await list_invoices(db, filters, limit, cursor, ascending=order == "asc")
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Totals only on the first page; clients keep the one they got
+    total = await count_invoices(db, filters, count) if cursor is None else None
+    return InvoiceListResponse(
+        items=items,
+        next_cursor=next_cursor,
+        total=total,
+        total_is_estimate=total is not None and count == "estimate",
+    )
+
+
+@router.get("/search", response_model=InvoiceSearchResponse)
+async def search_invoices_endpoint(
+    q: str = Query(..., min_length=1, max_length=500, description="Words, \"phrases\", OR, -excluded"),
+    client_id: Optional[uuid.UUID] = Query(None),
+    status: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    limit: int = Query(20, ge=1, le=settings.SEARCH_PAGE_SIZE_MAX),
+    offset: int = Query(0, ge=0, le=settings.SEARCH_MAX_OFFSET),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """Full-text search over OCR text, vendor, line items and notes, best matches first, with highlights."""
+    client_id, organization_id = await _listing_scope(current_user, client_id, db)
+
+    filters = InvoiceFilters(
+        organization_id=organization_id,
+        client_id=client_id,
+        status=status,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    items = await search_invoices(db, q, filters, limit=limit, offset=offset)
+    return InvoiceSearchResponse(query=q, items=items)
+
+
+@router.post("/upload", response_model=InvoiceUploadResponse, status_code=201)
+async def upload_invoice(
+    request: Request,
+    filename: str = Query(..., description="Original file name, used for the extension check"),
+    client_id: Optional[uuid.UUID] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    Upload an invoice file as the raw request body.
+
+    The body is streamed to storage (never buffered in memory) and an OCR
+    job is queued for the new invoice.
+    """
+    client_id, organization_id = await resolve_client(current_user, client_id, db)
+
+    content_length = request.headers.get("content-length")
+    try:
+        stored = await storage.save_stream(
+            request.stream(),
+            filename,
+            client_id,
+            content_length=int(content_length) if content_length else None,
+        )
+    except storage.UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    try:
+        invoice = Invoice(
+            client_id=client_id,
+            organization_id=organization_id,
+            total_amount=0.0,
+            source="upload",
+            source_sender=current_user.get("email"),
+            status="pending",
+            file_hash=stored.sha256,
+        )
+        storage.apply_to_invoice(invoice, stored)
+        db.add(invoice)
+        await db.flush()
+
+        job = await queue.enqueue(
+            db,
+            client_id,
+            "ocr",
+            file_path=stored.path,
+            source="upload",
+            source_reference=str(invoice.id),
+        )
+        # Committed here rather than by get_db so a failure can remove the file it stored
+        await db.commit()
+    except BaseException:
+        await storage.discard(stored)
+        raise
+
+    return InvoiceUploadResponse(
+        id=invoice.id,
+        client_id=client_id,
+        status=invoice.status,
+        original_file_name=stored.original_name,
+        file_type=stored.file_type,
+        file_size=stored.size,
+        file_hash=stored.sha256,
+        queue_id=job.id,
+    )
+
+
+@router.post("/bulk", response_model=InvoiceIngestResponse)
+async def bulk_ingest_invoices(
+    request: InvoiceIngestRequest,
+    client_id: Optional[uuid.UUID] = Query(None, description="Client of every item; otherwise each item names one"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    Insert already-parsed invoices (and their line items) in one transaction.
+
+    Items are validated one by one: a bad item is reported in ``results``
+    with its error and does not fail the rest of the batch.
+    """
+    if len(request.items) > settings.INGEST_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.INGEST_BATCH_LIMIT} invoices per request",
+        )
+    client_id, organization_id = await _listing_scope(current_user, client_id, db)
+
+    results = await ingest_invoices(db, organization_id, request.items, client_id=client_id)
+    inserted = [r for r in results if r.id is not None]
+    return InvoiceIngestResponse(
+        inserted=len(inserted),
+        failed=len(results) - len(inserted),
+        line_items=sum(r.line_items for r in inserted),
+        results=[vars(r) for r in results],
+    )
+
+
+@router.post("/export", status_code=202)
+async def export_invoices(
+    client_id: Optional[uuid.UUID] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    Queue an export of the client's approved invoices to each of its active
+    accounting integrations. An integration whose export is already queued
+    or running is reported in ``already_queued``.
+    """
+    client_id, _ = await resolve_client(current_user, client_id, db)
+    integrations = (await db.execute(
+        select(IntegrationConfig).where(
+            IntegrationConfig.client_id == client_id,
+            IntegrationConfig.is_active.is_(True),
+            IntegrationConfig.integration_type.in_(list(PROVIDERS)),
+        )
+    )).scalars().all()
+    if not integrations:
+        raise HTTPException(status_code=404, detail="No accounting integration configured")
+
+    queued, already_queued = [], []
+    for integration in integrations:
+        job_id = await enqueue_export(db, integration)
+        if job_id is None:
+            already_queued.append(str(integration.id))
+        else:
+            queued.append({"integration_id": str(integration.id), "queue_id": str(job_id)})
+    return {"queued": queued, "already_queued": already_queued}
+
+
+@router.get("/stats")
+async def invoice_stats_endpoint(
+    client_id: Optional[uuid.UUID] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """Invoice counts and amounts of a client, optionally within an invoice date range."""
+    client_id, _ = await resolve_client(current_user, client_id, db)
+
+    async def compute():
+        return await invoice_stats.summarize(db, client_id=client_id, date_from=date_from, date_to=date_to)
+
+    return await get_cache().get_or_compute(
+        "invoices:stats",
+        {"client_id": client_id, "date_from": date_from, "date_to": date_to},
+        compute,
+        tags=[client_tag(client_id)],
+        ttl=settings.STATS_CACHE_TTL,
+    )
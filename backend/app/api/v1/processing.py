@@ -0,0 +1,38 @@
+from typing import Dict, Any
+import uuid
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import resolve_client
+from app.core.database import get_db
+from app.core.security import require_admin
+from app.services.duplicates import rescan_client
+from app.services.ocr_cache import get_ocr_cache
+
+router = APIRouter()
+
+
+@router.get("/ocr-cache")
+async def ocr_cache_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """OCR result cache hit rate (this process and lifetime) and size."""
+    cache = get_ocr_cache()
+    await cache.flush_hits(db)
+    return {
+        "process": cache.stats(),
+        "table": await cache.table_stats(db),
+    }
+
+
+@router.post("/duplicates/rescan/{client_id}")
+async def rescan_duplicates(
+    client_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Rebuild a client's duplicate index and re-flag duplicates."""
+    client_id, _ = await resolve_client(current_user, client_id, db)
+    return await rescan_client(db, client_id)
@@ -0,0 +1,49 @@
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.services import whatsapp
+
+router = APIRouter()
+
+
+@router.post("/whatsapp")
+async def whatsapp_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    WAHA webhook: media messages of a client's session are queued for
+    download and OCR. Returns as soon as the jobs are queued.
+    """
+    if not settings.WHATSAPP_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="WhatsApp webhook is not configured")
+
+    # Unauthenticated until the signature is checked, so the body read is capped
+    max_bytes = settings.WHATSAPP_WEBHOOK_MAX_BYTES
+    too_large = HTTPException(status_code=413, detail=f"Webhook body exceeds {max_bytes} bytes")
+    declared = request.headers.get("Content-Length")
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    body = bytes(body)
+
+    try:
+        whatsapp.verify_signature(
+            body,
+            request.headers.get("X-Webhook-Hmac"),
+            request.headers.get("X-Webhook-Hmac-Algorithm"),
+        )
+        event = json.loads(body)
+    except whatsapp.WebhookRejected as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Expected a WAHA event object")
+
+    return {"queued": await whatsapp.handle_webhook(db, event)}
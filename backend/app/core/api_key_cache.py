@@ -0,0 +1,303 @@
+"""
+Cache of verified API keys.
+
+API keys are stored as bcrypt hashes, so verifying one costs tens to
+hundreds of milliseconds of CPU. Once a presented key has been verified it
+is remembered, keyed by a keyed BLAKE2b digest of the key (the plaintext is
+never kept), for at most ``API_KEY_CACHE_TTL`` seconds and never past the
+key's ``expires_at``.
+
+Changes to ``is_active``, ``expires_at``, ``scopes``, ``rate_limit`` or the
+hash of an APIKey row drop its cache entries as soon as the transaction
+commits, in this process directly and in other processes through a Redis
+channel (falling back to the TTL when Redis is unavailable).
+
+``last_used_at`` is not written per request; uses are collected and
+flushed in one bulk UPDATE every ``API_KEY_LAST_USED_FLUSH_SECONDS``.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Set, FrozenSet, Iterable
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from app.core.config import settings
+from app.models.api_key import APIKey
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "api-key-invalidations"
+
+# Columns whose change must drop cached verifications
+_WATCHED_COLUMNS = ("is_active", "expires_at", "scopes", "rate_limit", "key_hash", "client_id")
+
+_SESSION_PENDING = "invalidated_api_keys"
+
+
+@dataclass
+class VerifiedKey:
+    api_key_id: uuid.UUID
+    user_id: uuid.UUID
+    organization_id: uuid.UUID
+    client_id: Optional[uuid.UUID]
+    scopes: FrozenSet[str]
+    rate_limit: int
+    expires_at: Optional[datetime]
+    cached_until: float = 0.0  # time.monotonic()
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= datetime.utcnow()
+
+
+def parse_expires_at(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        # Unparseable expiry: treat as expired rather than as never expiring
+        return datetime.min
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class APIKeyCache:
+    """Bounded, TTL'd map of key digest -> VerifiedKey."""
+
+    def __init__(self, max_entries: int = settings.API_KEY_CACHE_SIZE, ttl: int = settings.API_KEY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._secret = hashlib.sha256(settings.SECRET_KEY.encode()).digest()
+        self._entries: "OrderedDict[bytes, VerifiedKey]" = OrderedDict()
+        self._by_key_id: Dict[uuid.UUID, Set[bytes]] = {}
+        self._last_used: Dict[uuid.UUID, datetime] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._publishing: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, presented_key: str) -> bytes:
+        return hashlib.blake2b(presented_key.encode(), key=self._secret, digest_size=32).digest()
+
+    def get(self, digest: bytes) -> Optional[VerifiedKey]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() >= entry.cached_until or entry.is_expired:
+            self._drop(digest)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return entry
+
+    def peek(self, digest: bytes) -> Optional[VerifiedKey]:
+        """Live entry for a digest, without counting a lookup or refreshing recency."""
+        entry = self._entries.get(digest)
+        if entry is None or time.monotonic() >= entry.cached_until or entry.is_expired:
+            return None
+        return entry
+
+    def put(self, digest: bytes, entry: VerifiedKey) -> None:
+        ttl = self.ttl
+        if entry.expires_at is not None:
+            ttl = min(ttl, (entry.expires_at - datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            return
+        entry.cached_until = time.monotonic() + ttl
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        self._by_key_id.setdefault(entry.api_key_id, set()).add(digest)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, digest: bytes) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            digests = self._by_key_id.get(entry.api_key_id)
+            if digests is not None:
+                digests.discard(digest)
+                if not digests:
+                    del self._by_key_id[entry.api_key_id]
+
+    def invalidate(self, api_key_ids: Iterable[uuid.UUID]) -> None:
+        for api_key_id in api_key_ids:
+            for digest in list(self._by_key_id.get(api_key_id, ())):
+                self._drop(digest)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_key_id.clear()
+
+    # last_used_at batching
+
+    def record_use(self, api_key_id: uuid.UUID) -> None:
+        self._last_used[api_key_id] = datetime.utcnow()
+
+    async def flush_last_used(self) -> int:
+        if not self._last_used:
+            return 0
+        from app.core.database import AsyncSessionLocal
+
+        pending, self._last_used = self._last_used, {}
+        async with AsyncSessionLocal() as db:
+            # ORM bulk UPDATE by primary key (executemany); no flush events fire
+            await db.execute(update(APIKey), [
+                {"id": api_key_id, "last_used_at": used_at.isoformat()}
+                for api_key_id, used_at in pending.items()
+            ])
+            await db.commit()
+        return len(pending)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.API_KEY_LAST_USED_FLUSH_SECONDS)
+            try:
+                await self.flush_last_used()
+            except Exception as e:
+                logger.warning(f"Could not record API key usage: {e}")
+
+    # Cross-process invalidation
+
+    async def publish_invalidation(self, api_key_ids: Iterable[uuid.UUID]) -> None:
+        import redis.asyncio as redis
+
+        try:
+            client = redis.from_url(settings.REDIS_URL)
+            try:
+                await client.publish(INVALIDATION_CHANNEL, ",".join(str(i) for i in api_key_ids))
+            finally:
+                await client.aclose()
+        except Exception as e:
+            logger.warning(f"Could not publish API key invalidation, other workers rely on the TTL: {e}")
+
+    async def _listen_loop(self) -> None:
+        import redis.asyncio as redis
+
+        while True:
+            client = redis.from_url(settings.REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Anything may have changed while we were not subscribed
+                    self.clear()
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            data = message["data"]
+                            if isinstance(data, bytes):
+                                data = data.decode()
+                            self.invalidate(uuid.UUID(i) for i in data.split(",") if i)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"API key invalidation listener disconnected: {e}")
+                await asyncio.sleep(30)
+            finally:
+                await client.aclose()
+
+    async def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._listen_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush_last_used()
+        except Exception as e:
+            logger.warning(f"Could not record API key usage: {e}")
+
+
+_api_key_cache: Optional[APIKeyCache] = None
+
+
+def get_api_key_cache() -> APIKeyCache:
+    global _api_key_cache
+    if _api_key_cache is None:
+        _api_key_cache = APIKeyCache()
+    return _api_key_cache
+
+
+async def authenticate_api_key(db: AsyncSession, presented_key: str) -> Optional[VerifiedKey]:
+    """VerifiedKey for a presented API key, or None if it is unknown, inactive or expired."""
+    from app.core.security import api_key_prefix, password_hasher, verify_api_key
+
+    cache = get_api_key_cache()
+    digest = cache.digest(presented_key)
+    entry = cache.get(digest)
+    if entry is None:
+        candidates = (await db.execute(
+            select(APIKey).where(APIKey.key_prefix == api_key_prefix(presented_key), APIKey.is_active.is_(True))
+        )).scalars().all()
+        for candidate in candidates:
+            # bcrypt is deliberately slow; keep it off the event loop
+            if await password_hasher.run(verify_api_key, presented_key, candidate.key_hash):
+                entry = VerifiedKey(
+                    api_key_id=candidate.id,
+                    user_id=candidate.user_id,
+                    organization_id=candidate.organization_id,
+                    client_id=candidate.client_id,
+                    scopes=frozenset(candidate.scopes or ()),
+                    rate_limit=candidate.rate_limit or settings.API_KEY_RATE_LIMIT,
+                    expires_at=parse_expires_at(candidate.expires_at),
+                )
+                break
+        if entry is None or entry.is_expired:
+            return None
+        cache.put(digest, entry)
+
+    cache.record_use(entry.api_key_id)
+    return entry
+
+
+@event.listens_for(APIKey, "after_update")
+def _api_key_updated(mapper, connection, target) -> None:
+    if any(get_history(target, column).has_changes() for column in _WATCHED_COLUMNS):
+        _mark_invalidated(target)
+
+
+@event.listens_for(APIKey, "after_delete")
+def _api_key_deleted(mapper, connection, target) -> None:
+    _mark_invalidated(target)
+
+
+def _mark_invalidated(target: APIKey) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_PENDING, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_invalidations(session: Session) -> None:
+    api_key_ids = session.info.pop(_SESSION_PENDING, None)
+    if not api_key_ids:
+        return
+    cache = get_api_key_cache()
+    cache.invalidate(api_key_ids)
+    try:
+        task = asyncio.get_running_loop().create_task(cache.publish_invalidation(api_key_ids))
+    except RuntimeError:
+        return  # no event loop (scripts); other processes rely on the TTL
+    cache._publishing.add(task)
+    task.add_done_callback(cache._publishing.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop(_SESSION_PENDING, None)
@@ -0,0 +1,324 @@
+"""
+Read-through cache for expensive read endpoints (dashboards, stats).
+
+Values are JSON, stored under ``<namespace>:<digest of query params>`` with
+a set of tags (``org:<id>``, ``client:<id>``). Writing an Invoice
+invalidates the tags of its client and organization once the transaction
+commits, so cached aggregates never outlive the data by more than the
+commit-to-invalidate gap.
+
+Stampedes are prevented at two levels: concurrent misses for one key in a
+process share a single computation, and across processes a short Redis
+lock lets one worker compute while the others wait for its result.
+
+``CACHE_BACKEND=memory`` uses an in-process backend with the same
+semantics, for tests and single-process setups. Backend errors never fail
+a request: the value is computed from the database instead.
+"""
+from typing import Optional, Dict, Any, Iterable, Callable, Awaitable, Set, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.models.invoice import Invoice
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "cache"
+
+_SESSION_PENDING = "invalidated_cache_tags"
+
+# Deletes every key recorded under each tag, then the tag sets themselves
+_INVALIDATE_SCRIPT = """
+for _, tag in ipairs(KEYS) do
+    local members = redis.call('SMEMBERS', tag)
+    for i = 1, #members, 500 do
+        redis.call('DEL', unpack(members, i, math.min(i + 499, #members)))
+    end
+    redis.call('DEL', tag)
+end
+return #KEYS
+"""
+
+# Release a lock only if we still own it
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def organization_tag(organization_id) -> str:
+    return f"org:{organization_id}"
+
+
+def client_tag(client_id) -> str:
+    return f"client:{client_id}"
+
+
+def invoice_tags(client_id, organization_id) -> Set[str]:
+    return {client_tag(client_id), organization_tag(organization_id)}
+
+
+def _tag_key(tag: str) -> str:
+    return f"{KEY_PREFIX}:tag:{tag}"
+
+
+class MemoryBackend:
+    """In-process backend with TTLs and tags."""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[bytes, float]] = {}
+        self._tags: Dict[str, Set[str]] = {}
+        self._locks: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.monotonic():
+            del self._values[key]
+            return None
+        return item[0]
+
+    async def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str], tag_ttl: int) -> None:
+        self._values[key] = (value, time.monotonic() + ttl)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._values.pop(key, None)
+
+    async def lock(self, key: str, ttl: float) -> Optional[str]:
+        holder = self._locks.get(key)
+        if holder is not None and holder[1] > time.monotonic():
+            return None
+        token = secrets.token_hex(8)
+        self._locks[key] = (token, time.monotonic() + ttl)
+        return token
+
+    async def unlock(self, key: str, token: str) -> None:
+        if self._locks.get(key, ("",))[0] == token:
+            del self._locks[key]
+
+
+class RedisBackend:
+    def __init__(self, url: str = settings.REDIS_URL):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._invalidate = self._redis.register_script(_INVALIDATE_SCRIPT)
+        self._unlock = self._redis.register_script(_UNLOCK_SCRIPT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str], tag_ttl: int) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, value, ex=ttl)
+            for tag in tags:
+                pipe.sadd(_tag_key(tag), key)
+                # tag_ttl >= every entry's ttl, so a tag set never expires before its entries
+                pipe.expire(_tag_key(tag), tag_ttl)
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        keys = [_tag_key(tag) for tag in tags]
+        if keys:
+            await self._invalidate(keys=keys)
+
+    async def lock(self, key: str, ttl: float) -> Optional[str]:
+        token = secrets.token_hex(8)
+        acquired = await self._redis.set(key, token, nx=True, px=int(ttl * 1000))
+        return token if acquired else None
+
+    async def unlock(self, key: str, token: str) -> None:
+        await self._unlock(keys=[key], args=[token])
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class ReadThroughCache:
+    """get_or_compute() with tags and single-flight."""
+
+    def __init__(self, backend, ttl: int = settings.REDIS_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pending_invalidations: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(namespace: str, params: Dict[str, Any]) -> str:
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:32]
+        return f"{KEY_PREFIX}:{namespace}:{digest}"
+
+    async def _get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self.backend.get(key)
+        except Exception as e:
+            # Fail open: serve from the database rather than erroring
+            self.errors += 1
+            logger.warning(f"Cache read failed: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+        ttl: Optional[int] = None,
+    ) -> Any:
+        key = self.key(namespace, params)
+        value = await self._get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        # Single-flight within this process
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_once(key, compute, list(tags), min(ttl or self.ttl, self.ttl))
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters see the exception; don't warn about it being unretrieved
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _compute_once(self, key: str, compute, tags, ttl: int) -> Any:
+        self.misses += 1
+        lock_key = f"{key}:lock"
+        token = None
+        backend_ok = True
+        try:
+            token = await self.backend.lock(lock_key, settings.CACHE_LOCK_TIMEOUT)
+        except Exception as e:
+            backend_ok = False
+            self.errors += 1
+            logger.warning(f"Cache lock failed: {e}")
+
+        if token is None and backend_ok:
+            # Another process is computing; wait for its result, then give up and compute
+            deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                value = await self._get(key)
+                if value is not None:
+                    return value
+
+        try:
+            value = await compute()
+            try:
+                await self.backend.set(key, json.dumps(value, default=str).encode(), ttl, tags, self.ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache write failed: {e}")
+            return value
+        finally:
+            if token is not None:
+                try:
+                    await self.backend.unlock(lock_key, token)
+                except Exception as e:
+                    logger.warning(f"Cache unlock failed: {e}")
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        if not tags:
+            return
+        try:
+            await self.backend.invalidate_tags(tags)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache invalidation failed for {tags}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def close(self) -> None:
+        await asyncio.gather(*self._pending_invalidations, return_exceptions=True)
+        close = getattr(self.backend, "close", None)
+        if close is not None:
+            await close()
+
+
+_cache: Optional[ReadThroughCache] = None
+
+
+def get_cache() -> ReadThroughCache:
+    global _cache
+    if _cache is None:
+        backend = RedisBackend() if settings.CACHE_BACKEND == "redis" else MemoryBackend()
+        _cache = ReadThroughCache(backend)
+    return _cache
+
+
+async def close_cache() -> None:
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+
+# Invalidation on Invoice writes; bulk UPDATEs bypass these events and
+# call invalidate_tags themselves
+
+@event.listens_for(Invoice, "after_insert")
+@event.listens_for(Invoice, "after_update")
+@event.listens_for(Invoice, "after_delete")
+def _invoice_written(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_PENDING, set()).update(
+            invoice_tags(target.client_id, target.organization_id)
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    tags = session.info.pop(_SESSION_PENDING, None)
+    if not tags or _cache is None:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(_cache.invalidate_tags(tags))
+    except RuntimeError:
+        return  # no event loop (scripts); entries expire with their TTL
+    _cache._pending_invalidations.add(task)
+    task.add_done_callback(_cache._pending_invalidations.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_PENDING, None)
@@ -22,9 +22,21 @@ class Settings(BaseSettings):
     DB_POOL_SIZE: int = 20
     DB_MAX_OVERFLOW: int = 40
 
+    # Processing queue workers
+    QUEUE_BATCH_SIZE: int = 10  # jobs claimed per round-trip
+    QUEUE_POLL_INTERVAL: float = 1.0  # seconds to sleep when the queue is empty
+    QUEUE_LEASE_SECONDS: int = 300
+    QUEUE_HEARTBEAT_INTERVAL: int = 60
+    QUEUE_MAX_ATTEMPTS: int = 5
+    QUEUE_RETRY_BACKOFF: float = 30.0  # base seconds, doubled per attempt
+    QUEUE_RETRY_BACKOFF_MAX: float = 3600.0
+
     # Redis
     REDIS_URL: str = "redis://:invoice_redis_pass_2024@localhost:6382/0"
     REDIS_CACHE_TTL: int = 3600  # 1 hour
+    CACHE_BACKEND: str = "redis"  # redis, memory (in-process, for tests/single process)
+    CACHE_LOCK_TIMEOUT: float = 10.0  # seconds other workers wait for a value being computed
+    STATS_CACHE_TTL: int = 300  # dashboard/stats entries; writes invalidate them sooner
 
     # Celery
     CELERY_BROKER_URL: str = "redis://:invoice_redis_pass_2024@localhost:6382/1"
@@ -36,9 +48,17 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     API_KEY_EXPIRE_DAYS: int = 365
+    API_KEY_CACHE_SIZE: int = 10000  # verified keys kept per process
+    API_KEY_CACHE_TTL: int = 300  # seconds before a cached key is re-verified
+    API_KEY_LAST_USED_FLUSH_SECONDS: int = 30
+    AUTH_CLAIMS_CACHE_SIZE: int = 10000  # verified access tokens kept per process
+    AUTH_CLAIMS_CACHE_TTL: int = 60  # seconds, capped by the token's exp
+    CIPHER_CACHE_SIZE: int = 1024  # per-organization Fernet ciphers kept per process
 
     # Password hashing
     BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2  # threads running bcrypt per process
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32  # waiting hashes before logins get 503
 
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = [
@@ -53,6 +73,7 @@ class Settings(BaseSettings):
     STORAGE_PATH: str = "/root/invoice-ocr-platform/storage/invoices"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".png", ".jpg", ".jpeg", ".tiff", ".heic"]
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # bytes read/hashed/written per step
 
     # S3/Spaces Configuration (if using cloud storage)
     S3_BUCKET: Optional[str] = None
@@ -62,21 +83,41 @@ class Settings(BaseSettings):
     S3_ENDPOINT: Optional[str] = None  # For DigitalOcean Spaces or MinIO
 
     # OCR Configuration
-    OCR_ENGINE: str = "paddleocr"  # paddleocr, easyocr, hybrid
+    OCR_ENGINE: str = "paddleocr"  # paddleocr, easyocr, tesseract, hybrid
     OCR_LANGUAGES: List[str] = ["en"]
     OCR_CONFIDENCE_THRESHOLD: float = 0.70
     OCR_USE_GPU: bool = False
     OCR_MAX_WORKERS: int = 2
+    OCR_HYBRID_ENGINES: List[str] = ["tesseract", "paddleocr"]  # hybrid cascade, cheapest first
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_MAX_ENTRIES: int = 200000  # rows kept in ocr_cache, least recently used evicted
+    OCR_CACHE_MEMORY_ENTRIES: int = 256  # per-process LRU in front of the table
+
+    # PDF text layer: born-digital pages are read directly instead of OCR'd
+    PDF_TEXT_LAYER_ENABLED: bool = True
+    PDF_TEXT_MIN_CHARS: int = 20  # fewer visible characters than this means a scanned page
+    OCR_PAGE_MEMORY_BUDGET_MB: int = 256  # decoded page images held at once per document
+    OCR_EARLY_EXIT: bool = True  # stop once header + total fields clear OCR_CONFIDENCE_THRESHOLD
 
     # Image preprocessing
     IMAGE_MAX_SIZE: int = 2048  # Max width/height
     IMAGE_DPI: int = 300
-    IMAGE_ENHANCE: bool = True
+    IMAGE_ENHANCE: bool = True  # denoise + contrast stretch
+    IMAGE_DESKEW: bool = True
+    IMAGE_BINARIZE: bool = False  # adaptive threshold; helps Tesseract, can hurt PaddleOCR
 
     # Email Configuration
     EMAIL_POLL_INTERVAL: int = 300  # 5 minutes
     EMAIL_BATCH_SIZE: int = 50
     EMAIL_MAX_RETRIES: int = 3
+    EMAIL_POLL_CONCURRENCY: int = 200  # mailboxes polled at once per process
+    EMAIL_MAX_CONNECTIONS_PER_HOST: int = 10  # open IMAP connections per server, in use or pooled
+    EMAIL_CONNECTION_IDLE_SECONDS: int = 300  # pooled connections unused this long are closed
+    EMAIL_IMAP_TIMEOUT: float = 30.0
+    EMAIL_IDLE_MAX_INTERVAL: int = 60  # mailboxes checked at least this often (seconds) use IMAP IDLE
+    EMAIL_IDLE_MAX_PER_HOST: int = 4  # connections per server held by IDLE watchers
+    EMAIL_IDLE_RENEW_SECONDS: int = 1500  # re-issue IDLE before servers drop it (RFC 2177: 29 minutes)
+    EMAIL_LAST_CHECK_FLUSH_SECONDS: float = 10.0  # email_last_check updates are batched this long
 
     # SMTP for sending notifications
     SMTP_HOST: Optional[str] = None
@@ -89,6 +130,15 @@ class Settings(BaseSettings):
     WHATSAPP_ENABLED: bool = True
     WHATSAPP_API_URL: str = "http://localhost:3001"
     WHATSAPP_POLL_INTERVAL: int = 120  # 2 minutes
+    WHATSAPP_API_KEY: Optional[str] = None  # X-Api-Key sent to WAHA
+    WHATSAPP_WEBHOOK_SECRET: Optional[str] = None  # WAHA webhook HMAC key; the webhook is off while unset
+    WHATSAPP_WEBHOOK_RATE_LIMIT: int = 1200  # per minute per address; WAHA posts every message event
+    WHATSAPP_WEBHOOK_MAX_BYTES: int = 256 * 1024  # event body read before the signature is checked
+    WHATSAPP_FALLBACK_POLL_INTERVAL: int = 900  # sweep for messages missed by webhooks, once they are on
+    WHATSAPP_HTTP_POOL_SIZE: int = 50  # connections to WAHA shared by polling and media downloads
+    WHATSAPP_HTTP_TIMEOUT: float = 30.0
+    WHATSAPP_POLL_CONCURRENCY: int = 20  # sessions polled at once
+    WHATSAPP_MESSAGES_LIMIT: int = 100  # messages read per chat per poll
 
     # Accounting Integrations
     QUICKBOOKS_CLIENT_ID: Optional[str] = None
@@ -99,11 +149,25 @@ class Settings(BaseSettings):
     XERO_CLIENT_ID: Optional[str] = None
     XERO_CLIENT_SECRET: Optional[str] = None
     XERO_REDIRECT_URI: str = "https://invoices-api.alexandratechlab.com/api/v1/integrations/xero/callback"
+    QUICKBOOKS_API_URL: Optional[str] = None  # defaults to the QUICKBOOKS_ENVIRONMENT endpoint
+    XERO_API_URL: str = "https://api.xero.com"
+
+    # Accounting export
+    EXPORT_PAGE_SIZE: int = 500  # approved invoices loaded per query during a run
+    EXPORT_MAX_RETRIES: int = 5  # attempts per batch on 429, 5xx and network errors
+    EXPORT_RETRY_BACKOFF: float = 2.0  # base seconds, doubled per attempt, when no Retry-After is given
+    EXPORT_HTTP_TIMEOUT: float = 60.0
 
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     RATE_LIMIT_PER_HOUR: int = 1000
     API_KEY_RATE_LIMIT: int = 100  # per hour for API keys
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "redis"  # redis (shared sliding window) or local (per-process buckets only)
+    RATE_LIMIT_SYNC_INTERVAL: float = 0.05  # seconds between pipelined Redis syncs of local counts
+    RATE_LIMIT_RETRY_SECONDS: float = 5.0  # local-only this long after a Redis failure
+    RATE_LIMIT_MAX_IDENTITIES: int = 100000  # callers tracked per process, least recent dropped
+    RATE_LIMIT_EXEMPT_PATHS: List[str] = ["/", "/health", "/docs", "/redoc", "/openapi.json"]
 
     # Categories (Default expense categories)
     DEFAULT_CATEGORIES: List[str] = [
@@ -137,6 +201,40 @@ class Settings(BaseSettings):
     ENABLE_DUPLICATE_DETECTION: bool = True
     ENABLE_AUTO_APPROVAL: bool = False
 
+    # Duplicate detection
+    DUPLICATE_AMOUNT_TOLERANCE: float = 1.0  # currency units
+    DUPLICATE_DATE_WINDOW_DAYS: int = 3
+    DUPLICATE_CONFIDENCE_THRESHOLD: float = 0.70
+
+    # Vendor normalization
+    VENDOR_FUZZY_THRESHOLD: float = 0.6  # trigram similarity for near-miss aliases
+    VENDOR_ALIAS_REFRESH_SECONDS: int = 60  # how often cached alias sets check for changes
+
+    # Categorization
+    CATEGORIZATION_MIN_CONFIDENCE: float = 0.3
+    CATEGORIZER_REFRESH_SECONDS: int = 60  # how often cached categorizers check for changes
+    CATEGORIZE_BATCH_LIMIT: int = 10000  # items per /ai/categorize call
+
+    # Invoice listing
+    INVOICE_PAGE_SIZE: int = 50
+    INVOICE_PAGE_SIZE_MAX: int = 200
+
+    # Bulk ingestion
+    INGEST_BATCH_LIMIT: int = 1000  # invoices per /invoices/bulk call
+    INGEST_METHOD: str = "copy"  # copy (COPY FROM STDIN) or insert (multi-row INSERT)
+
+    # Full-text search
+    SEARCH_LANGUAGE: str = "english"  # text search configuration for indexed fields and queries
+    SEARCH_MAX_TEXT_CHARS: int = 100000  # OCR text indexed per invoice (a tsvector holds at most 1 MB)
+    SEARCH_PAGE_SIZE_MAX: int = 100
+    SEARCH_MAX_OFFSET: int = 1000  # ranked results are for finding, not for paging through
+
+    # Expense forecasting
+    FORECAST_WINDOW_MONTHS: int = 3  # months averaged for the base forecast
+    FORECAST_HISTORY_MONTHS: int = 12  # months fitted for trend and confidence
+    FORECAST_TREND_THRESHOLD: float = 0.03  # fitted monthly change that counts as a trend
+    FORECAST_TREND_ADJUSTMENT: float = 0.10  # +/- applied to the average on a trend
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,208 @@
+"""
+Per-organization encryption of stored credentials.
+
+``Organization.encryption_key`` holds one or more Fernet keys separated by
+commas, newest first. Data is encrypted with the newest key and decrypted
+with whichever key matches, so rotating a key is: prepend a new key,
+re-encrypt (``rotate_organization_key``), then drop the old ones.
+
+Building a cipher parses and validates every key, so ciphers are cached
+per key string in a small registry; poll sweeps decrypt the credentials of
+all clients of an organization with one query and one cipher.
+"""
+from collections import OrderedDict
+from typing import Optional, Dict, List, Iterable, Tuple, Any
+import base64
+import logging
+import uuid
+
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_SEPARATOR = ","
+
+# Key inside Client.email_config / accounting_config / IntegrationConfig.config_data
+ENCRYPTED_FIELD = "encrypted_credentials"
+
+# Client JSON columns that carry encrypted credentials
+CLIENT_CREDENTIAL_COLUMNS = ("email_config", "accounting_config")
+
+
+class CipherRegistry:
+    """LRU cache of MultiFernet ciphers keyed by the organization key string."""
+
+    def __init__(self, max_entries: int = settings.CIPHER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._ciphers: "OrderedDict[str, MultiFernet]" = OrderedDict()
+
+    def cipher(self, encryption_key: str) -> MultiFernet:
+        cipher = self._ciphers.get(encryption_key)
+        if cipher is not None:
+            self._ciphers.move_to_end(encryption_key)
+            return cipher
+
+        keys = [k.strip() for k in encryption_key.split(KEY_SEPARATOR) if k.strip()]
+        if not keys:
+            raise ValueError("Empty encryption key")
+        cipher = MultiFernet([Fernet(k.encode()) for k in keys])
+        self._ciphers[encryption_key] = cipher
+        if len(self._ciphers) > self.max_entries:
+            self._ciphers.popitem(last=False)
+        return cipher
+
+    def encrypt(self, data: str, encryption_key: str) -> str:
+        token = self.cipher(encryption_key).encrypt(data.encode())
+        # Stored base64-wrapped, as encrypt_data always has
+        return base64.b64encode(token).decode()
+
+    def decrypt(self, encrypted_data: str, encryption_key: str) -> str:
+        try:
+            token = base64.b64decode(encrypted_data)
+            return self.cipher(encryption_key).decrypt(token).decode()
+        except (InvalidToken, ValueError, TypeError) as e:
+            raise ValueError(f"Decryption failed: {str(e) or type(e).__name__}")
+
+    def decrypt_many(self, items: Iterable[Tuple[Optional[str], str]]) -> List[Optional[str]]:
+        """Decrypt (encrypted_data, encryption_key) pairs; failures and empty values give None."""
+        results: List[Optional[str]] = []
+        for encrypted_data, encryption_key in items:
+            if not encrypted_data:
+                results.append(None)
+                continue
+            try:
+                results.append(self.decrypt(encrypted_data, encryption_key))
+            except ValueError as e:
+                logger.warning(f"Could not decrypt credentials: {e}")
+                results.append(None)
+        return results
+
+    def rotate(self, encrypted_data: str, encryption_key: str) -> str:
+        """Re-encrypt data under the newest key."""
+        token = base64.b64decode(encrypted_data)
+        return base64.b64encode(self.cipher(encryption_key).rotate(token)).decode()
+
+    def clear(self) -> None:
+        self._ciphers.clear()
+
+
+cipher_registry = CipherRegistry()
+
+
+def generate_key() -> str:
+    return Fernet.generate_key().decode()
+
+
+def primary_key(encryption_key: str) -> str:
+    return encryption_key.split(KEY_SEPARATOR)[0].strip()
+
+
+async def decrypt_client_credentials(
+    db: AsyncSession,
+    organization_id: uuid.UUID,
+    column: str = "email_config",
+    client_ids: Optional[Iterable[uuid.UUID]] = None,
+) -> Dict[uuid.UUID, Optional[str]]:
+    """
+    Decrypted ``encrypted_credentials`` of ``column`` for an organization's
+    active clients (or just ``client_ids``), in one query.
+    """
+    from app.models.client import Client
+    from app.models.organization import Organization
+
+    if column not in CLIENT_CREDENTIAL_COLUMNS:
+        raise ValueError(f"Unknown credential column: {column}")
+    config = getattr(Client, column)
+    query = (
+        select(Client.id, config, Organization.encryption_key)
+        .join(Organization, Organization.id == Client.organization_id)
+        .where(Client.organization_id == organization_id, Client.is_active.is_(True),
+               Client.deleted_at.is_(None))
+    )
+    if client_ids is not None:
+        query = query.where(Client.id.in_(list(client_ids)))
+    rows = (await db.execute(query)).all()
+
+    decrypted = cipher_registry.decrypt_many(
+        ((row[1] or {}).get(ENCRYPTED_FIELD), row[2]) for row in rows
+    )
+    return {row[0]: value for row, value in zip(rows, decrypted)}
+
+
+async def decrypt_integration_credentials(
+    db: AsyncSession,
+    organization_id: uuid.UUID,
+    integration_type: Optional[str] = None,
+) -> Dict[uuid.UUID, Optional[str]]:
+    """Decrypted credentials of an organization's active integrations, keyed by IntegrationConfig id."""
+    from app.models.client import Client
+    from app.models.integration_config import IntegrationConfig
+    from app.models.organization import Organization
+
+    query = (
+        select(IntegrationConfig.id, IntegrationConfig.config_data, Organization.encryption_key)
+        .join(Client, Client.id == IntegrationConfig.client_id)
+        .join(Organization, Organization.id == Client.organization_id)
+        .where(Client.organization_id == organization_id, IntegrationConfig.is_active.is_(True))
+    )
+    if integration_type is not None:
+        query = query.where(IntegrationConfig.integration_type == integration_type)
+    rows = (await db.execute(query)).all()
+
+    decrypted = cipher_registry.decrypt_many(
+        ((row[1] or {}).get(ENCRYPTED_FIELD), row[2]) for row in rows
+    )
+    return {row[0]: value for row, value in zip(rows, decrypted)}
+
+
+def _rotated(config: Optional[Dict[str, Any]], encryption_key: str) -> Optional[Dict[str, Any]]:
+    if not config or not config.get(ENCRYPTED_FIELD):
+        return None
+    # New dict so SQLAlchemy sees the JSON column change
+    return {**config, ENCRYPTED_FIELD: cipher_registry.rotate(config[ENCRYPTED_FIELD], encryption_key)}
+
+
+async def rotate_organization_key(db: AsyncSession, organization_id: uuid.UUID, drop_old: bool = True) -> int:
+    """
+    Give an organization a new primary key and re-encrypt its credentials.
+
+    Old keys stay usable for decryption until every value has been
+    re-encrypted; with ``drop_old`` they are removed in the same commit.
+    Returns the number of re-encrypted values.
+    """
+    from app.models.client import Client
+    from app.models.integration_config import IntegrationConfig
+    from app.models.organization import Organization
+
+    organization = await db.get(Organization, organization_id)
+    if organization is None:
+        raise LookupError(f"Organization {organization_id} not found")
+    new_key = generate_key()
+    keyring = KEY_SEPARATOR.join([new_key, organization.encryption_key])
+
+    rotated = 0
+    clients = (await db.execute(select(Client).where(Client.organization_id == organization_id))).scalars().all()
+    for client in clients:
+        for column in CLIENT_CREDENTIAL_COLUMNS:
+            config = _rotated(getattr(client, column), keyring)
+            if config is not None:
+                setattr(client, column, config)
+                rotated += 1
+
+    integrations = (await db.execute(
+        select(IntegrationConfig).where(IntegrationConfig.client_id.in_([c.id for c in clients]))
+    )).scalars().all()
+    for integration in integrations:
+        config = _rotated(integration.config_data, keyring)
+        if config is not None:
+            integration.config_data = config
+            rotated += 1
+
+    organization.encryption_key = new_key if drop_old else keyring
+    await db.commit()
+    logger.info(f"Rotated encryption key of organization {organization_id}: {rotated} values re-encrypted")
+    return rotated
@@ -0,0 +1,360 @@
+"""
+Request rate limiting for users, API keys and anonymous callers.
+
+Callers are identified from what is already cached per process: an API key
+verified earlier (``APIKey.rate_limit`` per hour), else the ``sub`` of a
+bearer token (RATE_LIMIT_PER_MINUTE and RATE_LIMIT_PER_HOUR), else the
+client address with the same limits. Unverified API keys and invalid
+tokens count against the client address. The WhatsApp webhook is called by
+WAHA, not by a user: it is limited per client address with its own, higher
+quota (WHATSAPP_WEBHOOK_RATE_LIMIT per minute), so message bursts get through
+while unsigned floods are still cut off before the handler reads the body.
+
+Every decision is made in process, without awaiting anything: each caller
+has a token bucket per window, and the request is also refused once the
+caller's shared usage, as last reported by Redis, reaches the limit. Local
+counts are pushed to Redis every RATE_LIMIT_SYNC_INTERVAL seconds in one
+pipeline of Lua calls (a sliding window over the current and previous
+fixed windows, per caller), which answers with the usage of every process.
+So a request never waits on Redis; processes together can overshoot a
+limit by at most what they admit within one sync interval.
+
+Without Redis (RATE_LIMIT_BACKEND=local, or while Redis is unreachable) the
+per-process buckets alone apply.
+
+Responses carry ``RateLimit-Limit``, ``RateLimit-Remaining`` and
+``RateLimit-Reset`` for the tightest window; refusals are 429 with
+``Retry-After``.
+"""
+from collections import OrderedDict
+from math import ceil
+from typing import Optional, Dict, List, Set, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import HTTPException
+
+from app.core.api_key_cache import get_api_key_cache
+from app.core.config import settings
+from app.core.security import claims_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "ratelimit"
+
+# (window seconds, requests allowed in the window), tightest first
+Policy = Tuple[Tuple[int, int], ...]
+
+# Adds the hits (ARGV[1]) reported by one process to the current window of
+# each (current, previous) key pair and returns, per window, the requests
+# left under the sliding estimate and the milliseconds until the window ends
+_SLIDING_WINDOW_SCRIPT = """
+local hits = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local out = {}
+for i = 1, #KEYS, 2 do
+    local n = (i + 1) / 2
+    local window = tonumber(ARGV[1 + 2 * n])
+    local limit = tonumber(ARGV[2 + 2 * n])
+    local current
+    if hits > 0 then
+        current = redis.call('INCRBY', KEYS[i], hits)
+        if current == hits then
+            redis.call('PEXPIRE', KEYS[i], window * 2)
+        end
+    else
+        current = tonumber(redis.call('GET', KEYS[i]) or '0')
+    end
+    local previous = tonumber(redis.call('GET', KEYS[i + 1]) or '0')
+    local elapsed = now % window
+    out[#out + 1] = limit - math.ceil(previous * (window - elapsed) / window + current)
+    out[#out + 1] = window - elapsed
+end
+return out
+"""
+
+_REFUSED_BODY = json.dumps({"detail": "Rate limit exceeded"}).encode()
+
+
+def user_policy() -> Policy:
+    return ((60, settings.RATE_LIMIT_PER_MINUTE), (3600, settings.RATE_LIMIT_PER_HOUR))
+
+
+def api_key_policy(rate_limit: Optional[int]) -> Policy:
+    return ((3600, rate_limit or settings.API_KEY_RATE_LIMIT),)
+
+
+def webhook_policy() -> Policy:
+    return ((60, settings.WHATSAPP_WEBHOOK_RATE_LIMIT),)
+
+
+WEBHOOK_PATHS = frozenset({f"{settings.API_V1_PREFIX}/webhooks/whatsapp"})
+
+
+class _Usage:
+    """One caller's buckets, shared usage and hits not yet reported."""
+
+    __slots__ = ("policy", "tokens", "updated", "pending", "shared", "shared_reset")
+
+    def __init__(self, policy: Policy, now: float):
+        self.policy = policy
+        self.tokens = [float(limit) for _, limit in policy]
+        self.updated = now
+        self.pending = 0
+        self.shared: List[Optional[int]] = [None] * len(policy)  # requests left across processes
+        self.shared_reset = [0.0] * len(policy)  # monotonic time the shared window ends
+
+
+class RateLimiter:
+    def __init__(self, backend: str = settings.RATE_LIMIT_BACKEND, redis_url: str = settings.REDIS_URL,
+                 sync_interval: float = settings.RATE_LIMIT_SYNC_INTERVAL,
+                 max_identities: int = settings.RATE_LIMIT_MAX_IDENTITIES):
+        self.backend = backend
+        self.redis_url = redis_url
+        self.sync_interval = sync_interval
+        self.max_identities = max_identities
+        self._usage: "OrderedDict[str, _Usage]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._redis = None
+        self._script_sha: Optional[str] = None
+        self._redis_down_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.allowed = 0
+        self.refused = 0
+        self.syncs = 0
+        self.sync_errors = 0
+
+    def hit(self, identity: str, policy: Policy) -> Tuple[bool, int, int, float]:
+        """Count one request: (allowed, limit, remaining, seconds until reset) of the tightest window."""
+        now = time.monotonic()
+        usage = self._usage.get(identity)
+        if usage is None or usage.policy != policy:
+            usage = self._usage[identity] = _Usage(policy, now)
+            if len(self._usage) > self.max_identities:
+                self._dirty.discard(self._usage.popitem(last=False)[0])
+        else:
+            self._usage.move_to_end(identity)
+
+        elapsed = now - usage.updated
+        usage.updated = now
+        allowed = True
+        shared_blocked = False
+        limit = remaining = reset = None
+        for i, (window, quota) in enumerate(policy):
+            rate = quota / window
+            tokens = min(float(quota), usage.tokens[i] + elapsed * rate)
+            usage.tokens[i] = tokens
+            left = tokens
+            # Until a token is back when refusing, until the bucket refills after this request otherwise
+            wait = (1 - tokens) / rate if tokens < 1 else (quota - tokens + 1) / rate
+            shared = usage.shared[i]
+            if shared is not None:
+                if now >= usage.shared_reset[i] + window:
+                    # Two windows later nothing reported is still counted
+                    usage.shared[i] = shared = None
+                elif shared - usage.pending < left:
+                    left = shared - usage.pending
+                    wait = max(usage.shared_reset[i] - now, 0.0)
+                    if left < 1:
+                        shared_blocked = True
+            if left < 1:
+                allowed = False
+            if remaining is None or left < remaining:
+                limit, remaining, reset = quota, left, wait
+
+        if allowed:
+            for i in range(len(policy)):
+                usage.tokens[i] -= 1
+            usage.pending += 1
+            remaining -= 1
+            self._dirty.add(identity)
+            self.allowed += 1
+        else:
+            if shared_blocked:
+                # Refresh the shared count at the next sync: it only shrinks as windows slide
+                self._dirty.add(identity)
+            self.refused += 1
+        return allowed, limit, max(int(remaining), 0), reset
+
+    # Redis synchronisation
+
+    def _connect(self):
+        if self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(self.redis_url)
+        return self._redis
+
+    async def sync(self) -> int:
+        """Report pending hits of every changed caller to Redis in one pipeline. Returns callers synced."""
+        if not self._dirty or self.backend != "redis" or time.monotonic() < self._redis_down_until:
+            if self._dirty:
+                # Local-only: nothing to report
+                for identity in self._dirty:
+                    usage = self._usage.get(identity)
+                    if usage is not None:
+                        usage.pending = 0
+                self._dirty.clear()
+            return 0
+
+        dirty, self._dirty = self._dirty, set()
+        batch = [(identity, usage, usage.pending) for identity, usage in
+                 ((identity, self._usage.get(identity)) for identity in dirty) if usage is not None]
+        now_ms = int(time.time() * 1000)
+        try:
+            results = await self._run(batch, now_ms)
+        except Exception as e:
+            self.sync_errors += 1
+            self._redis_down_until = time.monotonic() + settings.RATE_LIMIT_RETRY_SECONDS
+            for _, usage, hits in batch:
+                usage.pending -= hits
+                usage.shared = [None] * len(usage.policy)
+            logger.warning(f"Rate limit sync failed, limiting per process for "
+                           f"{settings.RATE_LIMIT_RETRY_SECONDS:.0f}s: {e}")
+            return 0
+
+        now = time.monotonic()
+        for (_, usage, hits), result in zip(batch, results):
+            usage.pending -= hits
+            usage.shared = [int(v) for v in result[0::2]]
+            usage.shared_reset = [now + int(ms) / 1000 for ms in result[1::2]]
+        self.syncs += 1
+        return len(batch)
+
+    async def _run(self, batch, now_ms: int) -> list:
+        from redis.exceptions import NoScriptError
+
+        client = self._connect()
+        for attempt in range(2):
+            if self._script_sha is None:
+                self._script_sha = await client.script_load(_SLIDING_WINDOW_SCRIPT)
+            async with client.pipeline(transaction=False) as pipe:
+                for identity, usage, hits in batch:
+                    keys, args = [], [hits, now_ms]
+                    for window, quota in usage.policy:
+                        window_ms = window * 1000
+                        index = now_ms // window_ms
+                        keys += [f"{KEY_PREFIX}:{{{identity}}}:{window}:{index}",
+                                 f"{KEY_PREFIX}:{{{identity}}}:{window}:{index - 1}"]
+                        args += [window_ms, quota]
+                    pipe.evalsha(self._script_sha, len(keys), *keys, *args)
+                try:
+                    return await pipe.execute()
+                except NoScriptError:
+                    # Redis restarted and lost the script; nothing was counted
+                    self._script_sha = None
+        raise RuntimeError("Rate limit script could not be loaded")
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.sync()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "callers": len(self._usage),
+            "allowed": self.allowed,
+            "refused": self.refused,
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors,
+        }
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def identify(scope) -> Tuple[str, Policy]:
+    """Caller identity and policy of an ASGI request, from per-process caches only."""
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if scope["path"] in WEBHOOK_PATHS:
+        return f"webhook:{address}", webhook_policy()
+
+    api_key = authorization = None
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            api_key = value
+        elif name == b"authorization":
+            authorization = value
+
+    if api_key:
+        cache = get_api_key_cache()
+        entry = cache.peek(cache.digest(api_key.decode("latin-1")))
+        if entry is not None:
+            return f"key:{entry.api_key_id}", api_key_policy(entry.rate_limit)
+    elif authorization and authorization[:7].lower() == b"bearer ":
+        try:
+            claims = claims_cache.get(authorization[7:].decode("latin-1"))
+        except HTTPException:
+            claims = None
+        if claims is not None and claims.payload.get("sub"):
+            return f"user:{claims.payload['sub']}", user_policy()
+
+    return f"ip:{address}", user_policy()
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying the process's RateLimiter to HTTP requests."""
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None,
+                 exempt_paths: List[str] = settings.RATE_LIMIT_EXEMPT_PATHS):
+        self.app = app
+        self.limiter = limiter
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED or scope["method"] == "OPTIONS" \
+                or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        identity, policy = identify(scope)
+        allowed, limit, remaining, reset = (self.limiter or get_rate_limiter()).hit(identity, policy)
+        headers = [
+            (b"ratelimit-limit", str(limit).encode()),
+            (b"ratelimit-remaining", str(remaining).encode()),
+            (b"ratelimit-reset", str(ceil(reset)).encode()),
+        ]
+        if not allowed:
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_REFUSED_BODY)).encode()),
+                    (b"retry-after", str(max(ceil(reset), 1)).encode()),
+                    *headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": _REFUSED_BODY})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,20 +1,33 @@
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, FrozenSet
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, Security, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from sqlalchemy.ext.asyncio import AsyncSession
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
 import secrets
+import time
 import bcrypt
 
 from app.core.config import settings
+from app.core.database import get_db
+from app.core.encryption import cipher_registry, generate_key
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; hashes with another cost fall outside min/max rounds, report
+# needs_update and are replaced on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS, bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 
 # Security scheme
 security = HTTPBearer()
+api_key_header = APIKeyHeader(name="X-API-Key")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -27,6 +40,70 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, bounded thread pool.
+
+    bcrypt holds a CPU for tens to hundreds of milliseconds; called inside
+    an async endpoint it stalls every other request on the worker. Work
+    beyond ``PASSWORD_HASH_WORKERS`` running plus ``PASSWORD_HASH_QUEUE_LIMIT``
+    waiting is refused with 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int = settings.PASSWORD_HASH_WORKERS,
+                 queue_limit: int = settings.PASSWORD_HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.capacity = workers + queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service busy, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        if self._executor is None:
+            # Created on first use, and again after a shutdown (app restarted in the same process)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password without blocking the event loop."""
+    return await password_hasher.run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    """get_password_hash without blocking the event loop."""
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def averify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Verify a password off the event loop.
+
+    Returns (valid, new_hash); new_hash is set when the stored hash uses a
+    cost other than BCRYPT_ROUNDS and should be saved in its place.
+    """
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token."""
     to_encode = data.copy()
@@ -58,6 +135,13 @@ def decode_token(token: str) -> Dict[str, Any]:
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
 
 
+API_KEY_PREFIX_LENGTH = 12  # "inv_" + 8 characters, stored as APIKey.key_prefix
+
+
+def api_key_prefix(plain_key: str) -> str:
+    return plain_key[:API_KEY_PREFIX_LENGTH]
+
+
 def generate_api_key() -> tuple[str, str]:
     """
     Generate a new API key.
@@ -78,32 +162,95 @@ def verify_api_key(plain_key: str, hashed_key: str) -> bool:
 
 def generate_encryption_key() -> str:
     """Generate encryption key for sensitive data (credentials, etc)."""
-    from cryptography.fernet import Fernet
-    return Fernet.generate_key().decode()
+    return generate_key()
 
 
 def encrypt_data(data: str, encryption_key: str) -> str:
-    """Encrypt sensitive data."""
-    from cryptography.fernet import Fernet
-    import base64
-
-    fernet = Fernet(encryption_key.encode())
-    encrypted = fernet.encrypt(data.encode())
-    return base64.b64encode(encrypted).decode()
+    """Encrypt sensitive data with the organization's newest key."""
+    return cipher_registry.encrypt(data, encryption_key)
 
 
 def decrypt_data(encrypted_data: str, encryption_key: str) -> str:
-    """Decrypt sensitive data."""
-    from cryptography.fernet import Fernet
-    import base64
+    """Decrypt sensitive data with any of the organization's keys."""
+    return cipher_registry.decrypt(encrypted_data, encryption_key)
+
+
+# Roles that satisfy a required role; super_admin passes every role check
+ROLE_IMPLIES: Dict[str, FrozenSet[str]] = {
+    "super_admin": frozenset({"super_admin", "admin", "client"}),
+}
+
+
+@dataclass
+class VerifiedClaims:
+    """A decoded access token with its authorization data pre-resolved."""
+    payload: Dict[str, Any]
+    roles: FrozenSet[str]
+    permissions: FrozenSet[str]
+    all_permissions: bool
+    expires_at: float  # time.time()
 
-    try:
-        fernet = Fernet(encryption_key.encode())
-        encrypted_bytes = base64.b64decode(encrypted_data)
-        decrypted = fernet.decrypt(encrypted_bytes)
-        return decrypted.decode()
-    except Exception as e:
-        raise ValueError(f"Decryption failed: {str(e)}")
+
+class ClaimsCache:
+    """
+    Bounded cache of verified access-token claims, keyed by token digest.
+
+    Dashboards send many requests per page with the same token; each is
+    then a dictionary lookup instead of an HMAC check and JSON decode.
+    Entries never outlive the token's ``exp``.
+    """
+
+    def __init__(self, max_entries: int = settings.AUTH_CLAIMS_CACHE_SIZE,
+                 ttl: int = settings.AUTH_CLAIMS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, VerifiedClaims]" = OrderedDict()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token: str) -> VerifiedClaims:
+        """Verified claims of an access token; raises 401 if it is invalid."""
+        key = self.digest(token)
+        claims = self._entries.get(key)
+        if claims is not None:
+            if claims.expires_at > time.time():
+                return claims
+            del self._entries[key]
+
+        claims = self._verify(token)
+        self._entries[key] = claims
+        if len(self._entries) > self.max_entries:
+            # Oldest insertion first; hot tokens come straight back
+            self._entries.popitem(last=False)
+        return claims
+
+    def _verify(self, token: str) -> VerifiedClaims:
+        # python-jose validates the signature and exp
+        payload = decode_token(token)
+        if payload.get("type") != "access":
+            raise HTTPException(status_code=401, detail="Invalid token type")
+
+        role = payload.get("role")
+        roles = ROLE_IMPLIES.get(role, frozenset({role}) if role else frozenset())
+        exp = payload.get("exp")
+        expires_at = time.time() + self.ttl
+        if exp:
+            expires_at = min(expires_at, float(exp))
+        return VerifiedClaims(
+            payload=payload,
+            roles=roles,
+            permissions=frozenset(payload.get("permissions") or ()),
+            all_permissions=role == "super_admin",
+            expires_at=expires_at,
+        )
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+claims_cache = ClaimsCache()
 
 
 class AuthChecker:
@@ -118,39 +265,56 @@ class AuthChecker:
         credentials: HTTPAuthorizationCredentials = Security(security)
     ) -> Dict[str, Any]:
         """Verify token and check permissions."""
-        token = credentials.credentials
+        claims = claims_cache.get(credentials.credentials)
 
-        try:
-            payload = decode_token(token)
+        if self.required_role and self.required_role not in claims.roles:
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
 
-            # Check token type
-            if payload.get("type") != "access":
-                raise HTTPException(status_code=401, detail="Invalid token type")
+        if self.required_permission and not claims.all_permissions \
+                and self.required_permission not in claims.permissions:
+            raise HTTPException(status_code=403, detail=f"Missing permission: {self.required_permission}")
 
-            # Check expiration
-            exp = payload.get("exp")
-            if exp and datetime.fromtimestamp(exp) < datetime.utcnow():
-                raise HTTPException(status_code=401, detail="Token expired")
-
-            # Check role if required
-            if self.required_role:
-                user_role = payload.get("role")
-                if user_role != self.required_role and user_role != "super_admin":
-                    raise HTTPException(status_code=403, detail="Insufficient permissions")
-
-            # Check permission if required
-            if self.required_permission:
-                permissions = payload.get("permissions", [])
-                if self.required_permission not in permissions and payload.get("role") != "super_admin":
-                    raise HTTPException(status_code=403, detail=f"Missing permission: {self.required_permission}")
-
-            return payload
-
-        except JWTError as e:
-            raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+        # A copy: the cached payload is shared by every request with this token
+        return dict(claims.payload)
 
 
 # Convenience dependencies
 get_current_user = AuthChecker()
 require_admin = AuthChecker(required_role="admin")
 require_client = AuthChecker(required_role="client")
+
+
+class APIKeyChecker:
+    """Dependency for third-party requests authenticated with an X-API-Key header."""
+
+    def __init__(self, required_scope: Optional[str] = None):
+        self.required_scope = required_scope
+
+    async def __call__(
+        self,
+        api_key: str = Security(api_key_header),
+        db: AsyncSession = Depends(get_db),
+    ) -> Dict[str, Any]:
+        """Verify the key (cached after the first bcrypt check) and its scope."""
+        from app.core.api_key_cache import authenticate_api_key
+
+        key = await authenticate_api_key(db, api_key)
+        if key is None:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        if self.required_scope and self.required_scope not in key.scopes:
+            raise HTTPException(status_code=403, detail=f"Missing scope: {self.required_scope}")
+
+        # Same shape as a decoded access token, so endpoints accept either
+        return {
+            "sub": str(key.user_id),
+            "type": "api_key",
+            "role": "client" if key.client_id else "api_key",
+            "organization_id": str(key.organization_id),
+            "client_id": str(key.client_id) if key.client_id else None,
+            "api_key_id": str(key.api_key_id),
+            "scopes": sorted(key.scopes),
+            "rate_limit": key.rate_limit,
+        }
+
+
+get_api_key_user = APIKeyChecker()
@@ -6,9 +6,14 @@ from contextlib import asynccontextmanager
 import time
 import logging
 
+from app.core.api_key_cache import get_api_key_cache
+from app.core.cache import close_cache
 from app.core.config import settings
 from app.core.database import engine
+from app.core.rate_limit import RateLimitMiddleware, get_rate_limiter
+from app.core.security import password_hasher
 from app.models.base import Base
+from app.services.ocr_engine import shutdown_ocr_engine
 
 # Configure logging
 logging.basicConfig(
@@ -32,10 +37,19 @@ async def lifespan(app: FastAPI):
     # async with engine.begin() as conn:
     #     await conn.run_sync(Base.metadata.create_all)
 
+    api_key_cache = get_api_key_cache()
+    await api_key_cache.start()
+    await get_rate_limiter().start()
+
     yield
 
     # Shutdown
     logger.info(f"Shutting down {settings.APP_NAME}")
+    await api_key_cache.stop()
+    await get_rate_limiter().stop()
+    password_hasher.shutdown()
+    await close_cache()
+    await shutdown_ocr_engine()
     await engine.dispose()
 
 
@@ -49,6 +63,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Rate limiting; added before CORS so that refusals carry CORS headers too
+app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -128,6 +145,14 @@ async def root():
 # app.include_router(reports.router, prefix=f"{settings.API_V1_PREFIX}/reports", tags=["Reports"])
 # app.include_router(webhooks.router, prefix=f"{settings.API_V1_PREFIX}/webhooks", tags=["Webhooks"])
 
+from app.api.v1 import ai, dashboard, invoices, processing, webhooks
+
+app.include_router(invoices.router, prefix=f"{settings.API_V1_PREFIX}/invoices", tags=["Invoices"])
+app.include_router(processing.router, prefix=f"{settings.API_V1_PREFIX}/processing", tags=["Processing"])
+app.include_router(ai.router, prefix=f"{settings.API_V1_PREFIX}/ai", tags=["AI"])
+app.include_router(dashboard.router, prefix=f"{settings.API_V1_PREFIX}/dashboard", tags=["Dashboard"])
+app.include_router(webhooks.router, prefix=f"{settings.API_V1_PREFIX}/webhooks", tags=["Webhooks"])
+
 
 if __name__ == "__main__":
     import uvicorn
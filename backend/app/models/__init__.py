@@ -8,6 +8,11 @@ from app.models.api_key import APIKey
 from app.models.integration_config import IntegrationConfig
 from app.models.processing_queue import ProcessingQueue
 from app.models.audit_log import AuditLog
+from app.models.ocr_cache import OCRCacheEntry
+from app.models.duplicate_key import InvoiceDuplicateKey
+from app.models.vendor_alias import VendorAlias
+from app.models.invoice_rollup import InvoiceRollup
+from app.models.expense_forecast import ExpenseForecast
 
 __all__ = [
     "Base",
@@ -21,4 +26,9 @@ __all__ = [
     "IntegrationConfig",
     "ProcessingQueue",
     "AuditLog",
+    "OCRCacheEntry",
+    "InvoiceDuplicateKey",
+    "VendorAlias",
+    "InvoiceRollup",
+    "ExpenseForecast",
 ]
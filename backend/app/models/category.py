@@ -19,6 +19,6 @@ class Category(Base, UUIDMixin, TimestampMixin):
     is_active = Column(Boolean, default=True, nullable=False)
 
     organization = relationship("Organization", back_populates="categories")
-    parent = relationship("Category", remote_side=[id], foreign_keys=[parent_id])
+    parent = relationship("Category", remote_side="Category.id", foreign_keys=[parent_id])
 
     __table_args__ = (Index("idx_categories_org_type", "organization_id", "type"),)
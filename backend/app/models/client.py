@@ -83,6 +83,7 @@ class Client(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
     __table_args__ = (
         Index("idx_clients_org_active", "organization_id", "is_active"),
         Index("idx_clients_email", "email"),
+        Index("idx_clients_whatsapp_session", "whatsapp_session_id"),  # webhook events name the session
     )
 
     def __repr__(self):
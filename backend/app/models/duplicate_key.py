@@ -0,0 +1,22 @@
+from sqlalchemy import Column, BigInteger, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.models.base import Base
+
+
+class InvoiceDuplicateKey(Base):
+    """
+    Blocking keys for duplicate detection.
+
+    One row per (invoice, key); a new invoice is only compared against
+    invoices sharing one of its keys. Kept narrow on purpose (no surrogate
+    id or timestamps) since it holds several rows per invoice.
+    """
+    __tablename__ = "invoice_duplicate_keys"
+
+    invoice_id = Column(UUID(as_uuid=True), ForeignKey("invoices.id", ondelete="CASCADE"), primary_key=True)
+    block_key = Column(BigInteger, primary_key=True)  # 64-bit hash, see services/duplicates.py
+    client_id = Column(UUID(as_uuid=True), ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+
+    __table_args__ = (
+        Index("idx_duplicate_keys_lookup", "client_id", "block_key"),
+    )
@@ -0,0 +1,30 @@
+from datetime import datetime
+from sqlalchemy import Column, String, Date, DateTime, Integer, Float, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.models.base import Base
+
+
+class ExpenseForecast(Base):
+    """
+    Next-month expense forecast per client, overall (category "*") and per
+    category. Written by the nightly run in services/forecasting.py; one row
+    per forecast month is kept so forecasts can be checked against actuals.
+    """
+    __tablename__ = "expense_forecasts"
+
+    client_id = Column(UUID(as_uuid=True), ForeignKey("clients.id", ondelete="CASCADE"), primary_key=True)
+    forecast_month = Column(Date, primary_key=True)
+    category = Column(String(100), primary_key=True)
+    organization_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id"), nullable=False)
+
+    forecast_amount = Column(Float, nullable=False)
+    average_amount = Column(Float, nullable=False)  # mean of the last FORECAST_WINDOW_MONTHS
+    trend = Column(String(20), nullable=False)  # increasing, decreasing, stable
+    trend_pct = Column(Float, nullable=False)  # fitted monthly change relative to the mean
+    confidence = Column(Float, nullable=False)
+    history_months = Column(Integer, nullable=False)  # months with spend in the history window
+    generated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("idx_expense_forecasts_org_month", "organization_id", "forecast_month"),
+    )
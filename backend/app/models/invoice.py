@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, Boolean, ForeignKey, JSON, ARRAY, Float, Integer, Date, Text, Index
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Boolean, ForeignKey, JSON, ARRAY, Float, Integer, Date, Text, Index, cast, func
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from app.models.base import Base, UUIDMixin, TimestampMixin, SoftDeleteMixin
 
 
@@ -50,7 +50,7 @@ class Invoice(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
 
     # OCR Data
     ocr_confidence = Column(Float, index=True)
-    ocr_engine_used = Column(String(50))  # paddleocr, easyocr, hybrid
+    ocr_engine_used = Column(String(50))  # paddleocr, easyocr, tesseract, hybrid, text_layer[+engine]
     ocr_raw_text = Column(Text)
     ocr_structured_data = Column(JSON, default={})
     # Stores all extracted fields with confidence scores:
@@ -60,6 +60,10 @@ class Invoice(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
     #   ...
     # }
 
+    # Weighted document over vendor, number, line items, notes and OCR text;
+    # maintained on flush by services/search.py, never loaded by default
+    search_vector = deferred(Column(TSVECTOR))
+
     needs_review = Column(Boolean, default=False, nullable=False, index=True)
     review_reason = Column(String(255))  # Low confidence, missing fields, etc.
 
@@ -68,6 +72,7 @@ class Invoice(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
     original_file_name = Column(String(255))
     file_type = Column(String(50))  # pdf, image/png, etc.
     file_size = Column(Integer)  # in bytes
+    file_hash = Column(String(64), index=True)  # SHA-256 of the original file
     storage_url = Column(String(500))  # S3/cloud storage URL
     thumbnail_url = Column(String(500))  # Thumbnail preview
 
@@ -106,7 +111,7 @@ class Invoice(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
     line_items = relationship("InvoiceLineItem", back_populates="invoice", cascade="all, delete-orphan")
     reviewer = relationship("User", foreign_keys=[reviewed_by])
     approver = relationship("User", foreign_keys=[approved_by])
-    duplicate_parent = relationship("Invoice", remote_side=[id], foreign_keys=[duplicate_of])
+    duplicate_parent = relationship("Invoice", remote_side="Invoice.id", foreign_keys=[duplicate_of])
 
     # Indexes for common queries
     __table_args__ = (
@@ -117,7 +122,8 @@ class Invoice(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
         Index("idx_invoices_source", "source"),
         Index("idx_invoices_needs_review", "needs_review"),
         Index("idx_invoice_number", "invoice_number"),
-        # Full-text search index (PostgreSQL specific)
+        Index("idx_invoices_search_vector", "search_vector", postgresql_using="gin"),
+        # Trigram index for fuzzy vendor/number lookups (PostgreSQL specific)
         Index(
             "idx_invoices_search",
             "vendor_name",
@@ -136,6 +142,25 @@ class Invoice(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
         return f"<Invoice(id={self.id}, invoice_number='{self.invoice_number}', total={self.total_amount})>"
 
 
+# Sort key of invoice listings: invoice date, or upload date while OCR hasn't
+# produced one. Listings page on (listing_date, id); the indexes below match
+# the common filters so every page is one index range scan.
+invoice_listing_date = func.coalesce(Invoice.invoice_date, cast(Invoice.created_at, Date))
+
+_live = Invoice.deleted_at.is_(None)
+for _name, _columns, _where in (
+    ("idx_invoices_list_client", (Invoice.client_id,), _live),
+    ("idx_invoices_list_client_status", (Invoice.client_id, Invoice.status), _live),
+    ("idx_invoices_list_client_source", (Invoice.client_id, Invoice.source), _live),
+    ("idx_invoices_list_client_category", (Invoice.client_id, Invoice.category), _live),
+    ("idx_invoices_list_client_review", (Invoice.client_id,), _live & Invoice.needs_review.is_(True)),
+    ("idx_invoices_list_org", (Invoice.organization_id,), _live),
+    ("idx_invoices_list_org_status", (Invoice.organization_id, Invoice.status), _live),
+    ("idx_invoices_list_org_review", (Invoice.organization_id,), _live & Invoice.needs_review.is_(True)),
+):
+    Index(_name, *_columns, invoice_listing_date, Invoice.id, postgresql_where=_where)
+
+
 class InvoiceLineItem(Base, UUIDMixin, TimestampMixin):
     """
     Invoice line items - Individual items/services on an invoice.
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, Date, Integer, Float, Boolean, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.models.base import Base
+
+
+class InvoiceRollup(Base):
+    """
+    Invoice aggregates per client x month x category x status x expense/income.
+
+    Maintained in the same transaction as invoice writes (see
+    services/rollups.py), so stats read a few rows per month instead of
+    scanning every invoice. Undated invoices use month 1900-01-01 and
+    uncategorized ones category "" so every key column is NOT NULL.
+    """
+    __tablename__ = "invoice_rollups"
+
+    client_id = Column(UUID(as_uuid=True), ForeignKey("clients.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    category = Column(String(100), primary_key=True, default="")
+    status = Column(String(50), primary_key=True)
+    is_expense = Column(Boolean, primary_key=True, default=True)
+    organization_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id"), nullable=False)
+
+    invoice_count = Column(Integer, default=0, nullable=False)
+    total_amount = Column(Float, default=0.0, nullable=False)
+    needs_review_count = Column(Integer, default=0, nullable=False)
+    duplicate_count = Column(Integer, default=0, nullable=False)
+    duplicate_amount = Column(Float, default=0.0, nullable=False)  # part of total_amount from duplicates
+
+    __table_args__ = (
+        Index("idx_invoice_rollups_org_month", "organization_id", "month"),
+    )
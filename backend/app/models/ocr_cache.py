@@ -0,0 +1,23 @@
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, Float, JSON, Text, DateTime, Index
+from app.models.base import Base, UUIDMixin, TimestampMixin
+
+
+class OCRCacheEntry(Base, UUIDMixin, TimestampMixin):
+    """OCR output keyed by file content hash and OCR configuration version."""
+    __tablename__ = "ocr_cache"
+
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of the original file
+    config_version = Column(String(16), nullable=False)  # see ocr_cache.config_version()
+    ocr_engine_used = Column(String(50))
+    ocr_raw_text = Column(Text)
+    ocr_structured_data = Column(JSON, default={})
+    ocr_confidence = Column(Float)
+    page_count = Column(Integer, default=1)
+    size_bytes = Column(Integer, default=0, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    last_used_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("idx_ocr_cache_key", "content_hash", "config_version", unique=True),
+    )
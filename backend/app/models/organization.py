@@ -35,7 +35,8 @@ class Organization(Base, UUIDMixin, TimestampMixin, SoftDeleteMixin):
     #   "email_notifications": true
     # }
 
-    # Encryption key for this organization (for storing sensitive data)
+    # Encryption key for this organization (for storing sensitive data).
+    # Comma-separated Fernet keys, newest first, while a rotation is in progress
     encryption_key = Column(String(255), nullable=False)
 
     # Status
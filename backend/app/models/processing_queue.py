@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, JSON, Text, Index
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, ForeignKey, JSON, Text, DateTime, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from app.models.base import Base, UUIDMixin, TimestampMixin
 
@@ -20,7 +21,19 @@ class ProcessingQueue(Base, UUIDMixin, TimestampMixin):
     started_at = Column(String(50))
     completed_at = Column(String(50))
 
+    # Worker lease (see app/workers/queue.py)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # not claimable before this (retry backoff)
+    locked_by = Column(String(100))  # worker id holding the lease
+    lease_expires_at = Column(DateTime)  # reclaimed by the reaper once this passes
+
     __table_args__ = (
         Index("idx_queue_status_priority", "status", "priority", "created_at"),
         Index("idx_queue_client_status", "client_id", "status"),
+        Index("idx_queue_lease", "status", "lease_expires_at"),
+        # A WhatsApp message is queued once, whether a webhook or the poller sees it first
+        Index("uq_queue_whatsapp_message", "client_id", "source_reference", unique=True,
+              postgresql_where=text("task_type = 'whatsapp_media'")),
+        # One export run per integration queued or running: provider rate limits are per account
+        Index("uq_queue_export_integration", "source_reference", unique=True,
+              postgresql_where=text("task_type = 'export' AND status IN ('pending', 'processing')")),
     )
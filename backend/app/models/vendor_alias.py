@@ -0,0 +1,24 @@
+from sqlalchemy import Column, String, Boolean, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.models.base import Base, UUIDMixin, TimestampMixin
+
+
+class VendorAlias(Base, UUIDMixin, TimestampMixin):
+    """
+    Alias -> canonical vendor name (e.g. "MSFT" -> "Microsoft Corporation").
+
+    Rows without an organization are global; organization rows take
+    precedence for that organization. Caches pick up edits, deactivation
+    and deletion by comparing each row's updated_at with the one they applied.
+    """
+    __tablename__ = "vendor_aliases"
+
+    organization_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id"), nullable=True, index=True)
+    alias = Column(String(255), nullable=False)
+    canonical_name = Column(String(255), nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+
+    __table_args__ = (
+        Index("idx_vendor_aliases_org_alias", "organization_id", "alias", unique=True),
+        Index("idx_vendor_aliases_updated", "updated_at"),
+    )
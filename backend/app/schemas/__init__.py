@@ -0,0 +1 @@
+# Pydantic request/response schemas
@@ -0,0 +1,44 @@
+from datetime import date
+from typing import Optional, List
+from uuid import UUID
+from pydantic import BaseModel
+
+
+class CategorizeItem(BaseModel):
+    vendor_name: Optional[str] = None
+    description: Optional[str] = None
+    amount: Optional[float] = None
+
+
+class CategorizeRequest(BaseModel):
+    items: List[CategorizeItem]
+
+
+class CategorizeResult(BaseModel):
+    category_id: Optional[UUID] = None
+    category: Optional[str] = None
+    account_code: Optional[str] = None
+    confidence: float = 0.0
+    matched: List[str] = []
+
+
+class CategorizeResponse(BaseModel):
+    results: List[CategorizeResult]
+    categorized: int
+
+
+class ForecastResult(BaseModel):
+    category: str
+    forecast_amount: float
+    average_amount: float
+    trend: str
+    trend_pct: float
+    confidence: float
+    history_months: int
+
+
+class ForecastResponse(BaseModel):
+    client_id: UUID
+    forecast_month: Optional[date] = None
+    total: Optional[ForecastResult] = None
+    categories: List[ForecastResult] = []
@@ -0,0 +1,108 @@
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class InvoiceUploadResponse(BaseModel):
+    id: UUID
+    client_id: UUID
+    status: str
+    original_file_name: str
+    file_type: str
+    file_size: int
+    file_hash: str
+    queue_id: Optional[UUID] = None
+
+
+class InvoiceListItem(BaseModel):
+    id: UUID
+    client_id: UUID
+    invoice_number: Optional[str] = None
+    invoice_date: Optional[date] = None
+    due_date: Optional[date] = None
+    vendor_name: Optional[str] = None
+    total_amount: float
+    currency: Optional[str] = None
+    category: Optional[str] = None
+    status: str
+    needs_review: bool
+    is_duplicate: bool
+    source: str
+    original_file_name: Optional[str] = None
+    created_at: datetime
+
+
+class InvoiceListResponse(BaseModel):
+    items: List[InvoiceListItem]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_is_estimate: bool = False
+
+
+class InvoiceSearchHit(InvoiceListItem):
+    rank: float
+    headline: Optional[str] = None
+
+
+class InvoiceSearchResponse(BaseModel):
+    query: str
+    items: List[InvoiceSearchHit]
+
+
+class InvoiceIngestLineItem(BaseModel):
+    description: str = Field(..., min_length=1)
+    quantity: float = 1.0
+    unit: Optional[str] = Field(None, max_length=50)
+    unit_price: float
+    total_price: Optional[float] = None  # quantity * unit_price when left out
+    tax_rate: float = 0.0
+    tax_amount: float = 0.0
+    category: Optional[str] = Field(None, max_length=100)
+    account_code: Optional[str] = Field(None, max_length=50)
+
+
+class InvoiceIngestItem(BaseModel):
+    """One parsed invoice; lengths mirror the invoices columns so rows never fail on insert."""
+    client_id: Optional[UUID] = None
+    invoice_number: Optional[str] = Field(None, max_length=100)
+    invoice_date: Optional[date] = None
+    due_date: Optional[date] = None
+    po_number: Optional[str] = Field(None, max_length=100)
+    vendor_name: Optional[str] = Field(None, max_length=255)
+    vendor_tax_id: Optional[str] = Field(None, max_length=100)
+    vendor_email: Optional[str] = Field(None, max_length=255)
+    subtotal: Optional[float] = None
+    tax_amount: Optional[float] = None
+    total_amount: float
+    currency: str = Field("USD", min_length=3, max_length=3)
+    category: Optional[str] = Field(None, max_length=100)
+    is_expense: bool = True
+    notes: Optional[str] = None
+    source: str = Field("api", max_length=50)
+    source_reference: Optional[str] = Field(None, max_length=255)
+    source_sender: Optional[str] = Field(None, max_length=255)
+    ocr_raw_text: Optional[str] = None
+    ocr_confidence: Optional[float] = Field(None, ge=0, le=1)
+    needs_review: bool = False
+    line_items: List[InvoiceIngestLineItem] = []
+
+
+class InvoiceIngestRequest(BaseModel):
+    # Validated one by one so a bad invoice fails alone instead of the batch
+    items: List[Dict[str, Any]]
+
+
+class InvoiceIngestResult(BaseModel):
+    index: int
+    id: Optional[UUID] = None
+    error: Optional[str] = None
+    duplicate_of: Optional[UUID] = None
+    line_items: int = 0
+
+
+class InvoiceIngestResponse(BaseModel):
+    inserted: int
+    failed: int
+    line_items: int
+    results: List[InvoiceIngestResult]
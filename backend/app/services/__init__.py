@@ -0,0 +1,5 @@
+# Business logic services
+
+# Session listeners keeping derived invoice data (rollups, search vectors) in
+# the writing transaction; registered for every process that uses services
+from app.services import rollups, search  # noqa: F401
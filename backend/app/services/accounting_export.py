@@ -0,0 +1,762 @@
+"""
+Export of approved invoices to accounting systems (QuickBooks Online, Xero
+or a custom HTTP API).
+
+An export run (``export`` queue job, one per IntegrationConfig) pushes the
+client's approved invoices that have no ``accounting_id`` yet:
+
+* through the provider's batch endpoint where there is one (QuickBooks
+  ``/batch``: 30 bills per call; Xero ``/Invoices``: 50 per call),
+* with no more calls in flight and per minute than the provider allows for
+  one company/tenant (``RateLimiter``, shared by every run against that
+  account in the process). A 429 pauses the account for its Retry-After;
+  429s, 5xx and network errors are retried with backoff,
+* recording each batch as soon as it is answered, so a run that stops part
+  way resumes where it stopped: exported invoices carry an
+  ``accounting_id`` and are never sent again.
+
+Before a batch is sent its invoices are marked with a new, random
+idempotency key (in ``export_error``). When the answer never arrives (the
+process died, retries ran out) the next run finds them marked and re-sends
+the same batch under the same key, which the provider answers from its
+idempotency cache instead of creating the documents twice.
+
+Only one export of an integration is queued or running at a time (unique
+index on the job).
+
+    python -m app.services.accounting_export <integration_id>
+"""
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple, Any
+import argparse
+import asyncio
+import json
+import logging
+import random
+import uuid
+
+import aiohttp
+from sqlalchemy import select, update, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from app.core.cache import get_cache, invoice_tags
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.encryption import ENCRYPTED_FIELD, cipher_registry
+from app.models.client import Client
+from app.models.integration_config import IntegrationConfig
+from app.models.invoice import Invoice
+from app.models.organization import Organization
+from app.models.processing_queue import ProcessingQueue
+from app.workers.runner import register
+
+logger = logging.getLogger(__name__)
+
+TASK_TYPE = "export"
+
+# export_error of invoices sent in a batch whose answer was not recorded yet
+UNCONFIRMED_PREFIX = "Export unconfirmed, batch "
+
+
+class ExportFailed(Exception):
+    """The integration cannot export at all (credentials, configuration)."""
+
+
+class ExportIncomplete(Exception):
+    """Some batches got no answer; retrying the job resends them."""
+
+
+class _Undelivered(Exception):
+    pass
+
+
+@dataclass
+class ExportOutcome:
+    invoice_id: uuid.UUID
+    accounting_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ExportTarget:
+    integration_id: uuid.UUID
+    client_id: uuid.UUID
+    organization_id: uuid.UUID
+    integration_type: str
+    options: Dict[str, Any]
+    credentials: Dict[str, Any]
+
+
+@dataclass
+class ExportSummary:
+    exported: int = 0
+    failed: int = 0
+    undelivered: int = 0
+    requests: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def new_batch_key() -> str:
+    """
+    Idempotency key of one send. Fresh every time: invoices resent after a
+    rejection was fixed must not get the provider's cached rejection back.
+    Only an unconfirmed batch is resent under its key (kept in export_error).
+    """
+    return uuid.uuid4().hex
+
+
+def _money(value: Optional[float]) -> float:
+    return round(value or 0.0, 2)
+
+
+class RateLimiter:
+    """
+    One account's limits: at most ``concurrency`` calls in flight and
+    ``per_minute`` call starts in any minute (a token bucket holding
+    ``concurrency`` tokens, refilled so bursts stay within the minute),
+    plus a pause every caller honours after a 429.
+    """
+
+    def __init__(self, concurrency: int, per_minute: float):
+        self.concurrency = concurrency
+        per_minute = max(per_minute, 1.0)
+        self.capacity = max(1.0, min(float(concurrency), per_minute / 2))
+        # Under 2 calls a minute the one-token bucket alone uses the budget,
+        # so refill at the plain rate rather than at nothing
+        self.rate = max(per_minute - self.capacity, 1.0) / 60.0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tokens = self.capacity
+        self._updated = 0.0
+        self._paused_until = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep(max(self._paused_until - now, (1 - self._tokens) / self.rate))
+            yield
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + seconds)
+
+
+_limiters: Dict[Tuple[str, int, float], RateLimiter] = {}
+
+
+def limiter_for(provider: "AccountingProvider") -> RateLimiter:
+    key = (provider.limit_key, provider.max_concurrency, provider.requests_per_minute)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = RateLimiter(provider.max_concurrency, provider.requests_per_minute)
+    return limiter
+
+
+class AccountingProvider:
+    """One accounting system's API: documents, requests and responses."""
+
+    name = ""
+    batch_size = 1  # invoices per call
+    max_concurrency = 4  # calls in flight per account
+    requests_per_minute = 60.0  # calls per account
+
+    def __init__(self, credentials: Dict[str, Any], options: Dict[str, Any]):
+        self.credentials = credentials
+        self.options = options
+        # Options may lower the provider's limits (e.g. for sandbox apps), not raise them
+        self.batch_size = min(int(options.get("batch_size", self.batch_size)), self.batch_size)
+        self.max_concurrency = min(int(options.get("max_concurrency", self.max_concurrency)), self.max_concurrency)
+        self.requests_per_minute = min(float(options.get("requests_per_minute", self.requests_per_minute)),
+                                       self.requests_per_minute)
+
+    @property
+    def limit_key(self) -> str:
+        """The account the provider's rate limits apply to."""
+        raise NotImplementedError
+
+    def document(self, invoice: Invoice) -> Dict[str, Any]:
+        """The provider's document for an invoice; ValueError if it cannot be exported."""
+        raise NotImplementedError
+
+    def request(self, documents: List[Dict[str, Any]], key: str) -> Tuple[str, Any, Dict[str, str]]:
+        """(url, JSON body, headers) of the call creating ``documents``."""
+        raise NotImplementedError
+
+    def outcomes(self, invoices: List[Invoice], body: Any) -> List[ExportOutcome]:
+        raise NotImplementedError
+
+
+class QuickBooksProvider(AccountingProvider):
+    """
+    QuickBooks Online bills through the batch endpoint. ``requestid`` makes a
+    resent batch return the first answer instead of creating the bills again.
+
+    Options: ``vendor_refs`` (vendor name -> QuickBooks vendor id),
+    ``default_vendor_ref`` and ``expense_account_ref`` (used for lines
+    without an ``account_code``).
+    """
+
+    name = "quickbooks"
+    batch_size = 30  # BatchItemRequest items per call
+    max_concurrency = 10  # concurrent calls per company
+    requests_per_minute = 40.0  # batch calls per company
+
+    def __init__(self, credentials: Dict[str, Any], options: Dict[str, Any]):
+        super().__init__(credentials, options)
+        self.realm_id = credentials.get("realm_id") or options.get("realm_id")
+        if not self.realm_id or not credentials.get("access_token"):
+            raise ExportFailed("QuickBooks integration needs realm_id and access_token")
+        self.base_url = (settings.QUICKBOOKS_API_URL or (
+            "https://sandbox-quickbooks.api.intuit.com" if settings.QUICKBOOKS_ENVIRONMENT == "sandbox"
+            else "https://quickbooks.api.intuit.com"
+        )).rstrip("/")
+
+    @property
+    def limit_key(self) -> str:
+        return f"quickbooks:{self.realm_id}"
+
+    def document(self, invoice: Invoice) -> Dict[str, Any]:
+        vendor = (self.options.get("vendor_refs") or {}).get(invoice.vendor_name or "") \
+            or self.options.get("default_vendor_ref")
+        if not vendor:
+            raise ValueError(f"No QuickBooks vendor mapped for {invoice.vendor_name!r}")
+        default_account = invoice.account_code or self.options.get("expense_account_ref")
+        items = [
+            (item.description, item.total_price, item.account_code or default_account)
+            for item in invoice.line_items
+        ] or [(invoice.vendor_name or "Invoice", invoice.total_amount, default_account)]
+        if any(account is None for _, _, account in items):
+            raise ValueError("No QuickBooks expense account for the invoice lines")
+        bill = {
+            "VendorRef": {"value": str(vendor)},
+            "PrivateNote": f"invoice-ocr {invoice.id}",
+            "Line": [
+                {
+                    "DetailType": "AccountBasedExpenseLineDetail",
+                    "Amount": _money(amount),
+                    "Description": (description or "")[:4000],
+                    "AccountBasedExpenseLineDetail": {"AccountRef": {"value": str(account)}},
+                }
+                for description, amount, account in items
+            ],
+        }
+        if invoice.invoice_number:
+            bill["DocNumber"] = invoice.invoice_number[:21]
+        if invoice.invoice_date:
+            bill["TxnDate"] = invoice.invoice_date.isoformat()
+        if invoice.due_date:
+            bill["DueDate"] = invoice.due_date.isoformat()
+        if invoice.currency:
+            bill["CurrencyRef"] = {"value": invoice.currency}
+        return bill
+
+    def request(self, documents: List[Dict[str, Any]], key: str) -> Tuple[str, Any, Dict[str, str]]:
+        return (
+            f"{self.base_url}/v3/company/{self.realm_id}/batch?requestid={key}&minorversion=65",
+            {"BatchItemRequest": [
+                {"bId": str(i), "operation": "create", "Bill": document} for i, document in enumerate(documents)
+            ]},
+            {"Authorization": f"Bearer {self.credentials['access_token']}", "Accept": "application/json"},
+        )
+
+    def outcomes(self, invoices: List[Invoice], body: Any) -> List[ExportOutcome]:
+        answers = {item.get("bId"): item for item in (body or {}).get("BatchItemResponse", [])}
+        outcomes = []
+        for i, invoice in enumerate(invoices):
+            answer = answers.get(str(i)) or {}
+            if answer.get("Bill", {}).get("Id"):
+                outcomes.append(ExportOutcome(invoice.id, accounting_id=str(answer["Bill"]["Id"])))
+            else:
+                errors = (answer.get("Fault") or {}).get("Error") or [{"Message": "No answer for this bill"}]
+                message = "; ".join(filter(None, (e.get("Detail") or e.get("Message") for e in errors)))
+                outcomes.append(ExportOutcome(invoice.id, error=message or "Rejected by QuickBooks"))
+        return outcomes
+
+
+class XeroProvider(AccountingProvider):
+    """
+    Xero bills (ACCPAY invoices), many per call with per-invoice errors
+    (``summarizeErrors=false``). ``Idempotency-Key`` makes a resent batch
+    return the first answer.
+
+    Options: ``status`` (DRAFT by default) and ``account_code`` for lines
+    without one.
+    """
+
+    name = "xero"
+    batch_size = 50  # invoices per call
+    max_concurrency = 5  # concurrent calls per tenant
+    requests_per_minute = 60.0  # calls per tenant
+
+    def __init__(self, credentials: Dict[str, Any], options: Dict[str, Any]):
+        super().__init__(credentials, options)
+        self.tenant_id = credentials.get("tenant_id") or options.get("tenant_id")
+        if not self.tenant_id or not credentials.get("access_token"):
+            raise ExportFailed("Xero integration needs tenant_id and access_token")
+        self.base_url = settings.XERO_API_URL.rstrip("/")
+
+    @property
+    def limit_key(self) -> str:
+        return f"xero:{self.tenant_id}"
+
+    def document(self, invoice: Invoice) -> Dict[str, Any]:
+        if not invoice.vendor_name:
+            raise ValueError("Xero bills need a vendor name")
+        default_account = invoice.account_code or self.options.get("account_code")
+        lines = [
+            {
+                "Description": item.description or "-",
+                "Quantity": item.quantity or 1.0,
+                "UnitAmount": _money(item.unit_price),
+                "AccountCode": item.account_code or default_account,
+            }
+            for item in invoice.line_items
+        ] or [{"Description": invoice.vendor_name, "Quantity": 1.0, "UnitAmount": _money(invoice.total_amount),
+               "AccountCode": default_account}]
+        document = {
+            "Type": "ACCPAY",
+            "Contact": {"Name": invoice.vendor_name[:255]},
+            "Reference": str(invoice.id),
+            "Status": self.options.get("status", "DRAFT"),
+            "LineItems": [{k: v for k, v in line.items() if v is not None} for line in lines],
+        }
+        if invoice.invoice_number:
+            document["InvoiceNumber"] = invoice.invoice_number[:255]
+        if invoice.invoice_date:
+            document["Date"] = invoice.invoice_date.isoformat()
+        if invoice.due_date:
+            document["DueDate"] = invoice.due_date.isoformat()
+        if invoice.currency:
+            document["CurrencyCode"] = invoice.currency
+        return document
+
+    def request(self, documents: List[Dict[str, Any]], key: str) -> Tuple[str, Any, Dict[str, str]]:
+        return (
+            f"{self.base_url}/api.xro/2.0/Invoices?summarizeErrors=false",
+            {"Invoices": documents},
+            {
+                "Authorization": f"Bearer {self.credentials['access_token']}",
+                "Xero-tenant-id": str(self.tenant_id),
+                "Idempotency-Key": key,
+                "Accept": "application/json",
+            },
+        )
+
+    def outcomes(self, invoices: List[Invoice], body: Any) -> List[ExportOutcome]:
+        answers = (body or {}).get("Invoices", [])
+        outcomes = []
+        for invoice, answer in zip(invoices, answers + [{}] * (len(invoices) - len(answers))):
+            errors = [e.get("Message") for e in answer.get("ValidationErrors") or []]
+            if answer.get("InvoiceID") and not answer.get("HasErrors") and not errors:
+                outcomes.append(ExportOutcome(invoice.id, accounting_id=str(answer["InvoiceID"])))
+            else:
+                outcomes.append(ExportOutcome(invoice.id, error="; ".join(filter(None, errors)) or "Rejected by Xero"))
+        return outcomes
+
+
+class CustomProvider(AccountingProvider):
+    """
+    A client's own HTTP API (``accounting_config`` style options):
+    ``POST {api_url}/invoices`` per invoice answering ``{"id": ...}``, or,
+    with ``batch_size`` above 1, ``POST {api_url}/invoices/batch`` with
+    ``{"invoices": [...]}`` answering ``{"results": [{"id"} | {"error"}]}``
+    in order. ``field_mappings`` renames invoice fields; limits come from
+    the options.
+    """
+
+    name = "custom"
+
+    def __init__(self, credentials: Dict[str, Any], options: Dict[str, Any]):
+        self.credentials = credentials
+        self.options = options
+        self.api_url = (options.get("api_url") or "").rstrip("/")
+        if not self.api_url:
+            raise ExportFailed("Custom integration needs api_url")
+        self.batch_size = max(1, int(options.get("batch_size", 1)))
+        self.max_concurrency = max(1, int(options.get("max_concurrency", 4)))
+        self.requests_per_minute = max(1.0, float(options.get("requests_per_minute", 60)))
+
+    @property
+    def limit_key(self) -> str:
+        return f"custom:{self.api_url}"
+
+    def _auth_headers(self) -> Dict[str, str]:
+        token = self.credentials.get("token") or self.credentials.get("api_key")
+        if not token:
+            return {}
+        if self.options.get("auth_type") == "api_key":
+            return {"X-API-Key": token}
+        return {"Authorization": f"Bearer {token}"}
+
+    def document(self, invoice: Invoice) -> Dict[str, Any]:
+        document = {
+            "id": str(invoice.id),
+            "invoice_number": invoice.invoice_number,
+            "invoice_date": invoice.invoice_date.isoformat() if invoice.invoice_date else None,
+            "due_date": invoice.due_date.isoformat() if invoice.due_date else None,
+            "vendor_name": invoice.vendor_name,
+            "vendor_tax_id": invoice.vendor_tax_id,
+            "currency": invoice.currency,
+            "subtotal": invoice.subtotal,
+            "tax_amount": invoice.tax_amount,
+            "total_amount": invoice.total_amount,
+            "category": invoice.category,
+            "account_code": invoice.account_code,
+            "line_items": [
+                {
+                    "description": item.description,
+                    "quantity": item.quantity,
+                    "unit_price": item.unit_price,
+                    "total_price": item.total_price,
+                    "tax_amount": item.tax_amount,
+                    "account_code": item.account_code,
+                }
+                for item in invoice.line_items
+            ],
+        }
+        mappings = self.options.get("field_mappings") or {}
+        return {mappings.get(k, k): v for k, v in document.items()}
+
+    def request(self, documents: List[Dict[str, Any]], key: str) -> Tuple[str, Any, Dict[str, str]]:
+        headers = {**self._auth_headers(), "Idempotency-Key": key}
+        if self.batch_size == 1:
+            return f"{self.api_url}/invoices", documents[0], headers
+        return f"{self.api_url}/invoices/batch", {"invoices": documents}, headers
+
+    def outcomes(self, invoices: List[Invoice], body: Any) -> List[ExportOutcome]:
+        answers = [body] if self.batch_size == 1 else (body or {}).get("results", [])
+        outcomes = []
+        for invoice, answer in zip(invoices, answers + [{}] * (len(invoices) - len(answers))):
+            answer = answer or {}
+            if answer.get("id") and not answer.get("error"):
+                outcomes.append(ExportOutcome(invoice.id, accounting_id=str(answer["id"])))
+            else:
+                outcomes.append(ExportOutcome(invoice.id, error=str(answer.get("error") or "No id returned")))
+        return outcomes
+
+
+PROVIDERS = {
+    "quickbooks": QuickBooksProvider,
+    "xero": XeroProvider,
+    "custom": CustomProvider,
+}
+
+
+def provider_for(target: ExportTarget) -> AccountingProvider:
+    provider = PROVIDERS.get(target.integration_type)
+    if provider is None:
+        raise ExportFailed(f"Exporting to {target.integration_type!r} is not supported")
+    return provider(target.credentials, target.options)
+
+
+class ExportStore:
+    """The database side of a run: integration, pending invoices, results."""
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def target(self, integration_id: uuid.UUID) -> ExportTarget:
+        async with self.session_factory() as db:
+            row = (await db.execute(
+                select(IntegrationConfig, Client.organization_id, Organization.encryption_key)
+                .join(Client, Client.id == IntegrationConfig.client_id)
+                .join(Organization, Organization.id == Client.organization_id)
+                .where(IntegrationConfig.id == integration_id)
+            )).first()
+        if row is None or not row.IntegrationConfig.is_active:
+            raise ExportFailed(f"Integration {integration_id} not found or inactive")
+        options = dict(row.IntegrationConfig.config_data or {})
+        encrypted = options.pop(ENCRYPTED_FIELD, None)
+        try:
+            credentials = json.loads(cipher_registry.decrypt(encrypted, row.encryption_key)) if encrypted else {}
+        except ValueError as e:
+            raise ExportFailed(f"Integration credentials unreadable: {e}")
+        return ExportTarget(
+            integration_id=integration_id,
+            client_id=row.IntegrationConfig.client_id,
+            organization_id=row.organization_id,
+            integration_type=row.IntegrationConfig.integration_type,
+            options=options,
+            credentials=credentials,
+        )
+
+    def _exportable(self, client_id: uuid.UUID):
+        return (
+            select(Invoice)
+            .options(selectinload(Invoice.line_items))
+            .where(
+                Invoice.client_id == client_id,
+                Invoice.status == "approved",
+                Invoice.accounting_id.is_(None),
+                Invoice.deleted_at.is_(None),
+            )
+        )
+
+    async def unconfirmed(self, client_id: uuid.UUID) -> List[Invoice]:
+        """Invoices sent in a batch whose answer was never recorded."""
+        async with self.session_factory() as db:
+            return list((await db.execute(
+                self._exportable(client_id).where(Invoice.export_error.startswith(UNCONFIRMED_PREFIX))
+            )).scalars().all())
+
+    async def pending(self, client_id: uuid.UUID, after: Optional[uuid.UUID], limit: int) -> List[Invoice]:
+        """The next page of invoices to export, in id order."""
+        query = self._exportable(client_id).where(or_(
+            Invoice.export_error.is_(None), ~Invoice.export_error.startswith(UNCONFIRMED_PREFIX),
+        ))
+        if after is not None:
+            query = query.where(Invoice.id > after)
+        async with self.session_factory() as db:
+            return list((await db.execute(query.order_by(Invoice.id).limit(limit))).scalars().all())
+
+    async def mark_sent(self, invoice_ids: List[uuid.UUID], key: str) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                update(Invoice).where(Invoice.id.in_(invoice_ids))
+                .values(export_error=f"{UNCONFIRMED_PREFIX}{key}")
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def record(self, system: str, outcomes: List[ExportOutcome]) -> None:
+        # Through the ORM: the status change moves the invoices between rollups
+        by_id = {o.invoice_id: o for o in outcomes}
+        now = datetime.utcnow().isoformat()
+        async with self.session_factory() as db:
+            invoices = (await db.execute(select(Invoice).where(Invoice.id.in_(list(by_id))))).scalars().all()
+            for invoice in invoices:
+                outcome = by_id[invoice.id]
+                if outcome.accounting_id is None:
+                    invoice.export_error = outcome.error
+                    continue
+                invoice.accounting_system = system
+                invoice.accounting_id = outcome.accounting_id
+                invoice.accounting_synced = True
+                invoice.exported_at = now
+                invoice.export_error = None
+                invoice.status = "exported"
+            await db.commit()
+
+    async def finish(self, target: ExportTarget, status: str, error: Optional[str]) -> None:
+        now = datetime.utcnow().isoformat()
+        async with self.session_factory() as db:
+            await db.execute(
+                update(IntegrationConfig).where(IntegrationConfig.id == target.integration_id)
+                .values(last_sync=now, sync_status=status, sync_error=error[:500] if error else None)
+            )
+            await db.execute(
+                update(Client).where(Client.id == target.client_id).values(accounting_last_sync=now)
+            )
+            await db.commit()
+        await get_cache().invalidate_tags(invoice_tags(target.client_id, target.organization_id))
+
+
+class AccountingExporter:
+    """Runs exports over one pooled HTTP session."""
+
+    def __init__(self, store: Optional[ExportStore] = None, page_size: int = settings.EXPORT_PAGE_SIZE,
+                 max_retries: int = settings.EXPORT_MAX_RETRIES, backoff: float = settings.EXPORT_RETRY_BACKOFF,
+                 timeout: float = settings.EXPORT_HTTP_TIMEOUT):
+        self.store = store or ExportStore()
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._http: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._http
+
+    async def close(self) -> None:
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+
+    async def export(self, integration_id: uuid.UUID) -> ExportSummary:
+        """Export every approved, unexported invoice of an integration's client."""
+        target = await self.store.target(integration_id)
+        summary = ExportSummary()
+        try:
+            provider = provider_for(target)
+            limiter = limiter_for(provider)
+            # Batches left unconfirmed by an earlier run go first, under their original keys
+            groups: Dict[str, List[Invoice]] = {}
+            for invoice in await self.store.unconfirmed(target.client_id):
+                groups.setdefault(invoice.export_error[len(UNCONFIRMED_PREFIX):], []).append(invoice)
+            await self._send_all(provider, limiter, [
+                (key, await self._prepare(provider, invoices, summary), True) for key, invoices in groups.items()
+            ], summary)
+
+            after = None
+            while True:
+                page = await self.store.pending(target.client_id, after, self.page_size)
+                if not page:
+                    break
+                after = page[-1].id
+                ready = await self._prepare(provider, page, summary)
+                batches = [ready[i:i + provider.batch_size] for i in range(0, len(ready), provider.batch_size)]
+                await self._send_all(provider, limiter, [
+                    (new_batch_key(), batch, False) for batch in batches
+                ], summary)
+        except ExportFailed as e:
+            await self.store.finish(target, "error", str(e))
+            raise
+
+        error = "; ".join(summary.errors[:3]) or None
+        await self.store.finish(target, "incomplete" if summary.undelivered else "synced", error)
+        logger.info(f"Export of integration {integration_id}: {summary.exported} exported, "
+                    f"{summary.failed} rejected, {summary.undelivered} undelivered in {summary.requests} calls")
+        return summary
+
+    async def _prepare(self, provider: AccountingProvider, invoices: List[Invoice],
+                       summary: ExportSummary) -> List[Tuple[Invoice, Dict[str, Any]]]:
+        """Provider documents of ``invoices``; those that cannot be exported are recorded as failed."""
+        ready, rejected = [], []
+        for invoice in invoices:
+            try:
+                ready.append((invoice, provider.document(invoice)))
+            except ValueError as e:
+                rejected.append(ExportOutcome(invoice.id, error=str(e)))
+        if rejected:
+            summary.failed += len(rejected)
+            await self.store.record(provider.name, rejected)
+        return ready
+
+    async def _send_all(self, provider: AccountingProvider, limiter: RateLimiter,
+                        batches: List[Tuple[str, List[Tuple[Invoice, Dict[str, Any]]], bool]],
+                        summary: ExportSummary) -> None:
+        tasks = [
+            asyncio.create_task(self._deliver(provider, limiter, key, batch, resend, summary))
+            for key, batch, resend in batches if batch
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _deliver(self, provider: AccountingProvider, limiter: RateLimiter, key: str,
+                       batch: List[Tuple[Invoice, Dict[str, Any]]], resend: bool, summary: ExportSummary) -> None:
+        invoices = [invoice for invoice, _ in batch]
+        if not resend:
+            await self.store.mark_sent([invoice.id for invoice in invoices], key)
+        try:
+            outcomes = await self._send(provider, limiter, key, invoices, [document for _, document in batch],
+                                        summary)
+        except _Undelivered as e:
+            # Left marked: the next run resends the batch under the same key
+            summary.undelivered += len(invoices)
+            summary.errors.append(str(e))
+            logger.warning(f"{provider.name} batch {key} not delivered: {e}")
+            return
+        await self.store.record(provider.name, outcomes)
+        for outcome in outcomes:
+            if outcome.accounting_id is not None:
+                summary.exported += 1
+            else:
+                summary.failed += 1
+                if len(summary.errors) < 10:
+                    summary.errors.append(outcome.error)
+
+    async def _send(self, provider: AccountingProvider, limiter: RateLimiter, key: str, invoices: List[Invoice],
+                    documents: List[Dict[str, Any]], summary: ExportSummary) -> List[ExportOutcome]:
+        url, body, headers = provider.request(documents, key)
+        error = None
+        for attempt in range(1, self.max_retries + 1):
+            delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+            try:
+                async with limiter.slot():
+                    summary.requests += 1
+                    async with self.http.post(url, json=body, headers=headers) as response:
+                        if response.status in (401, 403):
+                            raise ExportFailed(f"{provider.name} refused the credentials (HTTP {response.status})")
+                        if response.status == 429 or response.status >= 500:
+                            error = f"HTTP {response.status}"
+                            retry_after = response.headers.get("Retry-After", "")
+                            if retry_after.isdigit():
+                                delay = float(retry_after)
+                            if response.status == 429:
+                                limiter.pause(delay)
+                        elif response.status >= 400:
+                            detail = (await response.text())[:500]
+                            return [ExportOutcome(i.id, error=f"HTTP {response.status}: {detail}") for i in invoices]
+                        else:
+                            return provider.outcomes(invoices, await response.json(content_type=None))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        raise _Undelivered(f"{error} after {self.max_retries} attempts")
+
+
+async def enqueue_export(db: AsyncSession, integration: IntegrationConfig) -> Optional[uuid.UUID]:
+    """Queue an export run; None when one is already queued or running for the integration."""
+    stmt = (
+        insert(ProcessingQueue)
+        .values(
+            id=uuid.uuid4(),
+            client_id=integration.client_id,
+            task_type=TASK_TYPE,
+            source=integration.integration_type,
+            source_reference=str(integration.id),
+        )
+        .on_conflict_do_nothing(
+            index_elements=[ProcessingQueue.__table__.c.source_reference],
+            index_where=ProcessingQueue.__table__.c.task_type == TASK_TYPE
+            & ProcessingQueue.__table__.c.status.in_(("pending", "processing")),
+        )
+        .returning(ProcessingQueue.id)
+    )
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
+@register(TASK_TYPE)
+async def handle_export_job(job: ProcessingQueue) -> dict:
+    """Queue handler: one export run. Undelivered batches fail the job so the queue retries it."""
+    exporter = AccountingExporter()
+    try:
+        summary = await exporter.export(uuid.UUID(job.source_reference))
+    finally:
+        await exporter.close()
+    if summary.undelivered:
+        raise ExportIncomplete(f"{summary.undelivered} invoices not delivered: {'; '.join(summary.errors[:3])}")
+    return {"exported": summary.exported, "failed": summary.failed, "requests": summary.requests}
+
+
+async def _main(integration_id: str) -> int:
+    exporter = AccountingExporter()
+    try:
+        summary = await exporter.export(uuid.UUID(integration_id))
+    except ExportFailed as e:
+        print(f"Export failed: {e}")
+        return 1
+    finally:
+        await exporter.close()
+    print(f"{summary.exported} exported, {summary.failed} rejected, {summary.undelivered} undelivered "
+          f"({summary.requests} calls)")
+    return 1 if summary.undelivered else 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    parser = argparse.ArgumentParser(description="Export approved invoices to an integration")
+    parser.add_argument("integration_id")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.integration_id)))
@@ -0,0 +1,317 @@
+"""
+Keyword/vendor categorization of invoices and line items.
+
+An organization's active categories are compiled once into a
+``CompiledCategorizer``: every keyword of every category goes into a single
+Aho-Corasick automaton, so categorizing is one pass over the text however
+many categories there are. Evidence per category:
+
+* vendor seen before for the category (``ml_training_data["vendors"]``),
+* keywords in the vendor name, weighted above keywords in descriptions,
+* amount inside ``ml_training_data["amount_range"]`` (only alongside
+  other evidence).
+
+``ml_training_data`` may also carry ``{"keywords": {"keyword": weight}}``
+for weighted keywords. Compiled categorizers are cached per organization
+and rebuilt when a Category row changes.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Dict, List, Sequence, Tuple, Any
+import logging
+import re
+import time
+import uuid
+
+from sqlalchemy import select, update, func, event, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import get_cache, invoice_tags
+from app.core.config import settings
+from app.models.category import Category
+from app.models.client import Client
+from app.models.invoice import Invoice, InvoiceLineItem
+from app.services.rollups import rebuild_rollups
+from app.services.vendor_normalizer import AliasAutomaton, VendorIndex, clean_vendor_name, get_vendor_normalizer
+
+logger = logging.getLogger(__name__)
+
+VENDOR_WEIGHT = 3.0
+VENDOR_KEYWORD_WEIGHT = 2.0
+TEXT_KEYWORD_WEIGHT = 1.0
+AMOUNT_WEIGHT = 0.5
+
+# Invoices in these states are already in the books; leave them alone
+LOCKED_STATUSES = ("exported", "archived")
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def clean_text(text: Optional[str]) -> str:
+    return _NON_ALNUM.sub(" ", (text or "").lower()).strip()
+
+
+@dataclass
+class CategorizeInput:
+    vendor_name: Optional[str] = None
+    text: Optional[str] = None
+    amount: Optional[float] = None
+
+
+@dataclass
+class CategoryMatch:
+    category_id: uuid.UUID
+    name: str
+    account_code: Optional[str]
+    confidence: float
+    matched: List[str] = field(default_factory=list)
+
+
+@dataclass
+class _CompiledCategory:
+    id: uuid.UUID
+    name: str
+    account_code: Optional[str]
+    amount_range: Optional[Tuple[float, float]]
+
+
+class CompiledCategorizer:
+    """All active categories of one organization, compiled into one matcher."""
+
+    def __init__(self, categories: Sequence[Category], vendors: Optional[VendorIndex] = None,
+                 min_confidence: float = settings.CATEGORIZATION_MIN_CONFIDENCE):
+        self.vendors = vendors
+        self.min_confidence = min_confidence
+        self.categories: List[_CompiledCategory] = []
+        self._keywords: Dict[str, List[Tuple[int, float]]] = {}
+        self._vendor_keys: Dict[str, List[int]] = {}
+        self._automaton = AliasAutomaton()
+
+        for category in categories:
+            index = len(self.categories)
+            training = category.ml_training_data or {}
+            amount_range = training.get("amount_range")
+            self.categories.append(_CompiledCategory(
+                id=category.id,
+                name=category.name,
+                account_code=category.account_code,
+                amount_range=tuple(amount_range) if amount_range and len(amount_range) == 2 else None,
+            ))
+
+            weights = {clean_text(k): 1.0 for k in (category.keywords or [])}
+            weights.update({clean_text(k): float(w) for k, w in (training.get("keywords") or {}).items()})
+            for keyword, weight in weights.items():
+                if keyword:
+                    if keyword not in self._keywords:
+                        self._automaton.add(keyword)
+                    self._keywords.setdefault(keyword, []).append((index, weight))
+
+            for vendor in training.get("vendors") or []:
+                key = self._vendor_key(vendor)
+                if key:
+                    self._vendor_keys.setdefault(key, []).append(index)
+
+    def _vendor_key(self, name: Optional[str]) -> str:
+        return self.vendors.vendor_key(name) if self.vendors else clean_vendor_name(name)
+
+    def _add_keywords(self, scores: Dict[int, float], matched: Dict[int, List[str]],
+                      text: str, multiplier: float) -> None:
+        for keyword in set(self._automaton.search(text)):
+            for index, weight in self._keywords[keyword]:
+                scores[index] = scores.get(index, 0.0) + weight * multiplier
+                matched.setdefault(index, []).append(keyword)
+
+    def categorize(self, item: CategorizeInput) -> Optional[CategoryMatch]:
+        scores: Dict[int, float] = {}
+        matched: Dict[int, List[str]] = {}
+
+        vendor_key = self._vendor_key(item.vendor_name)
+        for index in self._vendor_keys.get(vendor_key, ()):
+            scores[index] = scores.get(index, 0.0) + VENDOR_WEIGHT
+            matched.setdefault(index, []).append(f"vendor:{vendor_key}")
+        if vendor_key:
+            self._add_keywords(scores, matched, clean_text(item.vendor_name), VENDOR_KEYWORD_WEIGHT)
+        if item.text:
+            self._add_keywords(scores, matched, clean_text(item.text), TEXT_KEYWORD_WEIGHT)
+        if not scores:
+            return None
+
+        if item.amount is not None:
+            for index in scores:
+                amount_range = self.categories[index].amount_range
+                if amount_range and amount_range[0] <= item.amount <= amount_range[1]:
+                    scores[index] += AMOUNT_WEIGHT
+
+        best = max(scores, key=scores.get)
+        # Share of the evidence, damped while the evidence itself is thin
+        share = scores[best] / sum(scores.values())
+        strength = min(1.0, scores[best] / VENDOR_WEIGHT)
+        confidence = round(min(share * strength, 0.99), 4)
+        if confidence < self.min_confidence:
+            return None
+
+        category = self.categories[best]
+        return CategoryMatch(category.id, category.name, category.account_code, confidence, matched[best])
+
+    def categorize_many(self, items: Sequence[CategorizeInput]) -> List[Optional[CategoryMatch]]:
+        return [self.categorize(item) for item in items]
+
+
+@dataclass
+class _CachedCategorizer:
+    categorizer: CompiledCategorizer
+    version: Tuple[int, Optional[datetime]]
+    checked_at: float
+    vendor_generation: int = 0  # VendorIndex.generation the vendor keys were computed at
+
+
+class CategorizerCache:
+    """Per-organization cache of compiled categorizers."""
+
+    def __init__(self, refresh_seconds: int = settings.CATEGORIZER_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._cache: Dict[uuid.UUID, _CachedCategorizer] = {}
+
+    async def _version(self, db: AsyncSession, organization_id: uuid.UUID) -> Tuple[int, Optional[datetime]]:
+        # count() catches deletes, max(updated_at) catches inserts and edits
+        row = (await db.execute(
+            select(func.count(), func.max(Category.updated_at))
+            .where(Category.organization_id == organization_id)
+        )).one()
+        return row[0], row[1]
+
+    async def get(self, db: AsyncSession, organization_id: uuid.UUID) -> CompiledCategorizer:
+        entry = self._cache.get(organization_id)
+        if entry is not None and time.monotonic() - entry.checked_at < self.refresh_seconds:
+            return entry.categorizer
+
+        version = await self._version(db, organization_id)
+        vendors = await get_vendor_normalizer().get(db, organization_id)
+        if entry is None or entry.version != version or entry.categorizer.vendors is not vendors \
+                or entry.vendor_generation != vendors.generation:
+            categories = (await db.execute(
+                select(Category).where(Category.organization_id == organization_id, Category.is_active.is_(True))
+            )).scalars().all()
+            entry = _CachedCategorizer(CompiledCategorizer(categories, vendors), version, 0.0, vendors.generation)
+            self._cache[organization_id] = entry
+            logger.info(f"Compiled {len(categories)} categories for organization {organization_id}")
+        entry.checked_at = time.monotonic()
+        return entry.categorizer
+
+    def invalidate(self, organization_id: Optional[uuid.UUID] = None) -> None:
+        if organization_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(organization_id, None)
+
+
+_categorizer_cache: Optional[CategorizerCache] = None
+
+
+def get_categorizer_cache() -> CategorizerCache:
+    global _categorizer_cache
+    if _categorizer_cache is None:
+        _categorizer_cache = CategorizerCache()
+    return _categorizer_cache
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _category_changed(mapper, connection, target) -> None:
+    # Immediate in this process; other processes notice on their next refresh
+    if _categorizer_cache is not None:
+        _categorizer_cache.invalidate(target.organization_id)
+
+
+def apply_category(invoice: Invoice, match: CategoryMatch) -> None:
+    invoice.category_id = match.category_id
+    invoice.category = match.name
+    invoice.account_code = match.account_code
+
+
+async def recategorize_client(db: AsyncSession, client_id: uuid.UUID, batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Re-run categorization over every invoice and line item of a client.
+
+    Invoices are read in keyset-paginated batches, with the batch's line
+    items in one query; results are written with bulk UPDATEs. Invoices and
+    lines without a confident match keep their current category.
+    """
+    client = await db.get(Client, client_id)
+    if client is None:
+        raise LookupError(f"Client {client_id} not found")
+    categorizer = await get_categorizer_cache().get(db, client.organization_id)
+
+    started = time.perf_counter()
+    scanned = invoices_updated = lines_updated = 0
+    last: Optional[tuple] = None
+    while True:
+        query = (
+            select(Invoice.id, Invoice.vendor_name, Invoice.total_amount, Invoice.notes, Invoice.ocr_raw_text,
+                   Invoice.created_at)
+            .where(
+                Invoice.client_id == client_id,
+                Invoice.deleted_at.is_(None),
+                Invoice.status.notin_(LOCKED_STATUSES),
+            )
+            .order_by(Invoice.created_at, Invoice.id)
+            .limit(batch_size)
+        )
+        if last is not None:
+            query = query.where(tuple_(Invoice.created_at, Invoice.id) > last)
+        invoices = (await db.execute(query)).all()
+        if not invoices:
+            break
+        last = (invoices[-1].created_at, invoices[-1].id)
+        scanned += len(invoices)
+
+        lines = (await db.execute(
+            select(InvoiceLineItem.id, InvoiceLineItem.invoice_id, InvoiceLineItem.description,
+                   InvoiceLineItem.total_price)
+            .where(InvoiceLineItem.invoice_id.in_([row.id for row in invoices]))
+        )).all()
+        descriptions: Dict[uuid.UUID, List[str]] = {}
+        for line in lines:
+            descriptions.setdefault(line.invoice_id, []).append(line.description or "")
+        vendors = {row.id: row.vendor_name for row in invoices}
+
+        invoice_matches = categorizer.categorize_many([
+            CategorizeInput(row.vendor_name,
+                            " ".join([row.notes or "", row.ocr_raw_text or ""] + descriptions.get(row.id, [])),
+                            row.total_amount)
+            for row in invoices
+        ])
+        line_matches = categorizer.categorize_many([
+            CategorizeInput(vendors[line.invoice_id], line.description, line.total_price) for line in lines
+        ])
+
+        # ORM bulk UPDATE by primary key (executemany)
+        invoice_rows = [
+            {"id": row.id, "category_id": m.category_id, "category": m.name, "account_code": m.account_code}
+            for row, m in zip(invoices, invoice_matches) if m is not None
+        ]
+        line_rows = [
+            {"id": line.id, "category": m.name, "account_code": m.account_code}
+            for line, m in zip(lines, line_matches) if m is not None
+        ]
+        if invoice_rows:
+            await db.execute(update(Invoice), invoice_rows)
+        if line_rows:
+            await db.execute(update(InvoiceLineItem), line_rows)
+        invoices_updated += len(invoice_rows)
+        lines_updated += len(line_rows)
+
+    if invoices_updated:
+        await rebuild_rollups(db, [client_id])
+    await db.commit()
+    # Bulk UPDATEs skip the ORM events that normally drop cached stats
+    await get_cache().invalidate_tags(invoice_tags(client_id, client.organization_id))
+    elapsed = time.perf_counter() - started
+    logger.info(f"Recategorized client {client_id}: {invoices_updated}/{scanned} invoices in {elapsed:.2f}s")
+    return {
+        "scanned": scanned,
+        "invoices_updated": invoices_updated,
+        "line_items_updated": lines_updated,
+        "seconds": round(elapsed, 3),
+    }
@@ -0,0 +1,379 @@
+"""
+Duplicate invoice detection.
+
+Comparing a new invoice with every earlier invoice of the client stops
+scaling past a few hundred thousand rows, so invoices are indexed under
+blocking keys in ``invoice_duplicate_keys``:
+
+    v | canonical vendor | amount bucket | invoice date
+    n | canonical vendor | normalized invoice number
+
+Amount buckets are ``DUPLICATE_AMOUNT_TOLERANCE`` wide. A lookup probes the
+neighbouring buckets and every date within ``DUPLICATE_DATE_WINDOW_DAYS``,
+so all invoices that could match are found through the index, and only
+that small candidate set is scored.
+
+Backfills use ``rescan_client``, which rebuilds the index for a client and
+scores everything in one ordered pass without per-invoice queries.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional, Dict, List, Iterable, Sequence, Tuple
+import argparse
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import uuid
+
+from sqlalchemy import BigInteger, any_, bindparam, case, select, delete, update, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import get_cache, invoice_tags
+from app.core.config import settings
+from app.models.duplicate_key import InvoiceDuplicateKey
+from app.models.client import Client
+from app.models.invoice import Invoice
+from app.services.rollups import rebuild_rollups
+from app.services.vendor_normalizer import VendorIndex, clean_vendor_name, get_vendor_normalizer
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_LEADING_ZEROS = re.compile(r"(?<!\d)0+(?=\d)")
+
+DUPLICATE_REVIEW_PREFIX = "Possible duplicate"
+
+
+def duplicate_review_reason(confidence: float) -> str:
+    return f"{DUPLICATE_REVIEW_PREFIX} ({confidence:.0%})"
+
+
+def normalize_invoice_number(number: Optional[str]) -> str:
+    """``INV-0042`` and ``inv 42`` compare equal."""
+    return _LEADING_ZEROS.sub("", _NON_ALNUM.sub("", (number or "").lower()))
+
+
+def hash_key(*parts) -> int:
+    """Signed 64-bit hash of a blocking key (fits a BIGINT column)."""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+@dataclass
+class InvoiceSignature:
+    """The fields duplicate detection looks at."""
+    id: uuid.UUID
+    client_id: uuid.UUID
+    vendor: str
+    amount: Optional[float]
+    invoice_date: Optional[date]
+    number: str
+
+    @classmethod
+    def of(cls, invoice, vendors: Optional[VendorIndex] = None) -> "InvoiceSignature":
+        return cls(
+            id=invoice.id,
+            client_id=invoice.client_id,
+            vendor=vendors.vendor_key(invoice.vendor_name) if vendors else clean_vendor_name(invoice.vendor_name),
+            amount=invoice.total_amount,
+            invoice_date=invoice.invoice_date,
+            number=normalize_invoice_number(invoice.invoice_number),
+        )
+
+
+def _amount_bucket(amount: Optional[float]) -> Optional[int]:
+    if amount is None:
+        return None
+    return math.floor(amount / settings.DUPLICATE_AMOUNT_TOLERANCE)
+
+
+def index_keys(sig: InvoiceSignature) -> List[int]:
+    """Keys an invoice is stored under."""
+    if not sig.vendor:
+        return []
+    keys = []
+    bucket = _amount_bucket(sig.amount)
+    if bucket is not None:
+        keys.append(hash_key("v", sig.vendor, bucket, sig.invoice_date))
+    if sig.number:
+        keys.append(hash_key("n", sig.vendor, sig.number))
+    return keys
+
+
+def probe_keys(sig: InvoiceSignature) -> List[int]:
+    """Keys to look up to find every invoice that could match ``sig``."""
+    if not sig.vendor:
+        return []
+    keys = []
+    bucket = _amount_bucket(sig.amount)
+    if bucket is not None:
+        if sig.invoice_date is None:
+            dates: Iterable[Optional[date]] = [None]
+        else:
+            window = settings.DUPLICATE_DATE_WINDOW_DAYS
+            dates = [sig.invoice_date + timedelta(days=d) for d in range(-window, window + 1)]
+        for d in dates:
+            for b in (bucket - 1, bucket, bucket + 1):
+                keys.append(hash_key("v", sig.vendor, b, d))
+    if sig.number:
+        keys.append(hash_key("n", sig.vendor, sig.number))
+    return keys
+
+
+def score(new: InvoiceSignature, existing: InvoiceSignature) -> float:
+    """Confidence (0-1) that ``new`` duplicates ``existing``."""
+    if not new.vendor or new.vendor != existing.vendor:
+        return 0.0
+    confidence = 0.25
+
+    if new.amount is not None and existing.amount is not None:
+        difference = abs(new.amount - existing.amount)
+        if difference < 0.005:
+            confidence += 0.30
+        elif difference <= settings.DUPLICATE_AMOUNT_TOLERANCE:
+            confidence += 0.25
+
+    if new.invoice_date and existing.invoice_date:
+        days = abs((new.invoice_date - existing.invoice_date).days)
+        if days == 0:
+            confidence += 0.25
+        elif days <= settings.DUPLICATE_DATE_WINDOW_DAYS:
+            confidence += 0.10
+
+    if new.number and existing.number:
+        # Different invoice numbers from the same vendor are strong evidence
+        # of two genuine invoices (e.g. a monthly subscription)
+        confidence += 0.25 if new.number == existing.number else -0.40
+
+    return round(max(0.0, min(confidence, 0.99)), 4)
+
+
+def best_match(new: InvoiceSignature, candidates: Iterable[InvoiceSignature]) -> Tuple[Optional[uuid.UUID], float]:
+    best_id, best_score = None, 0.0
+    for candidate in candidates:
+        if candidate.id == new.id:
+            continue
+        s = score(new, candidate)
+        if s > best_score:
+            best_id, best_score = candidate.id, s
+    return best_id, best_score
+
+
+async def index_invoice(db: AsyncSession, invoice: Invoice, vendors: Optional[VendorIndex] = None) -> None:
+    """(Re)write the blocking keys of one invoice."""
+    await db.execute(delete(InvoiceDuplicateKey).where(InvoiceDuplicateKey.invoice_id == invoice.id))
+    keys = index_keys(InvoiceSignature.of(invoice, vendors))
+    if keys:
+        await db.execute(
+            insert(InvoiceDuplicateKey).on_conflict_do_nothing(),
+            [{"invoice_id": invoice.id, "client_id": invoice.client_id, "block_key": k} for k in keys],
+        )
+
+
+async def find_candidates(
+    db: AsyncSession, sig: InvoiceSignature, vendors: Optional[VendorIndex] = None
+) -> List[InvoiceSignature]:
+    keys = probe_keys(sig)
+    if not keys:
+        return []
+    matching_ids = (
+        select(InvoiceDuplicateKey.invoice_id)
+        .where(
+            InvoiceDuplicateKey.client_id == sig.client_id,
+            InvoiceDuplicateKey.block_key.in_(keys),
+        )
+    )
+    rows = await db.execute(
+        select(Invoice)
+        .where(
+            Invoice.id.in_(matching_ids),
+            Invoice.id != sig.id,
+            Invoice.deleted_at.is_(None),
+            Invoice.is_duplicate.is_(False),
+        )
+    )
+    return [InvoiceSignature.of(invoice, vendors) for invoice in rows.scalars()]
+
+
+async def check_duplicate(db: AsyncSession, invoice: Invoice) -> Tuple[Optional[uuid.UUID], float]:
+    """
+    Index ``invoice`` and flag it if it duplicates an earlier one.
+
+    Returns (duplicate_of, confidence); duplicate_of is None below
+    DUPLICATE_CONFIDENCE_THRESHOLD.
+    """
+    vendors = await get_vendor_normalizer().get(db, invoice.organization_id)
+    sig = InvoiceSignature.of(invoice, vendors)
+    match_id, confidence = best_match(sig, await find_candidates(db, sig, vendors))
+    await index_invoice(db, invoice, vendors)
+
+    if match_id is not None and confidence >= settings.DUPLICATE_CONFIDENCE_THRESHOLD:
+        invoice.is_duplicate = True
+        invoice.duplicate_of = match_id
+        invoice.duplicate_confidence = confidence
+        invoice.needs_review = True
+        invoice.review_reason = duplicate_review_reason(confidence)
+        return match_id, confidence
+
+    invoice.is_duplicate = False
+    invoice.duplicate_of = None
+    invoice.duplicate_confidence = confidence or None
+    return None, confidence
+
+
+async def match_batch(
+    db: AsyncSession, sigs: Sequence[InvoiceSignature], vendors: Optional[VendorIndex] = None
+) -> List[Tuple[Optional[uuid.UUID], float]]:
+    """
+    check_duplicate() scoring for a batch of new invoices with one candidate
+    query for all their probe keys. Earlier invoices of the batch are
+    candidates for later ones. Index them with ``index_batch`` once inserted.
+    """
+    seen: Dict[Tuple[uuid.UUID, int], List[InvoiceSignature]] = {}
+    keys = sorted({k for sig in sigs for k in probe_keys(sig)})
+    if keys:
+        # = ANY(array): a big batch has more probe keys than bind parameters allowed
+        rows = await db.execute(
+            select(InvoiceDuplicateKey.block_key, Invoice.id, Invoice.client_id, Invoice.vendor_name,
+                   Invoice.total_amount, Invoice.invoice_date, Invoice.invoice_number)
+            .join(Invoice, Invoice.id == InvoiceDuplicateKey.invoice_id)
+            .where(
+                InvoiceDuplicateKey.client_id.in_({sig.client_id for sig in sigs}),
+                InvoiceDuplicateKey.block_key == any_(bindparam("keys", keys, type_=ARRAY(BigInteger))),
+                Invoice.deleted_at.is_(None),
+                Invoice.is_duplicate.is_(False),
+            )
+        )
+        for row in rows:
+            seen.setdefault((row.client_id, row.block_key), []).append(InvoiceSignature.of(row, vendors))
+
+    results = []
+    for sig in sigs:
+        candidates = {c.id: c for key in probe_keys(sig) for c in seen.get((sig.client_id, key), ())}
+        match_id, confidence = best_match(sig, candidates.values())
+        if match_id is not None and confidence >= settings.DUPLICATE_CONFIDENCE_THRESHOLD:
+            results.append((match_id, confidence))
+        else:
+            results.append((None, confidence))
+            for key in index_keys(sig):
+                seen.setdefault((sig.client_id, key), []).append(sig)
+    return results
+
+
+async def index_batch(db: AsyncSession, sigs: Sequence[InvoiceSignature], chunk_size: int = 5000) -> None:
+    """Write the blocking keys of newly inserted invoices."""
+    rows = [{"invoice_id": sig.id, "client_id": sig.client_id, "block_key": k} for sig in sigs for k in index_keys(sig)]
+    for start in range(0, len(rows), chunk_size):
+        await db.execute(insert(InvoiceDuplicateKey).on_conflict_do_nothing(), rows[start:start + chunk_size])
+
+
+async def rescan_client(db: AsyncSession, client_id: uuid.UUID, batch_size: int = 5000) -> Dict[str, int]:
+    """
+    Rebuild the blocking index for a client and re-evaluate every invoice.
+
+    Invoices are read oldest first in keyset-paginated batches; each is
+    scored against the earlier invoices sharing its keys, held in an
+    in-memory key -> signatures map, so the whole backfill is one read pass
+    plus batched writes. Run it after vendor aliases change, since keys are
+    built from canonical vendor names.
+    """
+    client = await db.get(Client, client_id)
+    vendors = await get_vendor_normalizer().get(db, client.organization_id if client else None)
+    await db.execute(delete(InvoiceDuplicateKey).where(InvoiceDuplicateKey.client_id == client_id))
+
+    seen: Dict[int, List[InvoiceSignature]] = {}
+    key_rows: List[dict] = []
+    flagged: List[dict] = []
+    cleared: List[uuid.UUID] = []
+    scanned = 0
+
+    columns = (Invoice.id, Invoice.client_id, Invoice.vendor_name, Invoice.total_amount,
+               Invoice.invoice_date, Invoice.invoice_number, Invoice.is_duplicate, Invoice.created_at)
+    last: Optional[tuple] = None
+    while True:
+        # Keyset pagination, oldest first, so writes can be interleaved safely
+        query = (
+            select(*columns)
+            .where(Invoice.client_id == client_id, Invoice.deleted_at.is_(None))
+            .order_by(Invoice.created_at, Invoice.id)
+            .limit(batch_size)
+        )
+        if last is not None:
+            query = query.where(tuple_(Invoice.created_at, Invoice.id) > last)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            break
+        last = (rows[-1].created_at, rows[-1].id)
+
+        for row in rows:
+            scanned += 1
+            sig = InvoiceSignature.of(row, vendors)
+            candidates = {c.id: c for key in probe_keys(sig) for c in seen.get(key, ())}
+            match_id, confidence = best_match(sig, candidates.values())
+
+            if match_id is not None and confidence >= settings.DUPLICATE_CONFIDENCE_THRESHOLD:
+                flagged.append({"id": sig.id, "duplicate_of": match_id, "duplicate_confidence": confidence,
+                                "review_reason": duplicate_review_reason(confidence)})
+            else:
+                if row.is_duplicate:
+                    cleared.append(sig.id)
+                # Only originals are match targets, as in check_duplicate
+                for key in index_keys(sig):
+                    seen.setdefault(key, []).append(sig)
+
+            key_rows.extend(
+                {"invoice_id": sig.id, "client_id": client_id, "block_key": k} for k in index_keys(sig)
+            )
+        if key_rows:
+            await db.execute(insert(InvoiceDuplicateKey).on_conflict_do_nothing(), key_rows)
+            key_rows = []
+
+    for start in range(0, len(flagged), batch_size):
+        chunk = flagged[start:start + batch_size]
+        # ORM bulk UPDATE by primary key (executemany)
+        await db.execute(update(Invoice), [{**item, "is_duplicate": True, "needs_review": True} for item in chunk])
+    if cleared:
+        # Withdraw the review the duplicate flag asked for; a review reason
+        # set for something else stands
+        flagged_for_review = Invoice.review_reason.startswith(DUPLICATE_REVIEW_PREFIX)
+        manual_review = bool(client and client.require_manual_review)
+        await db.execute(
+            update(Invoice)
+            .where(Invoice.id.in_(cleared))
+            .values(
+                is_duplicate=False, duplicate_of=None, duplicate_confidence=None,
+                needs_review=case((flagged_for_review, manual_review), else_=Invoice.needs_review),
+                review_reason=case((flagged_for_review, None), else_=Invoice.review_reason),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    if flagged or cleared:
+        await rebuild_rollups(db, [client_id])
+    await db.commit()
+    if client is not None:
+        # Bulk UPDATEs skip the ORM events that normally drop cached stats
+        await get_cache().invalidate_tags(invoice_tags(client_id, client.organization_id))
+
+    logger.info(f"Duplicate rescan of client {client_id}: {scanned} invoices, {len(flagged)} duplicates")
+    return {"scanned": scanned, "duplicates": len(flagged), "cleared": len(cleared)}
+
+
+async def _rescan_main(client_ids: List[str]) -> None:
+    from app.core.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        if not client_ids:
+            client_ids = [str(cid) for cid in (await db.execute(
+                select(Client.id).where(Client.deleted_at.is_(None))
+            )).scalars()]
+        for client_id in client_ids:
+            print(client_id, await rescan_client(db, uuid.UUID(client_id)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the duplicate index and re-flag duplicates")
+    parser.add_argument("client_ids", nargs="*", help="clients to rescan (default: all)")
+    asyncio.run(_rescan_main(parser.parse_args().client_ids))
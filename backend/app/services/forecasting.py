@@ -0,0 +1,248 @@
+"""
+Next-month expense forecasts for every client, computed in one pass.
+
+Monthly expense totals per client and category, without income, duplicates
+and rejected invoices, come from the rollup table in a single query (one row per series,
+months as arrays) and are laid out as a (series x month) NumPy matrix, one
+row per client total (category ``"*"``) and per client category. Forecasts
+are then a handful of array operations over the whole matrix:
+
+* base: mean of the last ``FORECAST_WINDOW_MONTHS``;
+* trend: least-squares slope over ``FORECAST_HISTORY_MONTHS``, relative to
+  the mean; beyond ``FORECAST_TREND_THRESHOLD`` per month the base is moved
+  by ``FORECAST_TREND_ADJUSTMENT`` (the "+/-10%" rule), else kept;
+* confidence: 1 - residual spread of the fit relative to the mean, scaled
+  by the share of months with any spend.
+
+Results are stored in ``expense_forecasts`` for reads.
+
+    python -m app.services.forecasting [--organization ID] [--as-of YYYY-MM-DD]
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import chain
+from typing import Optional, Dict, List, Tuple, Any
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Integer, select, delete, func, extract
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.expense_forecast import ExpenseForecast
+from app.models.invoice_rollup import InvoiceRollup
+from app.services.rollups import UNDATED
+
+logger = logging.getLogger(__name__)
+
+ALL_CATEGORIES = "*"
+TRENDS = {-1: "decreasing", 0: "stable", 1: "increasing"}
+INSERT_CHUNK = 5000
+
+# Invoices that are not spend; duplicates are subtracted through the rollups' duplicate measures
+EXCLUDED_STATUSES = ("rejected",)
+
+
+@dataclass
+class MonthlyHistory:
+    """Monthly totals as a matrix; series[i] labels row i as (client_id, organization_id, category)."""
+    series: List[Tuple[uuid.UUID, uuid.UUID, str]]
+    amounts: np.ndarray  # (len(series), months), oldest month first
+    first_month: date
+
+
+def _month_number(value: date) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def build_history(rows, first_month: date, months: int) -> MonthlyHistory:
+    """
+    Matrix from per-series rows ``(client_id, organization_id, category,
+    month_numbers, amounts)``, plus a total row per client.
+    """
+    if not rows:
+        return MonthlyHistory([], np.zeros((0, months)), first_month)
+
+    counts = np.fromiter((len(row[3]) for row in rows), dtype=np.int64, count=len(rows))
+    total = int(counts.sum())
+    columns = np.fromiter(chain.from_iterable(row[3] for row in rows), dtype=np.int64, count=total)
+    values = np.fromiter(chain.from_iterable(row[4] for row in rows), dtype=np.float64, count=total)
+    by_category = np.zeros((len(rows), months))
+    by_category[np.repeat(np.arange(len(rows)), counts), columns - _month_number(first_month)] = values
+
+    client_index: Dict[uuid.UUID, int] = {}
+    organizations: Dict[uuid.UUID, uuid.UUID] = {}
+    client_of_row = np.empty(len(rows), dtype=np.int64)
+    for i, row in enumerate(rows):
+        client_of_row[i] = client_index.setdefault(row[0], len(client_index))
+        organizations[row[0]] = row[1]
+    totals = np.zeros((len(client_index), months))
+    np.add.at(totals, client_of_row, by_category)
+
+    series = [(c, organizations[c], ALL_CATEGORIES) for c in client_index]
+    series += [(row[0], row[1], row[2]) for row in rows]
+    return MonthlyHistory(series, np.vstack([totals, by_category]), first_month)
+
+
+def forecast(
+    amounts: np.ndarray,
+    window: int = settings.FORECAST_WINDOW_MONTHS,
+    threshold: float = settings.FORECAST_TREND_THRESHOLD,
+    adjustment: float = settings.FORECAST_TREND_ADJUSTMENT,
+) -> Dict[str, np.ndarray]:
+    """Forecast the month after the last column of ``amounts`` for every row at once."""
+    months = amounts.shape[1]
+    average = amounts[:, -window:].mean(axis=1)
+    mean = amounts.mean(axis=1)
+
+    x = np.arange(months, dtype=np.float64) - (months - 1) / 2
+    centered = amounts - mean[:, None]
+    slope = centered @ x / (x @ x) if months > 1 else np.zeros(len(amounts))
+
+    positive = mean > 0
+    relative_slope = np.divide(slope, mean, out=np.zeros_like(mean), where=positive)
+    trend = np.where(relative_slope > threshold, 1, np.where(relative_slope < -threshold, -1, 0))
+    trend[~positive] = 0
+
+    residual = centered - slope[:, None] * x
+    spread = np.sqrt((residual ** 2).mean(axis=1))
+    fit = 1.0 - np.divide(spread, mean, out=np.ones_like(mean), where=positive)
+    active = (amounts > 0).sum(axis=1)
+    confidence = np.clip(fit, 0.0, 0.99) * (active / months)
+
+    return {
+        "forecast": average * (1.0 + adjustment * trend),
+        "average": average,
+        "trend": trend,
+        "trend_pct": relative_slope,
+        "confidence": confidence,
+        "active_months": active,
+    }
+
+
+def history_range(as_of: date, months: int = settings.FORECAST_HISTORY_MONTHS) -> Tuple[date, date]:
+    """(first history month, forecast month); the month of ``as_of`` is still open and left out."""
+    forecast_month = as_of.replace(day=1)
+    return forecast_month - relativedelta(months=months), forecast_month
+
+
+async def load_history(
+    db: AsyncSession,
+    as_of: date,
+    organization_id: Optional[uuid.UUID] = None,
+    months: int = settings.FORECAST_HISTORY_MONTHS,
+) -> MonthlyHistory:
+    first_month, forecast_month = history_range(as_of, months)
+    month_number = (
+        extract("year", InvoiceRollup.month) * 12 + extract("month", InvoiceRollup.month) - 1
+    ).cast(Integer).label("month_number")
+    monthly = (
+        select(
+            InvoiceRollup.client_id,
+            InvoiceRollup.organization_id,
+            InvoiceRollup.category,
+            month_number,
+            func.sum(InvoiceRollup.total_amount - InvoiceRollup.duplicate_amount).label("amount"),
+        )
+        .where(
+            InvoiceRollup.month >= first_month,
+            InvoiceRollup.month < forecast_month,
+            InvoiceRollup.month != UNDATED,
+            InvoiceRollup.status.notin_(EXCLUDED_STATUSES),
+            InvoiceRollup.is_expense.is_(True),
+        )
+        .group_by(InvoiceRollup.client_id, InvoiceRollup.organization_id, InvoiceRollup.category, InvoiceRollup.month)
+        .having(func.sum(InvoiceRollup.invoice_count - InvoiceRollup.duplicate_count) > 0)
+    )
+    if organization_id is not None:
+        monthly = monthly.where(InvoiceRollup.organization_id == organization_id)
+    monthly = monthly.subquery()
+    # One row per series with its months as arrays, so Python touches each
+    # series once and NumPy fills the matrix from flat arrays
+    query = (
+        select(
+            monthly.c.client_id,
+            monthly.c.organization_id,
+            monthly.c.category,
+            func.array_agg(monthly.c.month_number),
+            func.array_agg(monthly.c.amount),
+        )
+        .group_by(monthly.c.client_id, monthly.c.organization_id, monthly.c.category)
+    )
+    rows = (await db.execute(query)).all()
+    return build_history(rows, first_month, months)
+
+
+async def run_forecasts(
+    db: AsyncSession,
+    as_of: Optional[date] = None,
+    organization_id: Optional[uuid.UUID] = None,
+) -> Dict[str, Any]:
+    """Forecast next month for every client (of one organization, or all) and store the results."""
+    as_of = as_of or date.today()
+    _, forecast_month = history_range(as_of)
+    started = time.perf_counter()
+
+    history = await load_history(db, as_of, organization_id)
+    loaded = time.perf_counter()
+    result = forecast(history.amounts)
+    computed = time.perf_counter()
+
+    purge = delete(ExpenseForecast).where(ExpenseForecast.forecast_month == forecast_month)
+    if organization_id is not None:
+        purge = purge.where(ExpenseForecast.organization_id == organization_id)
+    await db.execute(purge)
+
+    generated_at = datetime.utcnow()
+    columns = [result[name].tolist() for name in
+               ("forecast", "average", "trend", "trend_pct", "confidence", "active_months")]
+    rows = [
+        {
+            "client_id": client_id, "organization_id": org_id, "category": category,
+            "forecast_month": forecast_month, "forecast_amount": round(amount, 2),
+            "average_amount": round(average, 2), "trend": TRENDS[trend], "trend_pct": round(trend_pct, 4),
+            "confidence": round(confidence, 4), "history_months": active, "generated_at": generated_at,
+        }
+        for (client_id, org_id, category), amount, average, trend, trend_pct, confidence, active
+        in zip(history.series, *columns)
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        await db.execute(insert(ExpenseForecast), rows[start:start + INSERT_CHUNK])
+    await db.commit()
+
+    stored = time.perf_counter()
+    logger.info(
+        f"Forecast {len(rows)} series for {forecast_month:%Y-%m}: load {loaded - started:.2f}s, "
+        f"compute {computed - loaded:.3f}s, store {stored - computed:.2f}s"
+    )
+    return {
+        "forecast_month": forecast_month.isoformat(),
+        "series": len(rows),
+        "clients": sum(1 for s in history.series if s[2] == ALL_CATEGORIES),
+        "seconds": round(stored - started, 3),
+    }
+
+
+async def _main(organization_id: Optional[str], as_of: Optional[str]) -> None:
+    from app.core.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        print(await run_forecasts(
+            db,
+            as_of=date.fromisoformat(as_of) if as_of else None,
+            organization_id=uuid.UUID(organization_id) if organization_id else None,
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast next month's expenses for every client")
+    parser.add_argument("--organization", help="only this organization (default: all)")
+    parser.add_argument("--as-of", help="forecast the month of this date (default: today)")
+    args = parser.parse_args()
+    asyncio.run(_main(args.organization, args.as_of))
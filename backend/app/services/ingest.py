@@ -0,0 +1,274 @@
+"""
+Bulk ingestion of parsed invoices and their line items.
+
+A batch is validated item by item, enriched in memory (canonical vendor
+names, categories, duplicate flags against the client's history and the
+rest of the batch), then written in one transaction with one statement per
+table instead of a round trip per ORM object:
+
+* ``copy``: ``COPY ... FROM STDIN`` (binary) through the session's asyncpg
+  connection,
+* ``insert``: multi-row ``INSERT ... VALUES``.
+
+Ids are generated here, so line items reference their invoice without
+reading anything back. If the bulk write fails, the batch is retried one
+invoice per savepoint so only the offending items are reported as errors;
+an invoice flagged as a duplicate of a batch item that then failed is
+scored again against what was written.
+
+Core writes skip the ORM events, so the derived data the events maintain
+(rollups, search vectors, duplicate index, cached stats) is brought up to
+date explicitly in the same transaction.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional, Dict, List, Sequence, Tuple, Any
+import logging
+import time
+import uuid
+
+import asyncpg
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import get_cache, invoice_tags
+from app.core.config import settings
+from app.models.client import Client
+from app.models.invoice import Invoice, InvoiceLineItem
+from app.schemas.invoice import InvoiceIngestItem
+from app.services.categorizer import CategorizeInput, get_categorizer_cache
+from app.services.duplicates import InvoiceSignature, duplicate_review_reason, index_batch, match_batch
+from app.services.rollups import add_inserted_invoices
+from app.services.search import reindex_statement
+from app.services.vendor_normalizer import get_vendor_normalizer
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("copy", "insert")
+
+# Every column a row sets explicitly: COPY and Core INSERTs don't apply the
+# models' Python-side defaults
+INVOICE_COLUMNS = (
+    "id", "client_id", "organization_id", "category_id", "invoice_number", "invoice_date", "due_date",
+    "po_number", "vendor_name", "vendor_tax_id", "vendor_email", "subtotal", "tax_amount",
+    "discount_amount", "shipping_amount", "total_amount", "currency", "category", "is_expense",
+    "account_code", "source", "source_reference", "source_sender", "ocr_confidence", "ocr_raw_text",
+    "needs_review", "review_reason", "status", "accounting_synced", "duplicate_of", "is_duplicate",
+    "duplicate_confidence", "notes", "tags", "payment_status", "created_at", "updated_at",
+)
+LINE_ITEM_COLUMNS = (
+    "id", "invoice_id", "line_number", "description", "quantity", "unit", "unit_price", "total_price",
+    "tax_rate", "tax_amount", "category", "account_code", "created_at", "updated_at",
+)
+
+
+@dataclass
+class IngestResult:
+    index: int
+    id: Optional[uuid.UUID] = None
+    error: Optional[str] = None
+    duplicate_of: Optional[uuid.UUID] = None
+    line_items: int = 0
+
+
+# COPY runs on the raw asyncpg connection, so its errors are not wrapped in DBAPIError
+WRITE_ERRORS = (DBAPIError, asyncpg.PostgresError)
+
+
+def _write_error_message(error: Exception) -> str:
+    return str(error.orig) if isinstance(error, DBAPIError) else str(error)
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'item'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def _invoice_row(item: InvoiceIngestItem, client_id: uuid.UUID, organization_id: uuid.UUID,
+                 now: datetime) -> Dict[str, Any]:
+    row = item.model_dump(exclude={"client_id", "line_items"})
+    row.update(
+        id=uuid.uuid4(), client_id=client_id, organization_id=organization_id, category_id=None,
+        discount_amount=0.0, shipping_amount=0.0, account_code=None, review_reason=None,
+        status="pending", accounting_synced=False, duplicate_of=None, is_duplicate=False,
+        duplicate_confidence=None, tags=[], payment_status="unpaid", created_at=now, updated_at=now,
+    )
+    return row
+
+
+def _line_rows(item: InvoiceIngestItem, invoice_id: uuid.UUID, now: datetime) -> List[Dict[str, Any]]:
+    rows = []
+    for number, line in enumerate(item.line_items, start=1):
+        row = line.model_dump()
+        if row["total_price"] is None:
+            row["total_price"] = round(line.quantity * line.unit_price, 2)
+        row.update(id=uuid.uuid4(), invoice_id=invoice_id, line_number=number, created_at=now, updated_at=now)
+        rows.append(row)
+    return rows
+
+
+async def _write(db: AsyncSession, invoices: List[Dict[str, Any]], lines: List[Dict[str, Any]],
+                 method: str) -> None:
+    if method == "copy":
+        # The session has already queried on this connection, so its
+        # transaction is open and COPY runs inside it
+        connection = await (await db.connection()).get_raw_connection()
+        driver = connection.driver_connection
+        await driver.copy_records_to_table(
+            Invoice.__tablename__, columns=INVOICE_COLUMNS,
+            records=[tuple(row[c] for c in INVOICE_COLUMNS) for row in invoices],
+        )
+        if lines:
+            await driver.copy_records_to_table(
+                InvoiceLineItem.__tablename__, columns=LINE_ITEM_COLUMNS,
+                records=[tuple(row[c] for c in LINE_ITEM_COLUMNS) for row in lines],
+            )
+    else:
+        await db.execute(insert(Invoice.__table__), invoices)
+        if lines:
+            await db.execute(insert(InvoiceLineItem.__table__), lines)
+
+
+def _flag_duplicate(row: Dict[str, Any], result: IngestResult, match_id: Optional[uuid.UUID],
+                    confidence: float, needs_review: bool) -> None:
+    """Set (or clear) the duplicate fields of a row from a match_batch result."""
+    row.update(duplicate_confidence=confidence or None, is_duplicate=False, duplicate_of=None,
+               needs_review=needs_review, review_reason=None)
+    result.duplicate_of = match_id
+    if match_id is not None:
+        row.update(is_duplicate=True, duplicate_of=match_id, needs_review=True,
+                   review_reason=duplicate_review_reason(confidence))
+
+
+async def ingest_invoices(
+    db: AsyncSession,
+    organization_id: uuid.UUID,
+    items: Sequence[Dict[str, Any]],
+    client_id: Optional[uuid.UUID] = None,
+    method: str = settings.INGEST_METHOD,
+) -> List[IngestResult]:
+    """
+    Validate and insert a batch of parsed invoices, committing once.
+
+    ``client_id`` pins every item to one client (client users); otherwise
+    each item names a client of ``organization_id``. Returns one result per
+    item, in order.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown ingest method: {method}")
+    started = time.perf_counter()
+    results = [IngestResult(index=i) for i in range(len(items))]
+
+    parsed: List[Tuple[int, InvoiceIngestItem]] = []
+    for i, raw in enumerate(items):
+        try:
+            item = InvoiceIngestItem.model_validate(raw)
+        except ValidationError as e:
+            results[i].error = _validation_message(e)
+            continue
+        if client_id is not None:
+            if item.client_id is not None and item.client_id != client_id:
+                results[i].error = "client_id: not your client"
+                continue
+            item.client_id = client_id
+        elif item.client_id is None:
+            results[i].error = "client_id: required"
+            continue
+        parsed.append((i, item))
+
+    clients = {
+        row.id: row for row in await db.execute(
+            select(Client.id, Client.auto_categorize, Client.require_manual_review)
+            .where(Client.id.in_({item.client_id for _, item in parsed}),
+                   Client.organization_id == organization_id, Client.is_active.is_(True),
+                   Client.deleted_at.is_(None))
+        )
+    } if parsed else {}
+
+    now = datetime.utcnow()
+    vendors = await get_vendor_normalizer().get(db, organization_id)
+    categorizer = await get_categorizer_cache().get(db, organization_id) \
+        if settings.ENABLE_ML_CATEGORIZATION else None
+
+    batch: List[Tuple[int, Dict[str, Any], List[Dict[str, Any]]]] = []
+    for i, item in parsed:
+        client = clients.get(item.client_id)
+        if client is None:
+            results[i].error = "client_id: client not found"
+            continue
+        row = _invoice_row(item, item.client_id, organization_id, now)
+        row["vendor_name"] = vendors.canonical_name(row["vendor_name"])
+        if categorizer is not None and client.auto_categorize and row["category"] is None:
+            text = " ".join([row["notes"] or ""] + [line.description for line in item.line_items])
+            match = categorizer.categorize(CategorizeInput(row["vendor_name"], text, row["total_amount"]))
+            if match is not None:
+                row.update(category_id=match.category_id, category=match.name, account_code=match.account_code)
+        if client.require_manual_review:
+            row["needs_review"] = True
+        batch.append((i, row, _line_rows(item, row["id"], now)))
+
+    signatures = [InvoiceSignature.of(SimpleNamespace(**row), vendors) for _, row, _ in batch]
+    # needs_review before duplicate flagging, to restore when a flag is withdrawn
+    needs_review = [bool(row["needs_review"]) for _, row, _ in batch]
+    if settings.ENABLE_DUPLICATE_DETECTION and batch:
+        matches = await match_batch(db, signatures, vendors)
+        for (i, row, _), (match_id, confidence), review in zip(batch, matches, needs_review):
+            _flag_duplicate(row, results[i], match_id, confidence, review)
+
+    try:
+        async with db.begin_nested():
+            await _write(db, [row for _, row, _ in batch], [l for _, _, lines in batch for l in lines], method)
+        written = batch
+    except WRITE_ERRORS as e:
+        # Find the offending items: one savepoint per invoice
+        logger.warning(f"Bulk ingest of {len(batch)} invoices failed ({_write_error_message(e)}); "
+                       f"retrying one by one")
+        written = []
+        written_sigs: List[InvoiceSignature] = []
+        failed_ids = set()
+        for entry, sig, review in zip(batch, signatures, needs_review):
+            i, row, lines = entry
+            if row["duplicate_of"] in failed_ids:
+                # Its match was an earlier item of the batch that was not written:
+                # score it again against the history and the items written so far
+                candidates = [s for s, (_, r, _) in zip(written_sigs, written)
+                              if s.client_id == sig.client_id and not r["is_duplicate"]]
+                match_id, confidence = (await match_batch(db, candidates + [sig], vendors))[-1]
+                _flag_duplicate(row, results[i], match_id, confidence, review)
+            try:
+                async with db.begin_nested():
+                    await _write(db, [row], lines, "insert")
+                written.append(entry)
+                written_sigs.append(sig)
+            except WRITE_ERRORS as item_error:
+                results[i].error = _write_error_message(item_error)
+                results[i].duplicate_of = None
+                failed_ids.add(row["id"])
+
+    rows = [row for _, row, _ in written]
+    if rows:
+        ids = [row["id"] for row in rows]
+        await add_inserted_invoices(db, rows)
+        await db.execute(reindex_statement(ids))
+        if settings.ENABLE_DUPLICATE_DETECTION:
+            written_ids = set(ids)
+            await index_batch(db, [sig for sig in signatures if sig.id in written_ids])
+        for i, row, lines in written:
+            results[i].id = row["id"]
+            results[i].line_items = len(lines)
+    await db.commit()
+
+    tags = set()
+    for row in rows:
+        tags |= invoice_tags(row["client_id"], organization_id)
+    await get_cache().invalidate_tags(tags)
+
+    line_count = sum(r.line_items for r in results)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Ingested {len(rows)}/{len(items)} invoices ({line_count} line items) "
+                f"via {method} in {elapsed:.2f}s")
+    return results
@@ -0,0 +1,128 @@
+"""
+Keyset-paginated invoice listings.
+
+Pages are ordered by (``invoice_listing_date``, id) and continue from an
+opaque cursor holding the last row's key, so fetching page 5000 is the same
+index range scan as page 1 (OFFSET would read and discard every row before
+it). Each filter combination the UI uses has a matching partial index (see
+models/invoice.py).
+
+Totals are optional: ``estimate`` reads the planner's row estimate for the
+filtered query, ``exact`` runs a real count(*) and grows with the result.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Dict, List, Tuple, Any
+import base64
+import json
+import uuid
+
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.invoice import Invoice, invoice_listing_date
+
+LIST_COLUMNS = (
+    Invoice.id, Invoice.client_id, Invoice.invoice_number, Invoice.invoice_date, Invoice.due_date,
+    Invoice.vendor_name, Invoice.total_amount, Invoice.currency, Invoice.category, Invoice.status,
+    Invoice.needs_review, Invoice.is_duplicate, Invoice.source, Invoice.original_file_name,
+    Invoice.created_at,
+)
+
+COUNT_MODES = ("none", "estimate", "exact")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class InvoiceFilters:
+    organization_id: uuid.UUID
+    client_id: Optional[uuid.UUID] = None
+    status: Optional[str] = None
+    needs_review: Optional[bool] = None
+    source: Optional[str] = None
+    category: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+    def conditions(self) -> List:
+        # Written to match the partial index predicates
+        conditions = [Invoice.deleted_at.is_(None), Invoice.organization_id == self.organization_id]
+        if self.client_id is not None:
+            conditions.append(Invoice.client_id == self.client_id)
+        if self.status is not None:
+            conditions.append(Invoice.status == self.status)
+        if self.needs_review is not None:
+            conditions.append(Invoice.needs_review.is_(self.needs_review))
+        if self.source is not None:
+            conditions.append(Invoice.source == self.source)
+        if self.category is not None:
+            conditions.append(Invoice.category == self.category)
+        if self.date_from is not None:
+            conditions.append(invoice_listing_date >= self.date_from)
+        if self.date_to is not None:
+            conditions.append(invoice_listing_date <= self.date_to)
+        return conditions
+
+
+def encode_cursor(listing_date: date, invoice_id: uuid.UUID) -> str:
+    raw = json.dumps([listing_date.isoformat(), str(invoice_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        listing_date, invoice_id = json.loads(raw)
+        return date.fromisoformat(listing_date), uuid.UUID(invoice_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+
+async def list_invoices(
+    db: AsyncSession,
+    filters: InvoiceFilters,
+    limit: int,
+    cursor: Optional[str] = None,
+    ascending: bool = False,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of invoices and the cursor of the next page (None on the last page)."""
+    key = tuple_(invoice_listing_date, Invoice.id)
+    query = select(*LIST_COLUMNS, invoice_listing_date.label("listing_date")).where(*filters.conditions())
+    if cursor is not None:
+        after = tuple_(*decode_cursor(cursor))
+        query = query.where(key > after if ascending else key < after)
+    if ascending:
+        query = query.order_by(invoice_listing_date, Invoice.id)
+    else:
+        query = query.order_by(invoice_listing_date.desc(), Invoice.id.desc())
+
+    # One extra row tells whether another page follows
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].listing_date, rows[-1].id)
+    return [row._asdict() for row in rows], next_cursor
+
+
+async def count_invoices(db: AsyncSession, filters: InvoiceFilters, mode: str) -> Optional[int]:
+    """Total for ``filters``: None for mode "none", else the planner estimate or an exact count."""
+    if mode == "none":
+        return None
+    if mode == "exact":
+        query = select(func.count()).select_from(Invoice).where(*filters.conditions())
+        return (await db.execute(query)).scalar_one()
+
+    # The planner's row estimate for the filtered SELECT. EXPLAIN takes no
+    # bind parameters, so values are rendered as literals (escaped by the
+    # dialect) and the statement goes straight to the driver.
+    query = select(Invoice.id).where(*filters.conditions())
+    compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    connection = await db.connection()
+    plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,139 @@
+"""
+Field extraction from OCR lines.
+
+Produces the ``ocr_structured_data`` layout stored on Invoice:
+
+    {"invoice_number": {"value": "INV-001", "confidence": 0.95}, ...}
+
+Each field's confidence is the OCR confidence of the line it came from.
+"""
+from datetime import date
+from typing import Optional, Dict, Any, List, Sequence
+import re
+
+from dateutil import parser as date_parser
+
+# Header fields identify the document; total fields are the amounts we book
+HEADER_FIELDS = ("vendor_name", "invoice_number", "invoice_date")
+TOTAL_FIELDS = ("total_amount",)
+
+_AMOUNT = r"([-+]?\d{1,3}(?:[,.\s]\d{3})*(?:[.,]\d{2})|[-+]?\d+(?:[.,]\d{2})?)"
+
+FIELD_PATTERNS = {
+    "invoice_number": re.compile(
+        r"\b(?:invoice|inv|bill|receipt)\s*(?:no\.?|number|num|#)?\s*[:#]?\s*([A-Z0-9][A-Z0-9\-/]{2,})",
+        re.IGNORECASE,
+    ),
+    "invoice_date": re.compile(
+        r"\b(?:invoice\s+date|date(?:\s+of\s+issue)?|issued)\s*[:\-]?\s*"
+        r"(\d{1,4}[./\-]\d{1,2}[./\-]\d{1,4}|\d{1,2}\s+[A-Za-z]{3,9}\.?\s+\d{2,4}|[A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{2,4})",
+        re.IGNORECASE,
+    ),
+    "due_date": re.compile(
+        r"\b(?:due\s+date|payment\s+due|due)\s*[:\-]?\s*"
+        r"(\d{1,4}[./\-]\d{1,2}[./\-]\d{1,4}|\d{1,2}\s+[A-Za-z]{3,9}\.?\s+\d{2,4}|[A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{2,4})",
+        re.IGNORECASE,
+    ),
+    "total_amount": re.compile(
+        r"\b(?:grand\s+total|total\s+due|amount\s+due|balance\s+due|total)\b[^0-9\-+]{0,15}" + _AMOUNT,
+        re.IGNORECASE,
+    ),
+    "subtotal": re.compile(r"\bsub\s*-?\s*total\b[^0-9\-+]{0,15}" + _AMOUNT, re.IGNORECASE),
+    "tax_amount": re.compile(r"\b(?:tax|vat|gst|hst)\b[^0-9\-+%]{0,15}" + _AMOUNT, re.IGNORECASE),
+    "po_number": re.compile(r"\b(?:p\.?o\.?|purchase\s+order)\s*(?:no\.?|number|#)?\s*[:#]?\s*([A-Z0-9\-]{3,})", re.IGNORECASE),
+}
+
+_CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR"}
+_CURRENCY_CODES = re.compile(r"\b(USD|EUR|GBP|CAD|AUD|INR|JPY|CHF|NZD|ZAR)\b")
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """Parse '1.234,56', '1,234.56' or '1234.56' into a float."""
+    cleaned = re.sub(r"[^\d,.\-+]", "", text)
+    if not cleaned:
+        return None
+    if "," in cleaned and "." in cleaned:
+        if cleaned.rfind(",") > cleaned.rfind("."):
+            cleaned = cleaned.replace(".", "").replace(",", ".")
+        else:
+            cleaned = cleaned.replace(",", "")
+    elif "," in cleaned:
+        head, _, tail = cleaned.rpartition(",")
+        cleaned = f"{head.replace(',', '')}.{tail}" if len(tail) == 2 else cleaned.replace(",", "")
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def parse_date(text: str) -> Optional[date]:
+    try:
+        return date_parser.parse(text, fuzzy=True).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def _field(value: Any, confidence: float) -> Dict[str, Any]:
+    return {"value": value, "confidence": round(float(confidence), 4)}
+
+
+def extract_fields(lines: Sequence[Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Extract invoice fields from OCR lines (anything with ``text`` and
+    ``confidence`` attributes, in reading order).
+    """
+    fields: Dict[str, Dict[str, Any]] = {}
+    texts: List[str] = [line.text for line in lines]
+
+    for line in lines:
+        for name, pattern in FIELD_PATTERNS.items():
+            # Keep the first match, except totals: the last one is the grand total
+            if name in fields and name != "total_amount":
+                continue
+            match = pattern.search(line.text)
+            if not match:
+                continue
+            raw = match.group(1).strip()
+            if name in ("total_amount", "subtotal", "tax_amount"):
+                if name == "total_amount" and re.search(r"\bsub", line.text, re.IGNORECASE):
+                    continue
+                value = parse_amount(raw)
+                if value is None:
+                    continue
+            elif name in ("invoice_date", "due_date"):
+                parsed = parse_date(raw)
+                if parsed is None:
+                    continue
+                value = parsed.isoformat()
+            else:
+                value = raw
+            fields[name] = _field(value, line.confidence)
+
+    # Vendor: first substantial line that is not a field label
+    for line in lines[:8]:
+        text = line.text.strip()
+        if len(text) >= 3 and not any(p.search(text) for p in FIELD_PATTERNS.values()) \
+                and not re.fullmatch(r"[\d\W]+", text) and not re.search(r"\binvoice\b", text, re.IGNORECASE):
+            fields["vendor_name"] = _field(text, line.confidence * 0.9)
+            break
+
+    joined = "\n".join(texts)
+    code = _CURRENCY_CODES.search(joined)
+    if code:
+        fields["currency"] = _field(code.group(1), 0.9)
+    else:
+        for symbol, currency in _CURRENCY_SYMBOLS.items():
+            if symbol in joined:
+                fields["currency"] = _field(currency, 0.8)
+                break
+
+    return fields
+
+
+def fields_complete(fields: Dict[str, Dict[str, Any]], threshold: float,
+                    required: Sequence[str] = HEADER_FIELDS + TOTAL_FIELDS) -> bool:
+    """True when every required field was found with confidence >= threshold."""
+    return all(
+        name in fields and fields[name].get("confidence", 0.0) >= threshold
+        for name in required
+    )
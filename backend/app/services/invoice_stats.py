@@ -0,0 +1,205 @@
+"""
+Invoice aggregates behind the dashboard and stats endpoints.
+
+Reads come from the rollup table (services/rollups.py), so their cost
+depends on the number of client-months, not on invoice history. Date
+ranges that do not start and end on month boundaries fall back to the
+invoices table, since rollups only resolve whole months.
+
+Every function returns plain JSON-able dicts so results can go through the
+read-through cache (app/core/cache.py) unchanged.
+"""
+from datetime import date
+from typing import Optional, Dict, Any, List
+import uuid
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.client import Client
+from app.models.invoice import Invoice
+from app.models.invoice_rollup import InvoiceRollup
+from app.services.rollups import UNDATED, UNCATEGORIZED
+
+TREND_MONTHS = 12
+TOP_N = 10
+
+
+def _scope(organization_id: Optional[uuid.UUID], client_id: Optional[uuid.UUID],
+           date_from: Optional[date], date_to: Optional[date]) -> List:
+    conditions = [Invoice.deleted_at.is_(None)]
+    if organization_id is not None:
+        conditions.append(Invoice.organization_id == organization_id)
+    if client_id is not None:
+        conditions.append(Invoice.client_id == client_id)
+    if date_from is not None:
+        conditions.append(Invoice.invoice_date >= date_from)
+    if date_to is not None:
+        conditions.append(Invoice.invoice_date <= date_to)
+    return conditions
+
+
+def _month_aligned(date_from: Optional[date], date_to: Optional[date]) -> bool:
+    return (date_from is None or date_from.day == 1) and \
+        (date_to is None or (date_to + relativedelta(days=1)).day == 1)
+
+
+def _rollup_scope(organization_id: Optional[uuid.UUID], client_id: Optional[uuid.UUID],
+                  date_from: Optional[date], date_to: Optional[date]) -> List:
+    conditions = []
+    if organization_id is not None:
+        conditions.append(InvoiceRollup.organization_id == organization_id)
+    if client_id is not None:
+        conditions.append(InvoiceRollup.client_id == client_id)
+    if date_from is not None or date_to is not None:
+        # Undated invoices never match a date range
+        conditions.append(InvoiceRollup.month != UNDATED)
+    if date_from is not None:
+        conditions.append(InvoiceRollup.month >= date_from)
+    if date_to is not None:
+        conditions.append(InvoiceRollup.month <= date_to)
+    return conditions
+
+
+def _summary(by_status, by_category, monthly) -> Dict[str, Any]:
+    return {
+        "invoices": sum(row[1] for row in by_status),
+        "total_amount": round(sum(row[2] for row in by_status), 2),
+        "needs_review": sum(row[3] for row in by_status),
+        "duplicates": sum(row[4] for row in by_status),
+        "by_status": {row[0]: {"count": row[1], "total_amount": round(row[2], 2)} for row in by_status},
+        "by_category": [
+            {"category": row[0] or "Uncategorized", "count": row[1], "total_amount": round(row[2], 2)}
+            for row in by_category
+        ],
+        "monthly": [
+            {"month": row[0].strftime("%Y-%m"), "count": row[1], "total_amount": round(row[2], 2)}
+            for row in monthly
+        ],
+    }
+
+
+def _trend_start(date_from: Optional[date], date_to: Optional[date]) -> date:
+    trend_start = (date_to or date.today()).replace(day=1) - relativedelta(months=TREND_MONTHS - 1)
+    return max(trend_start, date_from or trend_start)
+
+
+async def summarize(
+    db: AsyncSession,
+    organization_id: Optional[uuid.UUID] = None,
+    client_id: Optional[uuid.UUID] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Dict[str, Any]:
+    """Counts and amounts by status and category, plus a monthly trend."""
+    if not _month_aligned(date_from, date_to):
+        return await _summarize_invoices(db, organization_id, client_id, date_from, date_to)
+    conditions = _rollup_scope(organization_id, client_id, date_from, date_to)
+    count = func.sum(InvoiceRollup.invoice_count)
+    amount = func.coalesce(func.sum(InvoiceRollup.total_amount), 0.0)
+
+    by_status = (await db.execute(
+        select(
+            InvoiceRollup.status, count, amount,
+            func.sum(InvoiceRollup.needs_review_count),
+            func.sum(InvoiceRollup.duplicate_count),
+        )
+        .where(*conditions)
+        .group_by(InvoiceRollup.status)
+        .having(count > 0)
+    )).all()
+
+    by_category = (await db.execute(
+        select(InvoiceRollup.category, count, amount)
+        .where(*conditions)
+        .group_by(InvoiceRollup.category)
+        .having(count > 0)
+        .order_by(amount.desc())
+        .limit(TOP_N)
+    )).all()
+    by_category = [(row[0] if row[0] != UNCATEGORIZED else None, row[1], row[2]) for row in by_category]
+
+    monthly = (await db.execute(
+        select(InvoiceRollup.month, count, amount)
+        .where(*conditions, InvoiceRollup.month >= _trend_start(date_from, date_to),
+               InvoiceRollup.month != UNDATED)
+        .group_by(InvoiceRollup.month)
+        .having(count > 0)
+        .order_by(InvoiceRollup.month)
+    )).all()
+
+    return _summary(by_status, by_category, monthly)
+
+
+async def _summarize_invoices(
+    db: AsyncSession,
+    organization_id: Optional[uuid.UUID],
+    client_id: Optional[uuid.UUID],
+    date_from: Optional[date],
+    date_to: Optional[date],
+) -> Dict[str, Any]:
+    """summarize() straight from the invoices table, for day-granular date ranges."""
+    conditions = _scope(organization_id, client_id, date_from, date_to)
+
+    by_status = (await db.execute(
+        select(
+            Invoice.status,
+            func.count(),
+            func.coalesce(func.sum(Invoice.total_amount), 0.0),
+            func.count().filter(Invoice.needs_review.is_(True)),
+            func.count().filter(Invoice.is_duplicate.is_(True)),
+        )
+        .where(*conditions)
+        .group_by(Invoice.status)
+    )).all()
+
+    by_category = (await db.execute(
+        select(Invoice.category, func.count(), func.coalesce(func.sum(Invoice.total_amount), 0.0))
+        .where(*conditions)
+        .group_by(Invoice.category)
+        .order_by(func.sum(Invoice.total_amount).desc().nulls_last())
+        .limit(TOP_N)
+    )).all()
+
+    month = func.date_trunc("month", Invoice.invoice_date)
+    monthly = (await db.execute(
+        select(month, func.count(), func.coalesce(func.sum(Invoice.total_amount), 0.0))
+        .where(*conditions, Invoice.invoice_date >= _trend_start(date_from, date_to))
+        .group_by(month)
+        .order_by(month)
+    )).all()
+
+    return _summary(by_status, by_category, monthly)
+
+
+async def top_clients(db: AsyncSession, organization_id: uuid.UUID, limit: int = TOP_N) -> List[Dict[str, Any]]:
+    count = func.sum(InvoiceRollup.invoice_count)
+    rows = (await db.execute(
+        select(
+            Client.id,
+            Client.name,
+            count,
+            func.coalesce(func.sum(InvoiceRollup.total_amount), 0.0),
+            func.sum(InvoiceRollup.needs_review_count),
+        )
+        .join(InvoiceRollup, InvoiceRollup.client_id == Client.id)
+        .where(Client.organization_id == organization_id)
+        .group_by(Client.id, Client.name)
+        .having(count > 0)
+        .order_by(count.desc())
+        .limit(limit)
+    )).all()
+    return [
+        {"client_id": str(row[0]), "name": row[1], "invoices": row[2],
+         "total_amount": round(row[3], 2), "needs_review": row[4]}
+        for row in rows
+    ]
+
+
+async def active_client_count(db: AsyncSession, organization_id: uuid.UUID) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(Client)
+        .where(Client.organization_id == organization_id, Client.is_active.is_(True),
+               Client.deleted_at.is_(None))
+    )).scalar_one()
@@ -0,0 +1,440 @@
+"""
+IMAP access for client mailbox monitoring.
+
+``MailboxConfig`` is one client's mailbox as stored in ``Client.email_config``
+(credentials decrypted). ``ImapPool`` keeps a bounded set of logged-in
+connections per server: at most EMAIL_MAX_CONNECTIONS_PER_HOST are open to
+one host at a time, in use or pooled, and a pooled connection is reused by
+the next poll of the same account instead of paying TCP + TLS + LOGIN again.
+
+Each folder has a UID watermark ``(uidvalidity, last_uid)``; a poll asks
+the server for ``UID last_uid+1:*`` only, so a mailbox with thousands of
+old messages costs the same to check as an empty one. A changed
+UIDVALIDITY means the server renumbered the folder and the watermark is
+started over.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.utils import parseaddr
+from typing import Optional, Dict, List, Tuple, Any, AsyncIterator
+import asyncio
+import contextlib
+import json
+import logging
+import re
+import ssl
+import time
+import uuid
+
+import aioimaplib
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Folder -> (uidvalidity, last processed uid); kept in email_config
+WATERMARKS_FIELD = "uid_watermarks"
+
+_UIDVALIDITY = re.compile(rb"UIDVALIDITY (\d+)")
+_FETCH_UID = re.compile(rb"UID (\d+)")
+_FETCH_START = re.compile(rb"\d+ FETCH \(")
+
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+class MailboxError(Exception):
+    """An IMAP command failed; the connection should not be reused."""
+
+
+@dataclass
+class MailboxConfig:
+    client_id: uuid.UUID
+    organization_id: uuid.UUID
+    host: str
+    port: int
+    ssl: bool
+    username: str
+    password: str
+    folders: List[str]
+    interval: float  # seconds between checks
+    senders: List[str] = field(default_factory=list)  # only mail from these, if set
+    watermarks: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    last_check: Optional[datetime] = None
+
+    @property
+    def host_key(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    @property
+    def account_key(self) -> Tuple[str, int, bool, str]:
+        return self.host, self.port, self.ssl, self.username
+
+    @classmethod
+    def from_client(cls, client, credentials: Optional[str]) -> Optional["MailboxConfig"]:
+        """
+        Build from a Client row (or a row with the same columns) and its
+        decrypted credentials. Credentials are either JSON
+        ``{"username": ..., "password": ...}`` or the bare password, with the
+        username in email_config (or the client's email). None when the
+        mailbox can't be polled over IMAP.
+        """
+        config = client.email_config or {}
+        host = config.get("host")
+        if not host or not credentials:
+            return None
+        try:
+            secret = json.loads(credentials)
+        except ValueError:
+            secret = None
+        if isinstance(secret, dict):
+            username, password = secret.get("username"), secret.get("password")
+        else:
+            username, password = None, credentials
+        username = username or config.get("username") or client.email
+        if not username or not password:
+            return None
+
+        use_ssl = bool(config.get("ssl", True))
+        minutes = client.email_check_frequency or settings.EMAIL_POLL_INTERVAL / 60
+        return cls(
+            client_id=client.id,
+            organization_id=client.organization_id,
+            host=host,
+            port=int(config.get("port") or (993 if use_ssl else 143)),
+            ssl=use_ssl,
+            username=username,
+            password=password,
+            folders=list(config.get("folders") or ["INBOX"]),
+            interval=max(float(minutes) * 60, 1.0),
+            senders=[s.lower() for s in client.monitored_email_addresses or []],
+            watermarks={
+                folder: (int(mark[0]), int(mark[1]))
+                for folder, mark in (config.get(WATERMARKS_FIELD) or {}).items()
+            },
+            last_check=parse_last_check(client.email_last_check),
+        )
+
+
+def parse_last_check(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+@dataclass
+class FetchedMessage:
+    folder: str
+    uid: int
+    raw: bytes
+
+
+@dataclass
+class Attachment:
+    filename: str
+    content_type: str
+    data: bytes
+
+
+def imap_date(day: date) -> str:
+    return f"{day.day}-{_MONTHS[day.month - 1]}-{day.year}"
+
+
+def sender_criteria(senders: List[str]) -> List[str]:
+    """SEARCH criteria matching mail from any of ``senders`` (nested ORs)."""
+    if not senders:
+        return []
+    criteria = ["FROM", f'"{senders[-1]}"']
+    for sender in reversed(senders[:-1]):
+        criteria = ["OR", "FROM", f'"{sender}"'] + criteria
+    return criteria
+
+
+def parse_fetch(lines: List[Any]) -> List[Tuple[int, bytes]]:
+    """(uid, body) pairs from a ``UID FETCH ... (UID BODY.PEEK[])`` response."""
+    messages = []
+    uid: Optional[int] = None
+    body: Optional[bytes] = None
+    for line in lines:
+        if isinstance(line, bytearray):
+            body = bytes(line)
+            continue
+        if _FETCH_START.match(line):
+            if uid is not None and body is not None:
+                messages.append((uid, body))
+            uid, body = None, None
+        # Servers put UID before or after the literal
+        match = _FETCH_UID.search(line)
+        if match and uid is None:
+            uid = int(match.group(1))
+    if uid is not None and body is not None:
+        messages.append((uid, body))
+    return messages
+
+
+def search_uids(lines: List[Any]) -> List[int]:
+    """UIDs of a SEARCH response; the last line is the command's completion text."""
+    uids = []
+    for line in lines[:-1]:
+        tokens = line.split()
+        if tokens and tokens[0].upper() == b"SEARCH":
+            tokens = tokens[1:]
+        uids.extend(int(token) for token in tokens if token.isdigit())
+    return uids
+
+
+def _response_code(lines: List[Any], pattern) -> Optional[int]:
+    for line in lines:
+        if isinstance(line, bytes):
+            match = pattern.search(line)
+            if match:
+                return int(match.group(1))
+    return None
+
+
+def extract_attachments(raw: bytes) -> Tuple[EmailMessage, List[Attachment]]:
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    attachments = []
+    for part in message.iter_attachments():
+        filename = part.get_filename()
+        if not filename:
+            continue
+        data = part.get_content()
+        if isinstance(data, str):
+            data = data.encode()
+        attachments.append(Attachment(filename, part.get_content_type(), data))
+    return message, attachments
+
+
+def message_sender(message: EmailMessage) -> Optional[str]:
+    return parseaddr(str(message.get("From", "")))[1].lower() or None
+
+
+class ImapConnection:
+    """One logged-in IMAP connection and the folder it has selected."""
+
+    def __init__(self, mailbox: MailboxConfig, timeout: float = settings.EMAIL_IMAP_TIMEOUT):
+        self.account_key = mailbox.account_key
+        self.timeout = timeout
+        self.selected: Optional[str] = None
+        self.uidvalidity: Optional[int] = None
+        self.last_used = time.monotonic()
+        self.broken = False
+        ssl_context = ssl.create_default_context() if mailbox.ssl else None
+        self.imap = aioimaplib.IMAP4(
+            host=mailbox.host, port=mailbox.port, timeout=timeout,
+            conn_lost_cb=self._connection_lost, ssl_context=ssl_context,
+        )
+
+    def _connection_lost(self, exc: Optional[Exception]) -> None:
+        self.broken = True
+
+    @classmethod
+    async def open(cls, mailbox: MailboxConfig) -> "ImapConnection":
+        connection = cls(mailbox)
+        try:
+            await connection.imap.wait_hello_from_server()
+            connection._check(await connection.imap.login(mailbox.username, mailbox.password), "LOGIN")
+        except BaseException:
+            await connection.close()
+            raise
+        return connection
+
+    @property
+    def supports_idle(self) -> bool:
+        return self.imap.has_capability("IDLE")
+
+    @property
+    def usable(self) -> bool:
+        return not self.broken and self.imap.get_state() in (aioimaplib.AUTH, aioimaplib.SELECTED)
+
+    def _check(self, response, command: str):
+        if response.result != "OK":
+            self.broken = True
+            detail = response.lines[-1] if response.lines else b""
+            raise MailboxError(f"{command} failed: {detail!r}")
+        return response
+
+    async def select(self, folder: str) -> int:
+        """Select ``folder`` (no-op if already selected); returns its UIDVALIDITY."""
+        if self.selected != folder:
+            response = self._check(await self.imap.select(f'"{folder}"'), f"SELECT {folder}")
+            self.selected = folder
+            self.uidvalidity = _response_code(response.lines, _UIDVALIDITY) or 0
+        return self.uidvalidity
+
+    async def highest_uid(self) -> int:
+        """Highest UID in the selected folder (0 when empty)."""
+        response = self._check(await self.imap.uid_search("UID", "*", charset=None), "UID SEARCH")
+        return max(search_uids(response.lines), default=0)
+
+    async def new_uids(self, mailbox: MailboxConfig, folder: str) -> Tuple[Tuple[int, int], List[int]]:
+        """
+        (baseline watermark, uids above it), oldest first. The baseline is
+        the stored watermark. For a folder seen for the first time (or
+        renumbered) only mail from the last check's day (or today) is picked
+        up rather than the whole history: the baseline is just below the
+        oldest such UID, so mail beyond the first batch is still above the
+        watermark on the next check, or the highest UID when there is none.
+        """
+        uidvalidity = await self.select(folder)
+        mark = mailbox.watermarks.get(folder)
+        known = mark is not None and mark[0] == uidvalidity
+        if known:
+            criteria = ["UID", f"{mark[1] + 1}:*"]
+        else:
+            since = (mailbox.last_check or datetime.utcnow()).date()
+            criteria = ["SINCE", imap_date(since)]
+        response = self._check(
+            await self.imap.uid_search(*criteria, *sender_criteria(mailbox.senders), charset=None),
+            "UID SEARCH",
+        )
+        uids = sorted(search_uids(response.lines))
+        if known:
+            # "n:*" always matches the highest UID, even below n
+            return mark, [uid for uid in uids if uid > mark[1]]
+        if uids:
+            return (uidvalidity, uids[0] - 1), uids
+        return (uidvalidity, await self.highest_uid()), uids
+
+    async def fetch(self, uids: List[int]) -> List[Tuple[int, bytes]]:
+        if not uids:
+            return []
+        uid_set = ",".join(str(uid) for uid in uids)
+        # PEEK leaves \\Seen alone: the mailbox still looks unread to its owner
+        response = self._check(await self.imap.uid("fetch", uid_set, "(UID BODY.PEEK[])"), "UID FETCH")
+        return parse_fetch(response.lines)
+
+    async def fetch_new(
+        self, mailbox: MailboxConfig, folder: str, limit: int = settings.EMAIL_BATCH_SIZE
+    ) -> Tuple[Tuple[int, int], List[FetchedMessage], bool]:
+        """
+        Up to ``limit`` new messages of ``folder``: (watermark once they are
+        processed, messages, more_pending).
+        """
+        baseline, uids = await self.new_uids(mailbox, folder)
+        batch = uids[:limit]
+        messages = sorted(await self.fetch(batch))
+        self.last_used = time.monotonic()
+        # Messages expunged between SEARCH and FETCH are simply skipped
+        watermark = (baseline[0], max(baseline[1], batch[-1])) if batch else baseline
+        return watermark, [FetchedMessage(folder, uid, raw) for uid, raw in messages], len(uids) > limit
+
+    async def wait_for_mail(self, timeout: float = settings.EMAIL_IDLE_RENEW_SECONDS) -> bool:
+        """
+        IDLE on the selected folder until the server reports new mail (True)
+        or ``timeout`` passes (False; re-issuing IDLE keeps it alive).
+        """
+        idle = await self.imap.idle_start(timeout=timeout)
+        try:
+            while True:
+                push = await self.imap.wait_server_push(timeout=timeout + self.timeout)
+                if push == aioimaplib.STOP_WAIT_SERVER_PUSH:
+                    return False
+                if any(isinstance(line, bytes) and line.endswith(b"EXISTS") for line in push):
+                    return True
+        except BaseException:
+            self.broken = True
+            raise
+        finally:
+            if not self.broken:
+                self.imap.idle_done()
+                self._check(await asyncio.wait_for(idle, self.timeout), "IDLE")
+            self.last_used = time.monotonic()
+
+    async def close(self) -> None:
+        with contextlib.suppress(Exception):
+            if not self.broken and self.imap.get_state() != aioimaplib.LOGOUT:
+                await asyncio.wait_for(self.imap.logout(), self.timeout)
+        with contextlib.suppress(Exception):
+            if self.imap.protocol.transport is not None:
+                self.imap.protocol.transport.close()
+
+
+class _HostPool:
+    def __init__(self, max_connections: int):
+        self.slots = asyncio.Semaphore(max_connections)
+        self.max_connections = max_connections
+        self.in_use = 0
+        self.idle: List[ImapConnection] = []  # least recently used first
+
+
+class ImapPool:
+    """Logged-in IMAP connections, at most ``max_per_host`` open per server."""
+
+    def __init__(self, max_per_host: int = settings.EMAIL_MAX_CONNECTIONS_PER_HOST,
+                 idle_seconds: float = settings.EMAIL_CONNECTION_IDLE_SECONDS):
+        self.max_per_host = max_per_host
+        self.idle_seconds = idle_seconds
+        self._hosts: Dict[Tuple[str, int], _HostPool] = {}
+        self.opened = 0
+        self.reused = 0
+
+    def _host(self, mailbox: MailboxConfig) -> _HostPool:
+        host = self._hosts.get(mailbox.host_key)
+        if host is None:
+            host = self._hosts[mailbox.host_key] = _HostPool(self.max_per_host)
+        return host
+
+    async def _take(self, host: _HostPool, mailbox: MailboxConfig) -> ImapConnection:
+        now = time.monotonic()
+        for connection in reversed(host.idle):
+            if connection.account_key == mailbox.account_key:
+                host.idle.remove(connection)
+                if connection.usable and now - connection.last_used < self.idle_seconds:
+                    self.reused += 1
+                    return connection
+                await connection.close()
+                break
+        # Room for a new connection: close the least recently used pooled one
+        # of another account if the host is at its limit
+        while host.idle and host.in_use + len(host.idle) >= host.max_connections:
+            await host.idle.pop(0).close()
+        connection = await ImapConnection.open(mailbox)
+        self.opened += 1
+        return connection
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, mailbox: MailboxConfig) -> AsyncIterator[ImapConnection]:
+        host = self._host(mailbox)
+        async with host.slots:
+            host.in_use += 1
+            connection = None
+            try:
+                connection = await self._take(host, mailbox)
+                yield connection
+            except BaseException:
+                if connection is not None:
+                    connection.broken = True
+                raise
+            finally:
+                host.in_use -= 1
+                if connection is not None:
+                    if connection.usable:
+                        connection.last_used = time.monotonic()
+                        host.idle.append(connection)
+                    else:
+                        await connection.close()
+
+    async def prune(self) -> int:
+        """Close pooled connections unused for ``idle_seconds``. Returns how many."""
+        cutoff = time.monotonic() - self.idle_seconds
+        closed = 0
+        for host in self._hosts.values():
+            stale = [c for c in host.idle if c.last_used < cutoff or not c.usable]
+            host.idle = [c for c in host.idle if c not in stale]
+            for connection in stale:
+                await connection.close()
+            closed += len(stale)
+        return closed
+
+    async def close(self) -> None:
+        for host in self._hosts.values():
+            idle, host.idle = host.idle, []
+            for connection in idle:
+                await connection.close()
@@ -0,0 +1,256 @@
+"""
+Content-addressed OCR result cache.
+
+The same PDF often arrives through email, WhatsApp and a manual upload. OCR
+output is stored once per (file SHA-256, OCR config version) in the
+``ocr_cache`` table, with a small per-process LRU in front of it, so every
+copy after the first skips OCR entirely. The table is bounded by
+``OCR_CACHE_MAX_ENTRIES``; least recently used rows are evicted.
+
+The config version covers the client's confidence threshold too: with
+OCR_EARLY_EXIT a stricter threshold reads more pages, and with
+OCR_ENGINE=hybrid it escalates more lines to the stronger engine, so it
+must not be served a result read under a lenient one.
+
+Hits are counted in process and written to the table in one UPDATE every
+``HIT_FLUSH_EVERY`` hits (or with the next store), so a hit in the process
+LRU costs no database round trip. Hits not flushed when a process exits are
+lost, which only understates ``hit_count`` and ``last_used_at``.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+import hashlib
+import json
+import logging
+
+from sqlalchemy import select, update, delete, func, values, column, String, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.ocr_cache import OCRCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Bump when OCR/parsing code changes in a way that alters results
+OCR_PIPELINE_VERSION = 1
+
+# Run eviction every N stores rather than on every write
+EVICTION_CHECK_EVERY = 100
+
+# Write hit counts to the table every N hits rather than on every hit
+HIT_FLUSH_EVERY = 100
+
+
+def config_version(threshold: Optional[float] = None) -> str:
+    """Short digest of everything that influences OCR output for a confidence threshold."""
+    if threshold is None:
+        threshold = settings.OCR_CONFIDENCE_THRESHOLD
+    relevant = {
+        "pipeline": OCR_PIPELINE_VERSION,
+        "engine": settings.OCR_ENGINE,
+        "hybrid_engines": settings.OCR_HYBRID_ENGINES if settings.OCR_ENGINE == "hybrid" else None,
+        "languages": sorted(settings.OCR_LANGUAGES),
+        "image_max_size": settings.IMAGE_MAX_SIZE,
+        "image_dpi": settings.IMAGE_DPI,
+        "image_enhance": settings.IMAGE_ENHANCE,
+        "image_deskew": settings.IMAGE_DESKEW,
+        "image_binarize": settings.IMAGE_BINARIZE,
+        "pdf_text_layer": settings.PDF_TEXT_LAYER_ENABLED,
+        "pdf_text_min_chars": settings.PDF_TEXT_MIN_CHARS,
+        "early_exit": settings.OCR_EARLY_EXIT,
+        # Early exit stops reading once the fields clear the caller's threshold,
+        # and the hybrid cascade escalates the lines below it
+        "threshold": round(threshold, 4) if settings.OCR_EARLY_EXIT or settings.OCR_ENGINE == "hybrid" else None,
+    }
+    blob = json.dumps(relevant, sort_keys=True).encode()
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+@dataclass
+class CachedOCR:
+    ocr_raw_text: str
+    ocr_structured_data: Dict[str, Any]
+    ocr_confidence: float
+    ocr_engine_used: str
+    page_count: int = 1
+    # Per-run timing/escalation figures; not stored in the cache
+    stats: Optional[Dict[str, Any]] = None
+
+
+class OCRResultCache:
+    """Two-level (process LRU + database) cache of OCR results."""
+
+    def __init__(self, memory_entries: int = settings.OCR_CACHE_MEMORY_ENTRIES,
+                 max_entries: int = settings.OCR_CACHE_MAX_ENTRIES):
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.version = config_version()
+        self._versions: Dict[float, str] = {}
+        self._memory: "OrderedDict[Tuple[str, str], CachedOCR]" = OrderedDict()
+        self._stores = 0
+        self._pending_hits: Dict[Tuple[str, str], int] = {}  # (content hash, version) -> hits not yet written
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def version_for(self, threshold: Optional[float]) -> str:
+        """Config version of results read with ``threshold`` (None: OCR_CONFIDENCE_THRESHOLD)."""
+        if threshold is None:
+            return self.version
+        version = self._versions.get(threshold)
+        if version is None:
+            version = self._versions[threshold] = config_version(threshold)
+        return version
+
+    def _remember(self, key: Tuple[str, str], value: CachedOCR) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, db: AsyncSession, content_hash: str,
+                  threshold: Optional[float] = None) -> Optional[CachedOCR]:
+        key = (content_hash, self.version_for(threshold))
+        cached = self._memory.get(key)
+        if cached is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            await self._count_hit(db, key)
+            return cached
+
+        entry = (await db.execute(
+            select(OCRCacheEntry).where(
+                OCRCacheEntry.content_hash == content_hash,
+                OCRCacheEntry.config_version == key[1],
+            )
+        )).scalar_one_or_none()
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        cached = CachedOCR(
+            ocr_raw_text=entry.ocr_raw_text or "",
+            ocr_structured_data=entry.ocr_structured_data or {},
+            ocr_confidence=entry.ocr_confidence or 0.0,
+            ocr_engine_used=entry.ocr_engine_used,
+            page_count=entry.page_count or 1,
+        )
+        self._remember(key, cached)
+        await self._count_hit(db, key)
+        return cached
+
+    async def _count_hit(self, db: AsyncSession, key: Tuple[str, str]) -> None:
+        self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+        if sum(self._pending_hits.values()) >= HIT_FLUSH_EVERY:
+            await self.flush_hits(db)
+
+    async def flush_hits(self, db: AsyncSession) -> int:
+        """Write the hits counted since the last flush in one UPDATE. Returns rows updated."""
+        if not self._pending_hits:
+            return 0
+        pending, self._pending_hits = self._pending_hits, {}
+        hits = values(
+            column("content_hash", String), column("config_version", String), column("hits", Integer),
+            name="hits",
+        ).data([(content_hash, version, count) for (content_hash, version), count in pending.items()])
+        result = await db.execute(
+            update(OCRCacheEntry)
+            .where(
+                OCRCacheEntry.content_hash == hits.c.content_hash,
+                OCRCacheEntry.config_version == hits.c.config_version,
+            )
+            .values(hit_count=OCRCacheEntry.hit_count + hits.c.hits, last_used_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    async def put(self, db: AsyncSession, content_hash: str, value: CachedOCR,
+                  threshold: Optional[float] = None) -> None:
+        key = (content_hash, self.version_for(threshold))
+        size = len((value.ocr_raw_text or "").encode()) + len(json.dumps(value.ocr_structured_data or {}))
+        stmt = insert(OCRCacheEntry).values(
+            content_hash=content_hash,
+            config_version=key[1],
+            ocr_engine_used=value.ocr_engine_used,
+            ocr_raw_text=value.ocr_raw_text,
+            ocr_structured_data=value.ocr_structured_data,
+            ocr_confidence=value.ocr_confidence,
+            page_count=value.page_count,
+            size_bytes=size,
+        )
+        # Two workers finishing the same file race here; first one wins
+        await db.execute(stmt.on_conflict_do_nothing(index_elements=["content_hash", "config_version"]))
+        self._remember(key, value)
+        await self.flush_hits(db)
+
+        self._stores += 1
+        if self._stores % EVICTION_CHECK_EVERY == 0:
+            await self.evict(db)
+
+    async def evict(self, db: AsyncSession) -> int:
+        """Trim the table to ``max_entries`` by dropping least recently used rows."""
+        total = (await db.execute(select(func.count()).select_from(OCRCacheEntry))).scalar_one()
+        excess = total - self.max_entries
+        if excess <= 0:
+            return 0
+        oldest = (
+            select(OCRCacheEntry.id)
+            .order_by(OCRCacheEntry.last_used_at)
+            .limit(excess)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            delete(OCRCacheEntry)
+            .where(OCRCacheEntry.id.in_(oldest))
+            .execution_options(synchronize_session=False)
+        )
+        logger.info(f"OCR cache evicted {result.rowcount} entries")
+        return result.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process."""
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "config_version": self.version,
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "unflushed_hits": sum(self._pending_hits.values()),
+        }
+
+    async def table_stats(self, db: AsyncSession) -> Dict[str, Any]:
+        """Size and lifetime hit counts of the shared table (every config version and threshold)."""
+        row = (await db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(OCRCacheEntry.size_bytes), 0),
+                func.coalesce(func.sum(OCRCacheEntry.hit_count), 0),
+            )
+        )).one()
+        entries, size_bytes, hits = row
+        # Every entry was one miss (the OCR run that produced it)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "size_bytes": size_bytes,
+            "lifetime_hits": hits,
+            "lifetime_hit_rate": round(hits / (hits + entries), 4) if entries else 0.0,
+        }
+
+
+_ocr_cache: Optional[OCRResultCache] = None
+
+
+def get_ocr_cache() -> OCRResultCache:
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = OCRResultCache()
+    return _ocr_cache
@@ -0,0 +1,457 @@
+"""
+OCR execution engine.
+
+OCR models are expensive to load (PaddleOCR/EasyOCR take seconds and
+hundreds of MB), so they are loaded once per worker process by the pool
+initializer and kept warm for the life of the process. Pages of a document
+are fanned out across ``OCR_MAX_WORKERS`` processes and awaited from the
+event loop without blocking it.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# OCR_LANGUAGES uses ISO 639-1 codes; Tesseract wants its own names
+TESSERACT_LANGUAGES = {"en": "eng", "es": "spa", "fr": "fra", "de": "deu", "it": "ita", "pt": "por"}
+
+
+@dataclass
+class OCRLine:
+    text: str
+    confidence: float
+    bbox: Tuple[float, float, float, float]  # x0, y0, x1, y1 in page pixels
+
+
+@dataclass
+class OCRPage:
+    page_number: int
+    engine: str
+    lines: List[OCRLine] = field(default_factory=list)
+    width: int = 0
+    height: int = 0
+    elapsed_ms: float = 0.0
+    preprocess_ms: float = 0.0
+    # Hybrid cascade bookkeeping
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+    escalated_lines: int = 0
+
+    @property
+    def text(self) -> str:
+        return "\n".join(line.text for line in self.lines)
+
+    @property
+    def confidence(self) -> float:
+        """Character-weighted mean confidence of the page."""
+        total = sum(len(line.text) for line in self.lines)
+        if not total:
+            return 0.0
+        return sum(line.confidence * len(line.text) for line in self.lines) / total
+
+
+# ---------------------------------------------------------------------------
+# Engine adapters (run inside worker processes)
+# ---------------------------------------------------------------------------
+
+def _bbox_from_points(points) -> Tuple[float, float, float, float]:
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return float(min(xs)), float(min(ys)), float(max(xs)), float(max(ys))
+
+
+class _PaddleAdapter:
+    name = "paddleocr"
+
+    def __init__(self, languages: Sequence[str], use_gpu: bool):
+        from paddleocr import PaddleOCR
+        self._ocr = PaddleOCR(use_angle_cls=True, lang=languages[0], use_gpu=use_gpu, show_log=False)
+
+    def recognize(self, image: np.ndarray) -> List[OCRLine]:
+        result = self._ocr.ocr(image, cls=True) or []
+        lines = []
+        for block in result:
+            for points, (text, confidence) in block or []:
+                lines.append(OCRLine(text, float(confidence), _bbox_from_points(points)))
+        return lines
+
+
+class _EasyOCRAdapter:
+    name = "easyocr"
+
+    def __init__(self, languages: Sequence[str], use_gpu: bool):
+        import easyocr
+        self._reader = easyocr.Reader(list(languages), gpu=use_gpu, verbose=False)
+
+    def recognize(self, image: np.ndarray) -> List[OCRLine]:
+        return [
+            OCRLine(text, float(confidence), _bbox_from_points(points))
+            for points, text, confidence in self._reader.readtext(image)
+        ]
+
+
+class _TesseractAdapter:
+    name = "tesseract"
+
+    def __init__(self, languages: Sequence[str], use_gpu: bool):
+        import pytesseract
+        self._pytesseract = pytesseract
+        self._lang = "+".join(TESSERACT_LANGUAGES.get(lang, lang) for lang in languages)
+        pytesseract.get_tesseract_version()  # fail fast if the binary is missing
+
+    def recognize(self, image: np.ndarray) -> List[OCRLine]:
+        data = self._pytesseract.image_to_data(
+            image, lang=self._lang, output_type=self._pytesseract.Output.DICT
+        )
+        # Group words into lines so results line up with the other engines
+        grouped: Dict[Tuple[int, int, int], List[int]] = {}
+        for i, word in enumerate(data["text"]):
+            if word.strip() and float(data["conf"][i]) >= 0:
+                key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+                grouped.setdefault(key, []).append(i)
+
+        lines = []
+        for indexes in grouped.values():
+            x0 = min(data["left"][i] for i in indexes)
+            y0 = min(data["top"][i] for i in indexes)
+            x1 = max(data["left"][i] + data["width"][i] for i in indexes)
+            y1 = max(data["top"][i] + data["height"][i] for i in indexes)
+            text = " ".join(data["text"][i] for i in indexes)
+            confidence = sum(float(data["conf"][i]) for i in indexes) / len(indexes) / 100.0
+            lines.append(OCRLine(text, confidence, (float(x0), float(y0), float(x1), float(y1))))
+        return lines
+
+
+ADAPTERS = {
+    "paddleocr": _PaddleAdapter,
+    "easyocr": _EasyOCRAdapter,
+    "tesseract": _TesseractAdapter,
+}
+
+HYBRID_ENGINE = "hybrid"
+
+# Padding (pixels) around a low-confidence line when re-reading it
+CASCADE_CROP_PADDING = 6
+
+# Per-process state, populated by _init_worker
+_ENGINES: Dict[str, Any] = {}
+_WORKER_CONFIG: Dict[str, Any] = {}
+_PREPROCESSOR: Optional[Any] = None
+
+
+def _get_adapter(name: str):
+    adapter = _ENGINES.get(name)
+    if adapter is None:
+        started = time.perf_counter()
+        adapter = ADAPTERS[name](_WORKER_CONFIG["languages"], _WORKER_CONFIG["use_gpu"])
+        _ENGINES[name] = adapter
+        logger.info(f"[pid {os.getpid()}] loaded {name} in {time.perf_counter() - started:.1f}s")
+    return adapter
+
+
+def _init_worker(engines: Sequence[str], languages: Sequence[str], use_gpu: bool) -> None:
+    """Pool initializer: load every configured engine once per process."""
+    global _PREPROCESSOR
+    from app.services.image_preprocessing import ImagePreprocessor
+
+    _WORKER_CONFIG.update(languages=list(languages), use_gpu=use_gpu)
+    _PREPROCESSOR = ImagePreprocessor()
+    for name in engines:
+        try:
+            _get_adapter(name)
+        except Exception as e:
+            # Leave it unloaded; the first page routed to it will raise
+            logger.error(f"[pid {os.getpid()}] failed to load {name}: {e}")
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _preprocess(images: List[np.ndarray], preprocess: bool) -> Tuple[List[np.ndarray], float]:
+    """Preprocess pages as one batch; returns them and the milliseconds spent per page."""
+    # Preprocess in the worker rather than the app process: it parallelises
+    # with the OCR work and the page crosses the process boundary only once
+    if not preprocess or _PREPROCESSOR is None:
+        return images, 0.0
+    started = time.perf_counter()
+    images = _PREPROCESSOR.run(images).images
+    return images, (time.perf_counter() - started) * 1000 / max(len(images), 1)
+
+
+def _read_page(engine: str, page_number: int, image: np.ndarray, preprocess_ms: float) -> OCRPage:
+    started = time.perf_counter()
+    lines = _get_adapter(engine).recognize(image)
+    height, width = image.shape[:2]
+    return OCRPage(
+        page_number=page_number,
+        engine=engine,
+        lines=lines,
+        width=width,
+        height=height,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+        preprocess_ms=preprocess_ms,
+    )
+
+
+def _reread(adapter, image: np.ndarray, line: OCRLine) -> Optional[OCRLine]:
+    """Run ``adapter`` on the region of ``line``; None if it read nothing."""
+    height, width = image.shape[:2]
+    x0, y0, x1, y1 = line.bbox
+    crop = image[
+        max(0, int(y0) - CASCADE_CROP_PADDING):min(height, int(y1) + CASCADE_CROP_PADDING),
+        max(0, int(x0) - CASCADE_CROP_PADDING):min(width, int(x1) + CASCADE_CROP_PADDING),
+    ]
+    if crop.size == 0:
+        return None
+    lines = adapter.recognize(np.ascontiguousarray(crop))
+    if not lines:
+        return None
+    text = " ".join(item.text for item in lines)
+    chars = sum(len(item.text) for item in lines) or 1
+    confidence = sum(item.confidence * len(item.text) for item in lines) / chars
+    return OCRLine(text, confidence, line.bbox)
+
+
+def _read_page_cascade(
+    engines: Sequence[str],
+    page_number: int,
+    image: np.ndarray,
+    preprocess_ms: float,
+    threshold: float,
+) -> OCRPage:
+    """
+    Hybrid OCR: read the page with the cheapest engine, then re-read only
+    the lines below ``threshold`` with each stronger engine in turn, keeping
+    whichever reading is more confident.
+    """
+    stage_ms: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    lines = _get_adapter(engines[0]).recognize(image)
+    stage_ms[engines[0]] = (time.perf_counter() - started) * 1000
+
+    escalated = 0
+    for name in engines[1:]:
+        started = time.perf_counter()
+        adapter = _get_adapter(name)
+        if not lines:
+            # The cheap engine found nothing at all; give the page to the stronger one
+            lines = adapter.recognize(image)
+            escalated += 1
+        else:
+            for i, line in enumerate(lines):
+                if line.confidence >= threshold:
+                    continue
+                escalated += 1
+                better = _reread(adapter, image, line)
+                if better is not None and better.confidence > line.confidence:
+                    lines[i] = better
+        stage_ms[name] = (time.perf_counter() - started) * 1000
+
+    height, width = image.shape[:2]
+    return OCRPage(
+        page_number=page_number,
+        engine=HYBRID_ENGINE,
+        lines=lines,
+        width=width,
+        height=height,
+        elapsed_ms=sum(stage_ms.values()),
+        preprocess_ms=preprocess_ms,
+        stage_ms=stage_ms,
+        escalated_lines=escalated,
+    )
+
+
+def _recognize_pages(
+    engines: Sequence[str],
+    cascade: bool,
+    page_numbers: Sequence[int],
+    images: List[np.ndarray],
+    preprocess: bool,
+    threshold: float,
+) -> List[OCRPage]:
+    """
+    Worker entry point: preprocess a run of pages in one batch, then read
+    them one by one, with the cascade or with ``engines[0]`` alone.
+    """
+    images, preprocess_ms = _preprocess(images, preprocess)
+    if cascade:
+        return [_read_page_cascade(engines, number, image, preprocess_ms, threshold)
+                for number, image in zip(page_numbers, images)]
+    return [_read_page(engines[0], number, image, preprocess_ms) for number, image in zip(page_numbers, images)]
+
+
+@dataclass
+class EngineStats:
+    """Running totals for tuning the hybrid cascade."""
+    pages: int = 0
+    lines: int = 0
+    escalated_lines: int = 0
+    preprocess_ms: float = 0.0
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, page: OCRPage) -> None:
+        self.pages += 1
+        self.lines += len(page.lines)
+        self.escalated_lines += page.escalated_lines
+        self.preprocess_ms += page.preprocess_ms
+        for stage, ms in (page.stage_ms or {page.engine: page.elapsed_ms}).items():
+            self.stage_ms[stage] = self.stage_ms.get(stage, 0.0) + ms
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "lines": self.lines,
+            "escalated_lines": self.escalated_lines,
+            "escalation_rate": round(self.escalated_lines / self.lines, 4) if self.lines else 0.0,
+            "avg_preprocess_ms": round(self.preprocess_ms / self.pages, 1) if self.pages else 0.0,
+            "avg_stage_ms": {
+                stage: round(ms / self.pages, 1) for stage, ms in self.stage_ms.items()
+            } if self.pages else {},
+        }
+
+
+# ---------------------------------------------------------------------------
+# Pool front-end (runs in the asyncio app)
+# ---------------------------------------------------------------------------
+
+def configured_engines() -> List[str]:
+    if settings.OCR_ENGINE == HYBRID_ENGINE:
+        return list(settings.OCR_HYBRID_ENGINES)
+    return [settings.OCR_ENGINE]
+
+
+class OCREngine:
+    """Process pool of warm OCR models."""
+
+    def __init__(
+        self,
+        engines: Optional[Sequence[str]] = None,
+        max_workers: int = settings.OCR_MAX_WORKERS,
+        languages: Sequence[str] = tuple(settings.OCR_LANGUAGES),
+        use_gpu: bool = settings.OCR_USE_GPU,
+        cascade: Optional[bool] = None,
+    ):
+        self.engines = list(engines or configured_engines())
+        unknown = [name for name in self.engines if name not in ADAPTERS]
+        if unknown:
+            raise ValueError(f"Unsupported OCR engine(s): {', '.join(unknown)}")
+        self.default_engine = self.engines[0]
+        # Cascade when several engines are configured (OCR_ENGINE=hybrid), cheapest first
+        self.cascade = len(self.engines) > 1 if cascade is None else cascade
+        self.stats = EngineStats()
+        self.max_workers = max_workers
+        self.languages = list(languages)
+        self.use_gpu = use_gpu
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Start the pool and wait until every worker has its models loaded."""
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            # spawn: PaddlePaddle/torch are not fork-safe once initialised
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.engines, self.languages, self.use_gpu),
+            )
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            pids = await asyncio.gather(
+                *(loop.run_in_executor(self._pool, _ping) for _ in range(self.max_workers))
+            )
+            logger.info(
+                f"OCR pool ready: {len(set(pids))} workers, engines={self.engines}, "
+                f"warm-up {time.perf_counter() - started:.1f}s"
+            )
+
+    async def shutdown(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+    async def recognize_page(
+        self,
+        image: np.ndarray,
+        page_number: int = 1,
+        engine: Optional[str] = None,
+        preprocess: bool = True,
+        threshold: Optional[float] = None,
+    ) -> OCRPage:
+        """
+        OCR a single page image (HxW or HxWxC uint8).
+
+        In cascade mode (and unless ``engine`` forces a single engine), lines
+        below ``threshold`` are escalated to the stronger engines.
+        """
+        return (await self._run_batch([page_number], [image], engine, preprocess, threshold))[0]
+
+    async def recognize_pages(
+        self,
+        images: Sequence[np.ndarray],
+        engine: Optional[str] = None,
+        preprocess: bool = True,
+        threshold: Optional[float] = None,
+    ) -> List[OCRPage]:
+        """
+        OCR all pages of a document in parallel, returned in page order.
+
+        The pages are split into one contiguous run per worker; each worker
+        preprocesses its run as a batch before reading it.
+        """
+        size = max(1, -(-len(images) // self.max_workers))
+        runs = await asyncio.gather(*(
+            self._run_batch(list(range(start + 1, start + size + 1)), list(images[start:start + size]),
+                            engine, preprocess, threshold)
+            for start in range(0, len(images), size)
+        ))
+        return [page for run in runs for page in run]
+
+    async def _run_batch(
+        self,
+        page_numbers: List[int],
+        images: List[np.ndarray],
+        engine: Optional[str],
+        preprocess: bool,
+        threshold: Optional[float],
+    ) -> List[OCRPage]:
+        if self._pool is None:
+            await self.start()
+        cascade = self.cascade and engine is None
+        pages = await asyncio.get_running_loop().run_in_executor(
+            self._pool, _recognize_pages, self.engines if engine is None else [engine], cascade,
+            page_numbers, images, preprocess,
+            settings.OCR_CONFIDENCE_THRESHOLD if threshold is None else threshold,
+        )
+        for page in pages:
+            self.stats.record(page)
+        return pages
+
+
+_ocr_engine: Optional[OCREngine] = None
+
+
+def get_ocr_engine() -> OCREngine:
+    """Process-wide OCR engine for the configured OCR_ENGINE."""
+    global _ocr_engine
+    if _ocr_engine is None:
+        _ocr_engine = OCREngine()
+    return _ocr_engine
+
+
+async def shutdown_ocr_engine() -> None:
+    if _ocr_engine is not None:
+        await _ocr_engine.shutdown()
@@ -0,0 +1,229 @@
+"""
+OCR pipeline for stored invoice files.
+
+    file -> PDF text layer / page images -> OCR engine -> field extraction -> Invoice
+
+Results are cached by file content hash (see ocr_cache), so a document that
+was already read once is never OCR'd again.
+"""
+from typing import Optional, Dict, List
+import asyncio
+import hashlib
+import logging
+import uuid
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.client import Client
+from app.models.invoice import Invoice, InvoiceLineItem
+from app.models.processing_queue import ProcessingQueue
+from app.services.categorizer import CategorizeInput, apply_category, get_categorizer_cache
+from app.services.duplicates import check_duplicate
+from app.services.invoice_parser import extract_fields, fields_complete, parse_date
+from app.services.ocr_cache import CachedOCR, get_ocr_cache
+from app.services.ocr_engine import EngineStats, OCRPage, get_ocr_engine
+from app.services.pdf_raster import iter_page_windows, page_sizes
+from app.services.pdf_text import TEXT_LAYER_ENGINE, extract_text_layer
+from app.services.vendor_normalizer import get_vendor_normalizer
+from app.workers.runner import register
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(settings.UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_pdf(path: str, file_type: Optional[str]) -> bool:
+    return (file_type or "").endswith("pdf") or path.lower().endswith(".pdf")
+
+
+def _load_image(path: str) -> np.ndarray:
+    from PIL import Image
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def engine_label(pages: List[OCRPage]) -> str:
+    """Value for Invoice.ocr_engine_used, e.g. ``text_layer`` or ``text_layer+paddleocr``."""
+    engines = sorted({page.engine for page in pages}, key=lambda e: (e != TEXT_LAYER_ENGINE, e))
+    return "+".join(engines)[:50] or settings.OCR_ENGINE
+
+
+def combine_pages(pages: List[OCRPage]) -> CachedOCR:
+    """Merge per-page OCR output into the invoice-level result."""
+    lines = [line for page in pages for line in page.lines]
+    total_chars = sum(len(line.text) for line in lines)
+    confidence = (
+        sum(line.confidence * len(line.text) for line in lines) / total_chars if total_chars else 0.0
+    )
+    stats = EngineStats()
+    for page in pages:
+        if page.engine != TEXT_LAYER_ENGINE:
+            stats.record(page)
+    return CachedOCR(
+        ocr_raw_text="\n\n".join(page.text for page in pages),
+        ocr_structured_data=extract_fields(lines),
+        ocr_confidence=round(confidence, 4),
+        ocr_engine_used=engine_label(pages),
+        page_count=len(pages),
+        stats=stats.as_dict(),
+    )
+
+
+async def run_ocr(
+    path: str,
+    file_type: Optional[str],
+    threshold: float = settings.OCR_CONFIDENCE_THRESHOLD,
+) -> CachedOCR:
+    """
+    Read a file without consulting the cache.
+
+    PDF pages with a usable text layer are read directly. The remaining
+    (scanned) pages are rendered and OCR'd a window at a time within
+    OCR_PAGE_MEMORY_BUDGET_MB, stopping early once the header and total
+    fields have been found with confidence >= ``threshold``.
+    """
+    engine = get_ocr_engine()
+    if not _is_pdf(path, file_type):
+        image = await asyncio.to_thread(_load_image, path)
+        return combine_pages([await engine.recognize_page(image, threshold=threshold)])
+
+    if settings.PDF_TEXT_LAYER_ENABLED:
+        layer = await asyncio.to_thread(extract_text_layer, path)
+    else:
+        layer = [None] * len(await asyncio.to_thread(page_sizes, path))
+    done: Dict[int, OCRPage] = {n: page for n, page in enumerate(layer, start=1) if page is not None}
+    scanned = [n for n, page in enumerate(layer, start=1) if page is None]
+
+    windows = iter_page_windows(path, scanned)
+    ocr_pages = 0
+    while True:
+        if settings.OCR_EARLY_EXIT and done:
+            lines = [line for n in sorted(done) for line in done[n].lines]
+            if fields_complete(extract_fields(lines), threshold):
+                break
+        window = await asyncio.to_thread(next, windows, None)
+        if window is None:
+            break
+        numbers = [number for number, _ in window]
+        results = await engine.recognize_pages([image for _, image in window], threshold=threshold)
+        del window  # release the rendered pages before the next window
+        for number, page in zip(numbers, results):
+            page.page_number = number
+            done[number] = page
+        ocr_pages += len(numbers)
+    windows.close()
+
+    skipped = len(layer) - len(done)
+    logger.info(
+        f"{path}: {len(done) - ocr_pages} text-layer page(s), {ocr_pages} OCR'd"
+        + (f", {skipped} skipped after early exit" if skipped else "")
+    )
+    return combine_pages([done[n] for n in sorted(done)])
+
+
+async def ocr_invoice(
+    db, invoice: Invoice, threshold: float = settings.OCR_CONFIDENCE_THRESHOLD
+) -> CachedOCR:
+    """OCR an invoice's original file, reusing a cached result for identical content."""
+    if not invoice.file_hash:
+        invoice.file_hash = await asyncio.to_thread(_hash_file, invoice.original_file_path)
+
+    cache = get_ocr_cache() if settings.OCR_CACHE_ENABLED else None
+    if cache is not None:
+        cached = await cache.get(db, invoice.file_hash, threshold)
+        if cached is not None:
+            logger.info(f"OCR cache hit for invoice {invoice.id} ({invoice.file_hash[:12]})")
+            return cached
+
+    result = await run_ocr(invoice.original_file_path, invoice.file_type, threshold)
+    if cache is not None:
+        await cache.put(db, invoice.file_hash, result, threshold)
+    return result
+
+
+def apply_ocr_result(invoice: Invoice, result: CachedOCR, threshold: float) -> None:
+    """Copy OCR output and extracted fields onto the invoice."""
+    invoice.ocr_raw_text = result.ocr_raw_text
+    invoice.ocr_structured_data = result.ocr_structured_data
+    invoice.ocr_confidence = result.ocr_confidence
+    invoice.ocr_engine_used = result.ocr_engine_used
+
+    fields = result.ocr_structured_data
+    value = lambda name: fields.get(name, {}).get("value")  # noqa: E731
+
+    for name in ("invoice_number", "vendor_name", "po_number", "currency",
+                 "subtotal", "tax_amount", "total_amount"):
+        if value(name) is not None:
+            setattr(invoice, name, value(name))
+    for name in ("invoice_date", "due_date"):
+        if value(name):
+            setattr(invoice, name, parse_date(value(name)))
+
+    low = sorted(
+        name for name, field in fields.items() if field.get("confidence", 0.0) < threshold
+    )
+    missing = [name for name in ("vendor_name", "total_amount", "invoice_date") if name not in fields]
+    if result.ocr_confidence < threshold or low or missing:
+        invoice.needs_review = True
+        reasons = []
+        if result.ocr_confidence < threshold:
+            reasons.append(f"Low OCR confidence ({result.ocr_confidence:.0%})")
+        if missing:
+            reasons.append(f"Missing: {', '.join(missing)}")
+        elif low:
+            reasons.append(f"Low confidence fields: {', '.join(low)}")
+        invoice.review_reason = "; ".join(reasons)[:255]
+
+
+@register("ocr")
+async def handle_ocr_job(job: ProcessingQueue) -> dict:
+    """Queue handler: OCR the invoice named by ``job.source_reference``."""
+    async with AsyncSessionLocal() as db:
+        invoice = (await db.execute(
+            select(Invoice).where(Invoice.id == uuid.UUID(job.source_reference))
+        )).scalar_one_or_none()
+        if invoice is None:
+            raise LookupError(f"Invoice {job.source_reference} not found")
+        client = await db.get(Client, invoice.client_id)
+
+        threshold = (client.ocr_confidence_threshold if client else None) or settings.OCR_CONFIDENCE_THRESHOLD
+        invoice.status = "processing"
+        result = await ocr_invoice(db, invoice, threshold)
+        apply_ocr_result(invoice, result, threshold)
+        # The raw OCR'd name stays in ocr_structured_data
+        vendors = await get_vendor_normalizer().get(db, invoice.organization_id)
+        invoice.vendor_name = vendors.canonical_name(invoice.vendor_name)
+        if settings.ENABLE_ML_CATEGORIZATION and client is not None and client.auto_categorize \
+                and invoice.category_id is None:
+            categorizer = await get_categorizer_cache().get(db, invoice.organization_id)
+            descriptions = (await db.execute(
+                select(InvoiceLineItem.description).where(InvoiceLineItem.invoice_id == invoice.id)
+            )).scalars().all()
+            text = " ".join([invoice.ocr_raw_text or "", *(d or "" for d in descriptions)])
+            match = categorizer.categorize(CategorizeInput(invoice.vendor_name, text, invoice.total_amount))
+            if match is not None:
+                apply_category(invoice, match)
+        if settings.ENABLE_DUPLICATE_DETECTION:
+            await check_duplicate(db, invoice)
+        if client is not None and client.require_manual_review:
+            invoice.needs_review = True
+        invoice.status = "pending"
+        await db.commit()
+
+    return {
+        "invoice_id": str(invoice.id),
+        "ocr_confidence": result.ocr_confidence,
+        "engine": result.ocr_engine_used,
+        "pages": result.page_count,
+        "is_duplicate": invoice.is_duplicate,
+        "ocr_stats": result.stats,  # None on a cache hit
+    }
@@ -0,0 +1,92 @@
+"""
+Page-at-a-time PDF rasterization.
+
+``pdf2image.convert_from_path`` renders every page into memory at once; at
+300 DPI a 40-page statement needs gigabytes. ``iter_page_windows`` renders
+small windows of pages instead, sized so a window's decoded pixels stay
+within ``OCR_PAGE_MEMORY_BUDGET_MB``, and lets the caller stop as soon as
+it has what it needs.
+"""
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Never render below this resolution to satisfy the budget; OCR quality
+# falls off sharply under it
+MIN_DPI = 150
+
+BYTES_PER_PIXEL = 3  # RGB
+
+
+def page_sizes(path: str) -> List[Tuple[float, float]]:
+    """(width, height) of every page in points."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    sizes = []
+    for page in reader.pages:
+        box = page.mediabox
+        width, height = float(box.width), float(box.height)
+        if (page.get("/Rotate") or 0) % 180:
+            width, height = height, width
+        sizes.append((width, height))
+    return sizes
+
+
+def page_bytes(size: Tuple[float, float], dpi: int) -> int:
+    width, height = size
+    return int(width / 72 * dpi) * int(height / 72 * dpi) * BYTES_PER_PIXEL
+
+
+def dpi_within_budget(size: Tuple[float, float], dpi: int, budget: int) -> int:
+    """Highest DPI <= ``dpi`` at which one page fits in ``budget`` bytes."""
+    if page_bytes(size, dpi) <= budget:
+        return dpi
+    width, height = size
+    fitted = int(((budget / BYTES_PER_PIXEL) / (width * height)) ** 0.5 * 72)
+    return max(MIN_DPI, min(dpi, fitted))
+
+
+def render_page(path: str, page_number: int, dpi: int) -> np.ndarray:
+    from pdf2image import convert_from_path
+
+    image = convert_from_path(path, dpi=dpi, first_page=page_number, last_page=page_number)[0]
+    try:
+        return np.asarray(image.convert("RGB"))
+    finally:
+        image.close()
+
+
+def iter_page_windows(
+    path: str,
+    page_numbers: Optional[Sequence[int]] = None,
+    dpi: int = settings.IMAGE_DPI,
+    memory_budget_mb: int = settings.OCR_PAGE_MEMORY_BUDGET_MB,
+    max_window: Optional[int] = None,
+) -> Iterator[List[Tuple[int, np.ndarray]]]:
+    """
+    Yield lists of (page_number, image) whose combined size fits the budget.
+
+    Page numbers are 1-based; by default every page is rendered, in order.
+    Each window is only rendered when the previous one has been consumed.
+    """
+    budget = memory_budget_mb * 1024 * 1024
+    sizes = page_sizes(path)
+    numbers = list(page_numbers) if page_numbers is not None else list(range(1, len(sizes) + 1))
+    max_window = max_window or settings.OCR_MAX_WORKERS
+
+    window: List[Tuple[int, np.ndarray]] = []
+    used = 0
+    for number in numbers:
+        size = sizes[number - 1]
+        page_dpi = dpi_within_budget(size, dpi, budget)
+        needed = page_bytes(size, page_dpi)
+        if window and (used + needed > budget or len(window) >= max_window):
+            yield window
+            window, used = [], 0
+        window.append((number, render_page(path, number, page_dpi)))
+        used += needed
+    if window:
+        yield window
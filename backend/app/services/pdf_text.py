@@ -0,0 +1,98 @@
+"""
+Text-layer extraction for born-digital PDFs.
+
+Invoices produced by billing software already carry their text. For every
+page with a usable text layer the words and their coordinates are read
+directly with pdfplumber; only pages without one (scans) are left for OCR.
+"""
+from typing import Optional, List, Dict
+import re
+
+from app.core.config import settings
+from app.services.ocr_engine import OCRLine, OCRPage
+
+TEXT_LAYER_ENGINE = "text_layer"
+
+# Text read from the PDF is exact, but keep it just below 1.0 so it never
+# outranks a human correction
+TEXT_LAYER_CONFIDENCE = 0.99
+
+# Words whose tops are this close (in points) belong to the same line
+LINE_TOLERANCE = 3.0
+
+_CID_GLYPH = re.compile(r"\(cid:\d+\)")
+
+
+def is_usable_text(text: str, min_chars: int = settings.PDF_TEXT_MIN_CHARS) -> bool:
+    """
+    True when a page's text layer is real text rather than nothing, a few
+    stray characters, or unmapped glyph ids from a font without a ToUnicode map.
+    """
+    cid_chars = sum(len(m) for m in _CID_GLYPH.findall(text))
+    visible = [c for c in text if not c.isspace()]
+    if len(visible) - cid_chars < min_chars:
+        return False
+    if cid_chars > 0.2 * len(visible):
+        return False
+    alnum = sum(1 for c in visible if c.isalnum())
+    return alnum >= 0.5 * len(visible)
+
+
+def _words_to_lines(words: List[Dict], scale: float) -> List[OCRLine]:
+    lines: List[OCRLine] = []
+    current: List[Dict] = []
+
+    def flush():
+        if current:
+            current.sort(key=lambda w: w["x0"])
+            lines.append(OCRLine(
+                text=" ".join(w["text"] for w in current),
+                confidence=TEXT_LAYER_CONFIDENCE,
+                bbox=(
+                    min(w["x0"] for w in current) * scale,
+                    min(w["top"] for w in current) * scale,
+                    max(w["x1"] for w in current) * scale,
+                    max(w["bottom"] for w in current) * scale,
+                ),
+            ))
+
+    for word in sorted(words, key=lambda w: (round(w["top"]), w["x0"])):
+        if current and abs(word["top"] - current[0]["top"]) > LINE_TOLERANCE:
+            flush()
+            current = []
+        current.append(word)
+    flush()
+    return lines
+
+
+def extract_text_layer(path: str, dpi: int = settings.IMAGE_DPI) -> List[Optional[OCRPage]]:
+    """
+    Read each page's text layer.
+
+    Returns one entry per page: an OCRPage (engine ``text_layer``) where the
+    layer is usable, or None where the page has to be OCR'd. Coordinates are
+    converted to pixels at ``dpi`` so they line up with OCR output.
+    """
+    import pdfplumber
+
+    scale = dpi / 72.0
+    pages: List[Optional[OCRPage]] = []
+    with pdfplumber.open(path) as pdf:
+        for number, page in enumerate(pdf.pages, start=1):
+            try:
+                words = page.extract_words(keep_blank_chars=False, use_text_flow=True)
+            except Exception:
+                words = []
+            text = " ".join(w["text"] for w in words)
+            if not is_usable_text(text):
+                pages.append(None)
+            else:
+                pages.append(OCRPage(
+                    page_number=number,
+                    engine=TEXT_LAYER_ENGINE,
+                    lines=_words_to_lines(words, scale),
+                    width=round(float(page.width) * scale),
+                    height=round(float(page.height) * scale),
+                ))
+            page.flush_cache()
+    return pages
@@ -0,0 +1,276 @@
+"""
+Invoice rollups: counts and amounts per client x month x category x status x
+expense/income.
+
+Rollups are kept in step with invoices inside the writing transaction:
+
+* ``before_flush`` works out, for every new, changed or deleted Invoice, the
+  rollup key and measures it contributed before and after the change, and
+  nets them into per-key deltas;
+* ``after_flush`` applies the deltas with one ``INSERT .. ON CONFLICT DO
+  UPDATE`` (executemany), once the invoice rows themselves are written.
+
+So a commit either includes both the invoice and its rollup change or
+neither. Bulk UPDATEs bypass the ORM events; their callers rebuild the
+client's rollups with ``rebuild_rollups`` before committing, and bulk
+inserts add their rows with ``add_inserted_invoices``.
+
+The listeners are registered on import of ``app.services``.
+
+    python -m app.services.rollups verify [client_id ...]
+    python -m app.services.rollups rebuild [client_id ...]
+"""
+from datetime import date
+from typing import Optional, Dict, List, Iterable, Tuple, Any
+import argparse
+import asyncio
+import logging
+import sys
+import uuid
+
+from sqlalchemy import Date, select, delete, func, event, inspect, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.invoice import Invoice
+from app.models.invoice_rollup import InvoiceRollup
+
+logger = logging.getLogger(__name__)
+
+# Key values for invoices without a date / category (key columns are NOT NULL)
+UNDATED = date(1900, 1, 1)
+UNCATEGORIZED = ""
+
+# Verify tolerance for float sums accumulated in different orders
+AMOUNT_TOLERANCE = 0.01
+
+_SESSION_DELTAS = "invoice_rollup_deltas"
+
+_TRACKED = ("client_id", "organization_id", "invoice_date", "category", "status", "is_expense",
+            "total_amount", "needs_review", "is_duplicate", "deleted_at")
+
+# (client_id, month, category, status, is_expense) -> organization_id
+RollupKey = Tuple[uuid.UUID, date, str, str, bool]
+
+
+def month_of(invoice_date: Optional[date]) -> date:
+    return invoice_date.replace(day=1) if invoice_date else UNDATED
+
+
+def _contribution(values: Dict[str, Any]) -> Optional[Tuple[RollupKey, uuid.UUID, List[float]]]:
+    """Rollup key, organization and measures of one invoice state (None if not counted)."""
+    if values["deleted_at"] is not None or values["client_id"] is None:
+        return None
+    key = (
+        values["client_id"],
+        month_of(values["invoice_date"]),
+        values["category"] or UNCATEGORIZED,
+        # Column defaults are not applied yet for pending objects
+        values["status"] or "pending",
+        values["is_expense"] is not False,
+    )
+    duplicate = bool(values["is_duplicate"])
+    measures = [1, values["total_amount"] or 0.0, int(bool(values["needs_review"])),
+                int(duplicate), (values["total_amount"] or 0.0) if duplicate else 0.0]
+    return key, values["organization_id"], measures
+
+
+def _values(invoice: Invoice, old: bool) -> Dict[str, Any]:
+    state = inspect(invoice)
+    values = {}
+    for name in _TRACKED:
+        if not old:
+            values[name] = getattr(invoice, name)
+            continue
+        history = state.attrs[name].load_history()
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            values[name] = None
+    return values
+
+
+def _add(deltas: Dict[RollupKey, list], contribution, sign: int) -> None:
+    if contribution is None:
+        return
+    key, organization_id, measures = contribution
+    entry = deltas.setdefault(key, [organization_id, 0, 0.0, 0, 0, 0.0])
+    for i, value in enumerate(measures, start=1):
+        entry[i] += sign * value
+
+
+# Load the old value on assignment even when the attribute was never
+# loaded, so before_flush always sees what the row contributed
+def _track_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+for _name in _TRACKED:
+    event.listen(getattr(Invoice, _name), "set", _track_old_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_rollup_deltas(session: Session, flush_context, instances) -> None:
+    deltas: Dict[RollupKey, list] = session.info.setdefault(_SESSION_DELTAS, {})
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Invoice):
+                _add(deltas, _contribution(_values(obj, old=False)), 1)
+        for obj in session.dirty:
+            if isinstance(obj, Invoice) and session.is_modified(obj, include_collections=False):
+                _add(deltas, _contribution(_values(obj, old=True)), -1)
+                _add(deltas, _contribution(_values(obj, old=False)), 1)
+        for obj in session.deleted:
+            if isinstance(obj, Invoice):
+                _add(deltas, _contribution(_values(obj, old=True)), -1)
+
+
+def rollup_upsert(deltas: Dict[RollupKey, list]) -> Tuple[Any, List[Dict[str, Any]]]:
+    """Upsert statement and executemany rows adding ``deltas`` to the rollups."""
+    rows = [
+        {"client_id": key[0], "month": key[1], "category": key[2], "status": key[3], "is_expense": key[4],
+         "organization_id": entry[0], "invoice_count": entry[1], "total_amount": entry[2],
+         "needs_review_count": entry[3], "duplicate_count": entry[4], "duplicate_amount": entry[5]}
+        # Sorted so concurrent transactions lock rollup rows in the same order
+        for key, entry in sorted(deltas.items(), key=lambda item: tuple(map(str, item[0])))
+        if any(entry[1:])
+    ]
+    table = InvoiceRollup.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.client_id, table.c.month, table.c.category, table.c.status, table.c.is_expense],
+        set_={
+            name: table.c[name] + stmt.excluded[name]
+            for name in ("invoice_count", "total_amount", "needs_review_count", "duplicate_count",
+                         "duplicate_amount")
+        },
+    )
+    return stmt, rows
+
+
+async def add_inserted_invoices(db: AsyncSession, invoices: Iterable[Dict[str, Any]]) -> None:
+    """Roll up invoices inserted without the ORM (column dicts), in the caller's transaction."""
+    deltas: Dict[RollupKey, list] = {}
+    for values in invoices:
+        _add(deltas, _contribution({name: values.get(name) for name in _TRACKED}), 1)
+    stmt, rows = rollup_upsert(deltas)
+    if rows:
+        await db.execute(stmt, rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_rollup_deltas(session: Session, flush_context) -> None:
+    deltas = session.info.pop(_SESSION_DELTAS, None)
+    if not deltas:
+        return
+    stmt, rows = rollup_upsert(deltas)
+    if rows:
+        session.connection().execute(stmt, rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rollup_deltas(session: Session) -> None:
+    session.info.pop(_SESSION_DELTAS, None)
+
+
+def _base_aggregate(client_ids: Optional[Iterable[uuid.UUID]] = None):
+    """SELECT computing rollup rows from the invoices table."""
+    # Inline literals rather than bind parameters, so the SELECT and GROUP BY
+    # expressions are identical to PostgreSQL
+    month = func.coalesce(func.date_trunc("month", Invoice.invoice_date).cast(Date),
+                          literal_column(f"DATE '{UNDATED.isoformat()}'"))
+    category = func.coalesce(Invoice.category, literal_column(f"'{UNCATEGORIZED}'"))
+    query = (
+        select(
+            Invoice.client_id, month, category, Invoice.status, Invoice.is_expense, Invoice.organization_id,
+            func.count(),
+            func.coalesce(func.sum(Invoice.total_amount), 0.0),
+            func.count().filter(Invoice.needs_review.is_(True)),
+            func.count().filter(Invoice.is_duplicate.is_(True)),
+            func.coalesce(func.sum(Invoice.total_amount).filter(Invoice.is_duplicate.is_(True)), 0.0),
+        )
+        .where(Invoice.deleted_at.is_(None))
+        .group_by(Invoice.client_id, month, category, Invoice.status, Invoice.is_expense, Invoice.organization_id)
+    )
+    if client_ids is not None:
+        query = query.where(Invoice.client_id.in_(list(client_ids)))
+    return query
+
+
+async def rebuild_rollups(db: AsyncSession, client_ids: Optional[Iterable[uuid.UUID]] = None) -> int:
+    """
+    Recompute rollups from the invoices table (all clients, or just
+    ``client_ids``) in the caller's transaction. Returns the row count.
+    """
+    client_ids = list(client_ids) if client_ids is not None else None
+    await db.flush()
+    purge = delete(InvoiceRollup)
+    if client_ids is not None:
+        purge = purge.where(InvoiceRollup.client_id.in_(client_ids))
+    await db.execute(purge)
+    result = await db.execute(
+        insert(InvoiceRollup).from_select(
+            ["client_id", "month", "category", "status", "is_expense", "organization_id",
+             "invoice_count", "total_amount", "needs_review_count", "duplicate_count", "duplicate_amount"],
+            _base_aggregate(client_ids),
+        )
+    )
+    return result.rowcount
+
+
+async def verify_rollups(db: AsyncSession, client_ids: Optional[Iterable[uuid.UUID]] = None) -> List[Dict[str, Any]]:
+    """Compare rollups with the invoices table; returns one entry per mismatched key."""
+    client_ids = list(client_ids) if client_ids is not None else None
+    expected = {tuple(row[:5]): tuple(row[6:]) for row in await db.execute(_base_aggregate(client_ids))}
+
+    query = select(
+        InvoiceRollup.client_id, InvoiceRollup.month, InvoiceRollup.category, InvoiceRollup.status,
+        InvoiceRollup.is_expense, InvoiceRollup.invoice_count, InvoiceRollup.total_amount,
+        InvoiceRollup.needs_review_count, InvoiceRollup.duplicate_count, InvoiceRollup.duplicate_amount,
+    )
+    if client_ids is not None:
+        query = query.where(InvoiceRollup.client_id.in_(client_ids))
+    # Keys netted back to zero are harmless leftovers
+    actual = {tuple(row[:5]): tuple(row[5:]) for row in await db.execute(query) if any(row[5:])}
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want = expected.get(key, (0, 0.0, 0, 0, 0.0))
+        got = actual.get(key, (0, 0.0, 0, 0, 0.0))
+        if (want[0], want[2], want[3]) != (got[0], got[2], got[3]) \
+                or abs(want[1] - got[1]) > AMOUNT_TOLERANCE or abs(want[4] - got[4]) > AMOUNT_TOLERANCE:
+            mismatches.append({
+                "client_id": str(key[0]), "month": key[1].isoformat(), "category": key[2], "status": key[3],
+                "is_expense": key[4], "expected": want, "actual": got,
+            })
+    return mismatches
+
+
+async def _main(command: str, client_ids: List[str]) -> int:
+    from app.core.database import AsyncSessionLocal
+
+    ids = [uuid.UUID(c) for c in client_ids] or None
+    async with AsyncSessionLocal() as db:
+        if command == "rebuild":
+            rows = await rebuild_rollups(db, ids)
+            await db.commit()
+            # Cached stats pick up the corrected rollups when they expire
+            print(f"Rebuilt {rows} rollup rows")
+            return 0
+
+        mismatches = await verify_rollups(db, ids)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} mismatched rollup keys")
+        return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify or rebuild invoice rollups")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("client_ids", nargs="*", help="clients to check (default: all)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.command, args.client_ids)))
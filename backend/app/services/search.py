@@ -0,0 +1,221 @@
+"""
+Ranked full-text search over invoices.
+
+``Invoice.search_vector`` is a weighted tsvector, GIN-indexed:
+
+    A  vendor name, invoice number
+    B  line item descriptions
+    C  notes
+    D  OCR text (first SEARCH_MAX_TEXT_CHARS characters)
+
+Every part is parsed with ``SEARCH_LANGUAGE``, the configuration queries are
+parsed with, so a stemmed query lexeme ("staples" -> 'stapl') matches the
+vendor name as well as the OCR text. Changing the configuration (or how a
+part is parsed) needs a ``reindex`` of existing rows.
+
+It is computed in SQL from the row itself (``search_document()``), so the
+stored vector always matches what is in the database. A flush that changes
+any of those fields, or any line item, re-derives the vector of the affected
+invoices in the same transaction (listeners registered on import of
+``app.services``). Rows written with Core/bulk statements are indexed by
+``reindex``:
+
+    python -m app.services.search reindex [client_id ...]
+
+Queries use ``websearch_to_tsquery`` (quotes, OR, -exclusion), are ranked
+with ``ts_rank_cd`` and highlighted with ``ts_headline`` for the returned
+page only.
+"""
+from typing import Optional, Dict, List, Set, Any
+import argparse
+import asyncio
+import logging
+import re
+import time
+import uuid
+
+from sqlalchemy import select, func, event, inspect, literal_column, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.invoice import Invoice, InvoiceLineItem
+from app.services.invoice_listing import InvoiceFilters, LIST_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=25, MinWords=8"
+
+_SESSION_REINDEX = "search_reindex_invoice_ids"
+
+_INDEXED = ("vendor_name", "invoice_number", "notes", "ocr_raw_text")
+
+
+def _regconfig(name: str):
+    # Inlined (not a bind parameter) so PostgreSQL resolves the regconfig
+    # overloads and can match expression indexes; settings-only, so checked
+    if not re.fullmatch(r"[a-z_]+", name):
+        raise ValueError(f"Invalid text search configuration: {name}")
+    return literal_column(f"'{name}'::regconfig")
+
+
+def _weighted(config: str, text, weight: str):
+    vector = func.to_tsvector(_regconfig(config), func.coalesce(text, ""), type_=TSVECTOR)
+    return func.setweight(vector, literal_column(f"'{weight}'"), type_=TSVECTOR)
+
+
+def _line_text():
+    """Correlated subquery: an invoice's line item descriptions, space separated."""
+    return (
+        select(func.string_agg(InvoiceLineItem.description, " "))
+        .where(InvoiceLineItem.invoice_id == Invoice.id)
+        .scalar_subquery()
+    )
+
+
+def search_document():
+    """SQL expression computing an invoice's search_vector from its row and line items."""
+    parts = [
+        _weighted(settings.SEARCH_LANGUAGE, func.concat_ws(" ", Invoice.vendor_name, Invoice.invoice_number), "A"),
+        _weighted(settings.SEARCH_LANGUAGE, _line_text(), "B"),
+        _weighted(settings.SEARCH_LANGUAGE, Invoice.notes, "C"),
+        _weighted(settings.SEARCH_LANGUAGE, func.left(Invoice.ocr_raw_text, settings.SEARCH_MAX_TEXT_CHARS), "D"),
+    ]
+    document = parts[0]
+    for part in parts[1:]:
+        document = document.op("||", return_type=TSVECTOR)(part)
+    return document
+
+
+def reindex_statement(ids):
+    """UPDATE recomputing search_vector of ``ids`` (values or a SELECT); updated_at is left alone."""
+    table = Invoice.__table__
+    return (
+        table.update()
+        .where(table.c.id.in_(ids))
+        .values(search_vector=search_document(), updated_at=table.c.updated_at)
+    )
+
+
+def search_query(q: str):
+    return func.websearch_to_tsquery(_regconfig(settings.SEARCH_LANGUAGE), q)
+
+
+# Index maintenance on flush
+
+def _line_item_invoice(item: InvoiceLineItem):
+    """Invoice id of a line item, or its pending Invoice when only the relationship is set."""
+    if item.invoice_id is not None:
+        return item.invoice_id
+    invoice = inspect(item).attrs.invoice.loaded_value
+    return invoice if isinstance(invoice, Invoice) else None
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_reindex(session: Session, flush_context, instances) -> None:
+    pending: Set[Any] = session.info.setdefault(_SESSION_REINDEX, set())
+    for obj in session.new:
+        if isinstance(obj, Invoice):
+            if any(getattr(obj, name) for name in _INDEXED):
+                pending.add(obj)
+        elif isinstance(obj, InvoiceLineItem):
+            pending.add(_line_item_invoice(obj))
+    for obj in session.dirty:
+        if isinstance(obj, Invoice):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _INDEXED):
+                pending.add(obj)
+        elif isinstance(obj, InvoiceLineItem) and session.is_modified(obj, include_collections=False):
+            pending.add(_line_item_invoice(obj))
+    for obj in session.deleted:
+        if isinstance(obj, InvoiceLineItem):
+            pending.add(_line_item_invoice(obj))
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_reindex(session: Session, flush_context) -> None:
+    pending = session.info.pop(_SESSION_REINDEX, None)
+    if not pending:
+        return
+    # Pending objects only have their id once flushed
+    ids = {item.id if isinstance(item, Invoice) else item for item in pending} - {None}
+    if not ids:
+        return
+    session.connection().execute(reindex_statement(ids))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_reindex(session: Session) -> None:
+    session.info.pop(_SESSION_REINDEX, None)
+
+
+async def reindex(db: AsyncSession, client_ids: Optional[List[uuid.UUID]] = None,
+                  batch_size: int = 5000) -> int:
+    """Recompute search_vector in id order, committing per batch. Returns rows updated."""
+    table = Invoice.__table__
+    updated = 0
+    last: Optional[uuid.UUID] = None
+    while True:
+        batch = select(table.c.id).order_by(table.c.id).limit(batch_size)
+        if client_ids:
+            batch = batch.where(table.c.client_id.in_(client_ids))
+        if last is not None:
+            batch = batch.where(table.c.id > last)
+        ids = (await db.execute(batch)).scalars().all()
+        if not ids:
+            break
+        await db.execute(reindex_statement(ids))
+        await db.commit()
+        updated += len(ids)
+        last = ids[-1]
+    return updated
+
+
+async def search_invoices(
+    db: AsyncSession,
+    q: str,
+    filters: InvoiceFilters,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """Best matches for ``q`` within ``filters``, with rank and a highlighted snippet."""
+    query = search_query(q)
+    rank = func.ts_rank_cd(Invoice.search_vector, query)
+    hits = (
+        select(Invoice.id, rank.label("rank"))
+        .where(*filters.conditions(), Invoice.search_vector.op("@@")(query))
+        .order_by(rank.desc(), Invoice.id)
+        .limit(limit)
+        .offset(offset)
+        .subquery()
+    )
+    # Headlines re-parse the text, so only for the page being returned
+    source = func.concat_ws(
+        " … ", Invoice.vendor_name, Invoice.invoice_number, _line_text(), Invoice.notes,
+        func.left(Invoice.ocr_raw_text, settings.SEARCH_MAX_TEXT_CHARS),
+    )
+    headline = func.ts_headline(_regconfig(settings.SEARCH_LANGUAGE), source, query,
+                                HEADLINE_OPTIONS, type_=Text)
+    rows = (await db.execute(
+        select(*LIST_COLUMNS, hits.c.rank, headline.label("headline"))
+        .join(hits, hits.c.id == Invoice.id)
+        .order_by(hits.c.rank.desc(), Invoice.id)
+    )).all()
+    return [row._asdict() for row in rows]
+
+
+async def _main(client_ids: List[str]) -> None:
+    from app.core.database import AsyncSessionLocal
+
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        updated = await reindex(db, [uuid.UUID(c) for c in client_ids] or None)
+    print(f"Reindexed {updated} invoices in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild invoice full-text search vectors")
+    parser.add_argument("command", choices=["reindex"])
+    parser.add_argument("client_ids", nargs="*", help="clients to reindex (default: all)")
+    asyncio.run(_main(parser.parse_args().client_ids))
@@ -0,0 +1,205 @@
+"""
+Invoice file storage.
+
+Uploads are streamed to disk chunk by chunk: the SHA-256 digest, size limit
+and file-type sniffing are all computed as data arrives, so memory use per
+upload is bounded by ``UPLOAD_CHUNK_SIZE`` regardless of file size.
+Files are stored content-addressed under ``STORAGE_PATH``.
+"""
+from dataclasses import dataclass
+from typing import Optional, AsyncIterator
+import asyncio
+import hashlib
+import os
+import uuid
+
+from app.core.config import settings
+
+# (offset, signature, mime type, canonical extension)
+MAGIC_SIGNATURES = [
+    (0, b"%PDF-", "application/pdf", ".pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (0, b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (0, b"II*\x00", "image/tiff", ".tiff"),
+    (0, b"MM\x00*", "image/tiff", ".tiff"),
+    (4, b"ftypheic", "image/heic", ".heic"),
+    (4, b"ftypheix", "image/heic", ".heic"),
+    (4, b"ftypmif1", "image/heic", ".heic"),
+    (4, b"ftypmsf1", "image/heic", ".heic"),
+]
+SNIFF_BYTES = 16
+
+# Extensions that are the same format under another name
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".tif": ".tiff"}
+
+
+class UploadRejected(Exception):
+    """Upload refused; ``status_code`` is the HTTP status to report."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class StoredFile:
+    path: str
+    original_name: str
+    sha256: str
+    size: int
+    file_type: str  # mime type sniffed from content
+    extension: str
+    created: bool = False  # False when identical content was already stored
+
+
+def sniff_file_type(head: bytes) -> Optional[tuple]:
+    """Return (mime type, extension) from the first bytes of a file, or None."""
+    for offset, signature, mime, extension in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime, extension
+    return None
+
+
+def _normalize_extension(filename: str) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return EXTENSION_ALIASES.get(extension, extension)
+
+
+def _allowed_extensions() -> set:
+    return {EXTENSION_ALIASES.get(ext.lower(), ext.lower()) for ext in settings.ALLOWED_EXTENSIONS}
+
+
+def check_declared_upload(filename: str, content_length: Optional[int], max_size: int) -> None:
+    """Cheap checks before reading any of the body."""
+    if _normalize_extension(filename) not in _allowed_extensions():
+        raise UploadRejected(415, f"File type not allowed: {filename}")
+    if content_length is not None and content_length > max_size:
+        raise UploadRejected(413, f"File exceeds maximum upload size of {max_size} bytes")
+
+
+def storage_path_for(client_id: uuid.UUID, sha256: str, extension: str) -> str:
+    return os.path.join(settings.STORAGE_PATH, str(client_id), sha256[:2], f"{sha256}{extension}")
+
+
+async def save_stream(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    client_id: uuid.UUID,
+    max_size: int = settings.MAX_UPLOAD_SIZE,
+    content_length: Optional[int] = None,
+) -> StoredFile:
+    """
+    Stream an upload to storage.
+
+    Aborts as soon as ``max_size`` is crossed or the leading bytes do not
+    match an allowed file type; the partial file is removed in either case.
+    """
+    check_declared_upload(filename, content_length, max_size)
+
+    tmp_dir = os.path.join(settings.STORAGE_PATH, ".incoming")
+    await asyncio.to_thread(os.makedirs, tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    sniffed = None
+    handle = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_size:
+                raise UploadRejected(413, f"File exceeds maximum upload size of {max_size} bytes")
+
+            if sniffed is None:
+                head += chunk[:SNIFF_BYTES - len(head)]
+                if len(head) >= SNIFF_BYTES:
+                    sniffed = sniff_file_type(head)
+                    if sniffed is None:
+                        raise UploadRejected(415, "Unrecognised file content")
+
+            digest.update(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+
+        if sniffed is None:
+            # Short file: decide with whatever arrived
+            sniffed = sniff_file_type(head)
+            if sniffed is None:
+                raise UploadRejected(415, "Unrecognised file content")
+        await asyncio.to_thread(handle.close)
+    except BaseException:
+        handle.close()
+        await asyncio.to_thread(_remove_quietly, tmp_path)
+        raise
+
+    mime, extension = sniffed
+    if extension not in _allowed_extensions():
+        await asyncio.to_thread(_remove_quietly, tmp_path)
+        raise UploadRejected(415, f"File type not allowed: {mime}")
+    if _normalize_extension(filename) != extension:
+        await asyncio.to_thread(_remove_quietly, tmp_path)
+        raise UploadRejected(415, f"File content is {mime}, which does not match the name {filename}")
+
+    sha256 = digest.hexdigest()
+    final_path = storage_path_for(client_id, sha256, extension)
+    created = await asyncio.to_thread(_publish, tmp_path, final_path)
+    return StoredFile(
+        path=final_path,
+        original_name=os.path.basename(filename),
+        sha256=sha256,
+        size=size,
+        file_type=mime,
+        extension=extension,
+        created=created,
+    )
+
+
+async def discard(stored: StoredFile) -> None:
+    """Undo a store whose invoice was not committed; content stored earlier is kept."""
+    if stored.created:
+        await asyncio.to_thread(_remove_quietly, stored.path)
+
+
+async def save_bytes(data: bytes, filename: str, client_id: uuid.UUID, **kwargs) -> StoredFile:
+    """Store an attachment that is already in memory (email/WhatsApp)."""
+    async def one_chunk():
+        yield data
+    return await save_stream(one_chunk(), filename, client_id, content_length=len(data), **kwargs)
+
+
+async def iter_file_chunks(read, chunk_size: int = settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Adapt an async ``read(n)`` callable (e.g. ``UploadFile.read``) to a chunk iterator."""
+    while True:
+        chunk = await read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def apply_to_invoice(invoice, stored: StoredFile) -> None:
+    """Copy storage metadata onto an Invoice row."""
+    invoice.original_file_path = stored.path
+    invoice.original_file_name = stored.original_name
+    invoice.file_size = stored.size
+    invoice.file_type = stored.file_type
+
+
+def _publish(tmp_path: str, final_path: str) -> bool:
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    if os.path.exists(final_path):
+        # Identical content already stored
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, final_path)
+    return True
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
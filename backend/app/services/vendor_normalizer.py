@@ -0,0 +1,397 @@
+"""
+Vendor name normalization ("MSFT" -> "Microsoft Corporation").
+
+Alias dictionaries (built-in, global ``vendor_aliases`` rows and the
+organization's own rows, in increasing precedence) are compiled into an
+in-process ``VendorIndex`` per organization:
+
+* exact lookup of the cleaned name,
+* an Aho-Corasick automaton that finds known aliases inside longer names
+  ("MSFT Ireland Operations"), longest alias wins,
+* a trigram index for near misses ("Gooogle LLC"), scored like
+  pg_trgm's similarity().
+
+Normalization is a dict lookup or one pass over the name, with no database
+access. Indexes are refreshed at most every ``VENDOR_ALIAS_REFRESH_SECONDS``:
+the ids and ``updated_at`` of the alias rows are compared with those already
+applied, and only added or changed rows are loaded. Each row's keys are
+tracked, so an edited or deleted row's old keys are withdrawn.
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Dict, List, Iterable, Set, Tuple, Hashable
+import re
+import time
+import uuid
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.vendor_alias import VendorAlias
+
+_LEGAL_SUFFIXES = re.compile(
+    r"\b(inc|incorporated|llc|l\.l\.c|ltd|limited|corp|corporation|co|company|gmbh|plc|pty|sa|ag|bv)\b\.?"
+)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Shipped defaults; global and organization aliases override them
+BUILTIN_ALIASES: Dict[str, str] = {
+    "msft": "Microsoft Corporation",
+    "microsoft": "Microsoft Corporation",
+    "amzn": "Amazon.com, Inc.",
+    "amazon": "Amazon.com, Inc.",
+    "aws": "Amazon Web Services, Inc.",
+    "amazon web services": "Amazon Web Services, Inc.",
+    "goog": "Google LLC",
+    "google": "Google LLC",
+    "google cloud": "Google LLC",
+    "aapl": "Apple Inc.",
+    "adobe": "Adobe Inc.",
+    "dropbox": "Dropbox, Inc.",
+    # Common words ("apple", "zoom", "slack") would also match inside
+    # unrelated names, so only the full names are listed
+    "slack technologies": "Slack Technologies, LLC",
+    "zoom video communications": "Zoom Video Communications, Inc.",
+}
+
+# Scopes in increasing precedence
+SCOPES = ("builtin", "global", "organization")
+
+MEMO_SIZE = 4096
+
+
+def clean_vendor_name(name: Optional[str]) -> str:
+    """Comparison form of a vendor name: lowercase, no punctuation or legal suffixes."""
+    if not name:
+        return ""
+    text = _LEGAL_SUFFIXES.sub(" ", name.lower())
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each word, padded the way pg_trgm does."""
+    grams: Set[str] = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+@dataclass
+class VendorMatch:
+    canonical_name: str
+    alias: str
+    method: str  # exact, contains, fuzzy
+    score: float
+
+
+class AliasAutomaton:
+    """
+    Aho-Corasick automaton over cleaned aliases.
+
+    Patterns are stored with surrounding spaces and searched in the space
+    padded text, so they only match whole words. Adding or removing a
+    pattern touches its trie path only; failure links are rebuilt lazily
+    (one BFS) before the next search.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._terminal: List[Optional[str]] = [None]
+        self._outputs: List[Tuple[str, ...]] = [()]
+        self._dirty = False
+
+    def add(self, pattern: str) -> None:
+        node = 0
+        for char in f" {pattern} ":
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._outputs.append(())
+            node = nxt
+        self._terminal[node] = pattern
+        self._dirty = True
+
+    def remove(self, pattern: str) -> None:
+        node = 0
+        for char in f" {pattern} ":
+            node = self._goto[node].get(char)
+            if node is None:
+                return
+        self._terminal[node] = None
+        self._dirty = True
+
+    def _build(self) -> None:
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        self._outputs[0] = ()
+        while queue:
+            node = queue.popleft()
+            own = (self._terminal[node],) if self._terminal[node] else ()
+            self._outputs[node] = own + self._outputs[self._fail[node]]
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                queue.append(child)
+        self._dirty = False
+
+    def search(self, text: str) -> List[str]:
+        """Every pattern occurring as whole words in ``text``."""
+        if self._dirty:
+            self._build()
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: List[str] = []
+        node = 0
+        for char in f" {text} ":
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found.extend(outputs[node])
+        return found
+
+
+class TrigramIndex:
+    """Inverted trigram index for fuzzy alias lookup."""
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        self._sizes: Dict[str, int] = {}
+
+    def add(self, text: str) -> None:
+        grams = trigrams(text)
+        self._sizes[text] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(text)
+
+    def remove(self, text: str) -> None:
+        if self._sizes.pop(text, None) is None:
+            return
+        for gram in trigrams(text):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(text)
+                if not posting:
+                    del self._postings[gram]
+
+    def best(self, text: str, threshold: float) -> Optional[Tuple[str, float]]:
+        grams = trigrams(text)
+        if not grams:
+            return None
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best, best_score = None, threshold
+        for candidate, count in shared.items():
+            similarity = count / (len(grams) + self._sizes[candidate] - count)
+            if similarity >= best_score:
+                best, best_score = candidate, similarity
+        return (best, best_score) if best is not None else None
+
+
+class VendorIndex:
+    """Compiled alias set of one organization (built-in + global + own)."""
+
+    def __init__(self, fuzzy_threshold: float = settings.VENDOR_FUZZY_THRESHOLD):
+        self.fuzzy_threshold = fuzzy_threshold
+        # Per scope: cleaned alias -> {owner: canonical name}, most recently set last
+        self._scopes: Dict[str, Dict[str, Dict[Hashable, str]]] = {scope: {} for scope in SCOPES}
+        # Owner (alias row id, or scope and cleaned alias) -> its scope and the keys it set
+        self._owners: Dict[Hashable, Tuple[str, Set[str]]] = {}
+        # Effective cleaned alias -> canonical name
+        self._aliases: Dict[str, str] = {}
+        self._automaton = AliasAutomaton()
+        self._fuzzy = TrigramIndex()
+        self._memo: "OrderedDict[str, Optional[VendorMatch]]" = OrderedDict()
+        # Bumped on every effective alias change, so holders of derived keys know to rebuild
+        self.generation = 0
+        for alias, canonical in BUILTIN_ALIASES.items():
+            self.set_alias(alias, canonical, "builtin")
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def _resolve(self, key: str) -> Optional[str]:
+        for scope in reversed(SCOPES):
+            owners = self._scopes[scope].get(key)
+            if owners:
+                return next(reversed(owners.values()))
+        return None
+
+    def _refresh_key(self, key: str) -> None:
+        canonical = self._resolve(key)
+        current = self._aliases.get(key)
+        if canonical == current:
+            return
+        if canonical is None:
+            del self._aliases[key]
+            self._automaton.remove(key)
+            self._fuzzy.remove(key)
+        else:
+            if current is None:
+                self._automaton.add(key)
+                self._fuzzy.add(key)
+            self._aliases[key] = canonical
+        self._memo.clear()
+        self.generation += 1
+
+    def _withdraw(self, owner: Hashable) -> Set[str]:
+        scope, keys = self._owners.pop(owner, ("", set()))
+        for key in keys:
+            owners = self._scopes[scope][key]
+            del owners[owner]
+            if not owners:
+                del self._scopes[scope][key]
+        return keys
+
+    def set_alias(self, alias: str, canonical_name: str, scope: str = "organization",
+                  owner: Optional[Hashable] = None) -> None:
+        """
+        Map ``alias`` to ``canonical_name``.
+
+        ``owner`` (an alias row id; by default the scope and cleaned alias)
+        identifies the mapping: setting it again replaces the keys it set
+        before, even when the alias text changed.
+        """
+        if owner is None:
+            owner = (scope, clean_vendor_name(alias))
+        touched = self._withdraw(owner)
+        # The canonical name is an alias of itself, so it normalizes too
+        keys = {clean_vendor_name(alias), clean_vendor_name(canonical_name)} - {""}
+        self._owners[owner] = (scope, keys)
+        for key in keys:
+            self._scopes[scope].setdefault(key, {})[owner] = canonical_name
+        for key in touched | keys:
+            self._refresh_key(key)
+
+    def remove_owner(self, owner: Hashable) -> None:
+        for key in self._withdraw(owner):
+            self._refresh_key(key)
+
+    def remove_alias(self, alias: str, scope: str = "organization") -> None:
+        self.remove_owner((scope, clean_vendor_name(alias)))
+
+    def normalize(self, name: Optional[str]) -> Optional[VendorMatch]:
+        """Canonical vendor for ``name``, or None if it matches no alias."""
+        key = clean_vendor_name(name)
+        if not key:
+            return None
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+
+        match = None
+        canonical = self._aliases.get(key)
+        if canonical is not None:
+            match = VendorMatch(canonical, key, "exact", 1.0)
+        else:
+            found = self._automaton.search(key)
+            if found:
+                alias = max(found, key=len)
+                match = VendorMatch(self._aliases[alias], alias, "contains", round(len(alias) / len(key), 4))
+            else:
+                near = self._fuzzy.best(key, self.fuzzy_threshold)
+                if near is not None:
+                    alias, similarity = near
+                    match = VendorMatch(self._aliases[alias], alias, "fuzzy", round(similarity, 4))
+
+        self._memo[key] = match
+        if len(self._memo) > MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return match
+
+    def normalize_many(self, names: Iterable[Optional[str]]) -> List[Optional[VendorMatch]]:
+        return [self.normalize(name) for name in names]
+
+    def canonical_name(self, name: Optional[str]) -> Optional[str]:
+        """Canonical name if known, otherwise ``name`` unchanged."""
+        match = self.normalize(name)
+        return match.canonical_name if match else name
+
+    def vendor_key(self, name: Optional[str]) -> str:
+        """Comparison key: the cleaned canonical name, or the cleaned name itself."""
+        match = self.normalize(name)
+        return clean_vendor_name(match.canonical_name if match else name)
+
+
+@dataclass
+class _CachedIndex:
+    index: VendorIndex
+    applied: Dict[uuid.UUID, datetime] = field(default_factory=dict)  # alias row id -> updated_at applied
+    checked_at: float = 0.0
+
+
+class VendorNormalizer:
+    """Per-organization cache of compiled vendor indexes."""
+
+    def __init__(self, refresh_seconds: int = settings.VENDOR_ALIAS_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._cache: Dict[Optional[uuid.UUID], _CachedIndex] = {}
+
+    def cached(self, organization_id: Optional[uuid.UUID]) -> Optional[VendorIndex]:
+        """Compiled index if already loaded; never touches the database."""
+        entry = self._cache.get(organization_id)
+        return entry.index if entry else None
+
+    async def get(self, db: AsyncSession, organization_id: Optional[uuid.UUID]) -> VendorIndex:
+        entry = self._cache.get(organization_id)
+        if entry is None:
+            entry = self._cache[organization_id] = _CachedIndex(VendorIndex())
+        elif time.monotonic() - entry.checked_at < self.refresh_seconds:
+            return entry.index
+
+        scope = VendorAlias.organization_id.is_(None)
+        if organization_id is not None:
+            scope = or_(scope, VendorAlias.organization_id == organization_id)
+        # Compared row by row rather than against an updated_at watermark:
+        # updated_at comes from each writer's clock, so a transaction committing
+        # late can carry an older value, and deleted rows leave nothing to read
+        versions = dict((await db.execute(select(VendorAlias.id, VendorAlias.updated_at).where(scope))).all())
+        for row_id in entry.applied.keys() - versions.keys():
+            entry.index.remove_owner(row_id)
+            del entry.applied[row_id]
+        changed = [row_id for row_id, updated_at in versions.items() if entry.applied.get(row_id) != updated_at]
+        if changed:
+            query = select(VendorAlias).where(scope)
+            if entry.applied:
+                query = query.where(VendorAlias.id.in_(changed))
+            for row in (await db.execute(query)).scalars():
+                if row.is_active:
+                    row_scope = "global" if row.organization_id is None else "organization"
+                    entry.index.set_alias(row.alias, row.canonical_name, row_scope, owner=row.id)
+                else:
+                    entry.index.remove_owner(row.id)
+                entry.applied[row.id] = row.updated_at
+        entry.checked_at = time.monotonic()
+        return entry.index
+
+    def invalidate(self, organization_id: Optional[uuid.UUID] = None) -> None:
+        """Rebuild from the database on next use (all organizations for global changes)."""
+        if organization_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(organization_id, None)
+
+
+_vendor_normalizer: Optional[VendorNormalizer] = None
+
+
+def get_vendor_normalizer() -> VendorNormalizer:
+    global _vendor_normalizer
+    if _vendor_normalizer is None:
+        _vendor_normalizer = VendorNormalizer()
+    return _vendor_normalizer
@@ -0,0 +1,296 @@
+"""
+WhatsApp invoice intake through WAHA (WhatsApp HTTP API).
+
+Webhook first: WAHA posts every message of a session to
+``/webhooks/whatsapp``, and media messages from a client's monitored numbers
+become ``whatsapp_media`` jobs right away. A fallback poller
+(``app.workers.whatsapp_poller``) reads recent chat history for messages a
+webhook missed; a message is queued once whichever path sees it first
+(unique index on the job's message id).
+
+The ``whatsapp_media`` handler streams the media from WAHA into storage
+chunk by chunk, creates the invoice and queues OCR, like an upload.
+
+All WAHA traffic of a process goes through one ``aiohttp`` session with a
+bounded connection pool (``get_waha_client()``).
+"""
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Iterable, Any, AsyncIterator
+from urllib.parse import urlsplit, quote
+import asyncio
+import hashlib
+import hmac
+import logging
+import mimetypes
+import re
+import uuid
+
+import aiohttp
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.client import Client
+from app.models.invoice import Invoice
+from app.models.processing_queue import ProcessingQueue
+from app.services import storage
+from app.workers import queue
+from app.workers.runner import register
+
+logger = logging.getLogger(__name__)
+
+TASK_TYPE = "whatsapp_media"
+
+MESSAGE_EVENTS = ("message", "message.any")
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+class WebhookRejected(Exception):
+    pass
+
+
+@dataclass
+class MediaMessage:
+    id: str
+    sender: str  # phone number, digits only
+    url: str
+    mimetype: Optional[str]
+    filename: str
+    timestamp: Optional[int] = None
+
+
+def phone_number(jid: Optional[str]) -> str:
+    """Digits of a WhatsApp id or phone number ("+1 555-0100", "15550100@c.us")."""
+    return _NON_DIGITS.sub("", (jid or "").split("@")[0])
+
+
+def media_filename(message_id: str, mimetype: Optional[str], filename: Optional[str]) -> str:
+    """The sender's file name, or one derived from the mime type (photos have none)."""
+    if filename:
+        return filename
+    extension = mimetypes.guess_extension(mimetype or "") or ""
+    return f"whatsapp-{re.sub(r'[^A-Za-z0-9]+', '-', message_id)[-40:]}{extension}"
+
+
+def media_messages(messages: Iterable[Dict[str, Any]], monitored: Optional[List[str]] = None) -> List[MediaMessage]:
+    """
+    Incoming media messages of a WAHA message list (webhook payloads or
+    chat history), limited to ``monitored`` numbers when there are any.
+    """
+    numbers = {phone_number(n) for n in monitored or []}
+    found = []
+    for message in messages:
+        media = message.get("media") or {}
+        # A payload without an id can't be deduplicated or referenced: skip it
+        if message.get("fromMe") or not message.get("hasMedia") or not media.get("url") or not message.get("id"):
+            continue
+        sender = phone_number(message.get("from"))
+        if numbers and sender not in numbers:
+            continue
+        found.append(MediaMessage(
+            id=str(message["id"]),
+            sender=sender,
+            url=media["url"],
+            mimetype=media.get("mimetype"),
+            filename=media_filename(str(message["id"]), media.get("mimetype"), media.get("filename")),
+            timestamp=message.get("timestamp"),
+        ))
+    return found
+
+
+def verify_signature(body: bytes, signature: Optional[str], algorithm: Optional[str]) -> None:
+    """Check WAHA's X-Webhook-Hmac header (HMAC of the raw body with WHATSAPP_WEBHOOK_SECRET)."""
+    algorithm = (algorithm or "sha512").lower()
+    if algorithm not in ("sha512", "sha256"):
+        raise WebhookRejected(f"Unsupported HMAC algorithm: {algorithm}")
+    expected = hmac.new(settings.WHATSAPP_WEBHOOK_SECRET.encode(), body, getattr(hashlib, algorithm)).hexdigest()
+    if not signature or not hmac.compare_digest(expected, signature.lower()):
+        raise WebhookRejected("Invalid webhook signature")
+
+
+async def enqueue_media(db: AsyncSession, client_id: uuid.UUID, messages: List[MediaMessage]) -> int:
+    """Queue ``whatsapp_media`` jobs; messages already queued are skipped. Returns how many were new."""
+    if not messages:
+        return 0
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "client_id": client_id,
+            "task_type": TASK_TYPE,
+            "source": "whatsapp",
+            "source_reference": m.id[:255],
+            "file_path": m.url[:500],  # WAHA media URL until the handler has stored it
+            # The message details travel in result until the job completes
+            "result": {"sender": m.sender, "filename": m.filename, "mimetype": m.mimetype},
+        }
+        for m in messages
+    ]
+    table = ProcessingQueue.__table__
+    stmt = (
+        insert(ProcessingQueue)
+        .values(rows)
+        .on_conflict_do_nothing(
+            index_elements=[table.c.client_id, table.c.source_reference],
+            index_where=table.c.task_type == TASK_TYPE,
+        )
+        .returning(ProcessingQueue.id)
+    )
+    return len((await db.execute(stmt)).all())
+
+
+async def client_for_session(db: AsyncSession, session: str):
+    return (await db.execute(
+        select(Client.id, Client.monitored_phone_numbers)
+        .where(Client.whatsapp_session_id == session, Client.whatsapp_enabled.is_(True),
+               Client.is_active.is_(True), Client.deleted_at.is_(None))
+    )).first()
+
+
+async def handle_webhook(db: AsyncSession, event: Dict[str, Any]) -> int:
+    """Queue the media of one WAHA webhook event. Returns jobs queued."""
+    if event.get("event") not in MESSAGE_EVENTS or not event.get("session"):
+        return 0
+    client = await client_for_session(db, event["session"])
+    if client is None:
+        logger.debug(f"WhatsApp event for unknown session {event['session']!r} ignored")
+        return 0
+    # whatsapp_last_check is the poller's watermark and is left alone: moving
+    # it here would keep the fallback from ever re-reading a missed window
+    return await enqueue_media(db, client.id, media_messages([event.get("payload") or {}],
+                                                             client.monitored_phone_numbers))
+
+
+class WahaClient:
+    """WAHA API calls over one pooled aiohttp session."""
+
+    def __init__(self, base_url: str = settings.WHATSAPP_API_URL, api_key: Optional[str] = settings.WHATSAPP_API_KEY,
+                 pool_size: int = settings.WHATSAPP_HTTP_POOL_SIZE, timeout: float = settings.WHATSAPP_HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use, inside the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+                headers={"X-Api-Key": self.api_key} if self.api_key else None,
+                raise_for_status=True,
+            )
+        return self._session
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def media_url(self, url: str) -> str:
+        # Media is only ever fetched from WAHA itself: the host in a message
+        # (or a forged webhook) is replaced by WHATSAPP_API_URL
+        parts = urlsplit(url)
+        return self.url(parts.path + (f"?{parts.query}" if parts.query else ""))
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        async with self.session.get(self.url(path), params=params) as response:
+            return await response.json()
+
+    async def chats(self, session: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Chats of a session, most recently active first."""
+        return await self._get(f"/api/{quote(session)}/chats", {
+            "limit": limit, "sortBy": "conversationTimestamp", "sortOrder": "desc",
+        })
+
+    async def messages(self, session: str, chat_id: str, since: Optional[int] = None,
+                       limit: int = settings.WHATSAPP_MESSAGES_LIMIT) -> List[Dict[str, Any]]:
+        params = {"limit": limit, "downloadMedia": "true"}
+        if since is not None:
+            params["filter.timestamp.gte"] = since
+        return await self._get(f"/api/{quote(session)}/chats/{quote(chat_id)}/messages", params)
+
+    async def recent_media(self, session: str, monitored: Optional[List[str]], since: Optional[int],
+                           chats_limit: int = 100) -> List[MediaMessage]:
+        """
+        Media messages received since ``since`` (unix seconds): from the
+        monitored numbers' chats, or from every chat active since then.
+        """
+        if monitored:
+            chat_ids = [f"{phone_number(n)}@c.us" for n in monitored]
+        else:
+            chat_ids = [
+                chat["id"] if isinstance(chat["id"], str) else chat["id"].get("_serialized")
+                for chat in await self.chats(session, chats_limit)
+                if since is None or (chat.get("conversationTimestamp") or 0) >= since
+            ]
+        histories = await asyncio.gather(*(self.messages(session, chat_id, since) for chat_id in chat_ids))
+        return media_messages((m for history in histories for m in history), monitored)
+
+    async def stream_media(self, url: str, chunk_size: int = settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        async with self.session.get(self.media_url(url)) as response:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_waha_client: Optional[WahaClient] = None
+
+
+def get_waha_client() -> WahaClient:
+    global _waha_client
+    if _waha_client is None:
+        _waha_client = WahaClient()
+    return _waha_client
+
+
+@register(TASK_TYPE)
+async def handle_media_job(job: ProcessingQueue) -> dict:
+    """Queue handler: store the media of a WhatsApp message and queue its OCR."""
+    details = job.result or {}
+    try:
+        stored = await storage.save_stream(
+            get_waha_client().stream_media(job.file_path),
+            details.get("filename") or media_filename(job.source_reference, details.get("mimetype"), None),
+            job.client_id,
+        )
+    except storage.UploadRejected as e:
+        # Not an invoice file (voice note, video, sticker...): nothing to retry
+        return {"skipped": e.detail}
+    try:
+        async with AsyncSessionLocal() as db:
+            organization_id = (await db.execute(
+                select(Client.organization_id).where(Client.id == job.client_id)
+            )).scalar_one()
+            invoice = Invoice(
+                client_id=job.client_id,
+                organization_id=organization_id,
+                total_amount=0.0,
+                source="whatsapp",
+                source_reference=job.source_reference,
+                source_sender=details.get("sender"),
+                status="pending",
+                file_hash=stored.sha256,
+            )
+            storage.apply_to_invoice(invoice, stored)
+            db.add(invoice)
+            await db.flush()
+            ocr_job = await queue.enqueue(
+                db,
+                job.client_id,
+                "ocr",
+                file_path=stored.path,
+                source="whatsapp",
+                source_reference=str(invoice.id),
+            )
+            await db.commit()
+    except BaseException:
+        # The job is retried and stores the media again; drop this copy
+        await storage.discard(stored)
+        raise
+    return {"invoice_id": str(invoice.id), "ocr_job_id": str(ocr_job.id), "file_hash": stored.sha256}
@@ -0,0 +1,424 @@
+"""
+Client mailbox poller.
+
+Run one per host (it handles thousands of mailboxes):
+
+    python -m app.workers.email_poller --concurrency 200
+
+Every mailbox with ``email_enabled`` is kept on a heap keyed by its next due
+time (``email_check_frequency`` minutes after its last check); the loop
+sleeps until the earliest one is due, so checking costs nothing between due
+times however many mailboxes there are. Up to ``concurrency`` checks run at
+once over pooled IMAP connections (``app.services.mailbox``). A mailbox
+checked every EMAIL_IDLE_MAX_INTERVAL seconds or more often is switched to
+IMAP IDLE when its server supports it: a watcher holds one connection and
+the server pushes new mail instead of being asked.
+
+Attachments become invoices with an OCR job queued, like uploads. The UID
+watermark of a folder is advanced in the same transaction, so a crash
+between fetching and storing re-fetches the messages instead of losing them;
+files stored for a transaction that does not commit are discarded.
+The client list is reloaded every EMAIL_POLL_INTERVAL seconds.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple, Iterable
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+import uuid
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.encryption import ENCRYPTED_FIELD, cipher_registry
+from app.models.client import Client
+from app.models.invoice import Invoice
+from app.models.organization import Organization
+from app.services import storage
+from app.services.mailbox import (
+    WATERMARKS_FIELD, FetchedMessage, ImapConnection, ImapPool, MailboxConfig,
+    extract_attachments, message_sender,
+)
+from app.workers import queue
+
+logger = logging.getLogger(__name__)
+
+
+class MailboxStore:
+    """Where mailboxes come from and fetched mail goes: the clients table and invoices."""
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def load(self) -> List[MailboxConfig]:
+        """Every pollable mailbox, credentials decrypted, in one query."""
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(Client.id, Client.organization_id, Client.email, Client.email_config,
+                       Client.email_check_frequency, Client.email_last_check,
+                       Client.monitored_email_addresses, Organization.encryption_key)
+                .join(Organization, Organization.id == Client.organization_id)
+                .where(Client.email_enabled.is_(True), Client.is_active.is_(True), Client.deleted_at.is_(None))
+            )).all()
+        credentials = cipher_registry.decrypt_many(
+            ((row.email_config or {}).get(ENCRYPTED_FIELD), row.encryption_key) for row in rows
+        )
+        mailboxes = [MailboxConfig.from_client(row, secret) for row, secret in zip(rows, credentials)]
+        return [m for m in mailboxes if m is not None]
+
+    async def save(self, mailbox: MailboxConfig, folder: str, watermark: Tuple[int, int],
+                   messages: List[FetchedMessage]) -> int:
+        """Store the attachments of ``messages`` and advance the folder's watermark. Returns invoices created."""
+        created = 0
+        now = datetime.utcnow()
+        stored_files: List[storage.StoredFile] = []
+        try:
+            async with self.session_factory() as db:
+                for message in messages:
+                    created += await self._store_message(db, mailbox, message, stored_files)
+
+                config = (await db.execute(
+                    select(Client.email_config).where(Client.id == mailbox.client_id).with_for_update()
+                )).scalar_one_or_none()
+                config = dict(config or {})
+                config[WATERMARKS_FIELD] = {**(config.get(WATERMARKS_FIELD) or {}), folder: list(watermark)}
+                await db.execute(
+                    update(Client).where(Client.id == mailbox.client_id)
+                    .values(email_config=config, email_last_check=now.isoformat())
+                )
+                await db.commit()
+        except BaseException:
+            # Nothing was committed and the watermark did not move, so the next
+            # check fetches these messages again; drop the files stored for them
+            for stored in stored_files:
+                await storage.discard(stored)
+            raise
+        return created
+
+    async def _store_message(self, db, mailbox: MailboxConfig, message: FetchedMessage,
+                             stored_files: List[storage.StoredFile]) -> int:
+        parsed, attachments = extract_attachments(message.raw)
+        reference = str(parsed.get("Message-ID") or f"{message.folder}:{message.uid}")[:255]
+        sender = message_sender(parsed)
+        created = 0
+        for attachment in attachments:
+            try:
+                stored = await storage.save_bytes(attachment.data, attachment.filename, mailbox.client_id)
+            except storage.UploadRejected as e:
+                logger.debug(f"Skipped attachment {attachment.filename!r} of {reference}: {e.detail}")
+                continue
+            stored_files.append(stored)
+            invoice = Invoice(
+                client_id=mailbox.client_id,
+                organization_id=mailbox.organization_id,
+                total_amount=0.0,
+                source="email",
+                source_reference=reference,
+                source_sender=sender,
+                status="pending",
+                file_hash=stored.sha256,
+            )
+            storage.apply_to_invoice(invoice, stored)
+            db.add(invoice)
+            await db.flush()
+            await queue.enqueue(
+                db,
+                mailbox.client_id,
+                "ocr",
+                file_path=stored.path,
+                source="email",
+                source_reference=str(invoice.id),
+            )
+            created += 1
+        return created
+
+    async def touch(self, client_ids: Iterable[uuid.UUID], checked_at: datetime) -> None:
+        """Record a check that found nothing new, for many mailboxes at once."""
+        ids = list(client_ids)
+        if not ids:
+            return
+        async with self.session_factory() as db:
+            await db.execute(
+                update(Client).where(Client.id.in_(ids)).values(email_last_check=checked_at.isoformat())
+            )
+            await db.commit()
+
+
+class EmailPoller:
+    """Checks every mailbox when it is due, over a bounded IMAP connection pool."""
+
+    def __init__(
+        self,
+        store: Optional[MailboxStore] = None,
+        pool: Optional[ImapPool] = None,
+        concurrency: int = settings.EMAIL_POLL_CONCURRENCY,
+        batch_size: int = settings.EMAIL_BATCH_SIZE,
+        refresh_interval: float = settings.EMAIL_POLL_INTERVAL,
+        flush_interval: float = settings.EMAIL_LAST_CHECK_FLUSH_SECONDS,
+        idle_max_interval: float = settings.EMAIL_IDLE_MAX_INTERVAL,
+        idle_max_per_host: int = settings.EMAIL_IDLE_MAX_PER_HOST,
+    ):
+        self.store = store or MailboxStore()
+        self.pool = pool or ImapPool()
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.idle_max_interval = idle_max_interval
+        self.idle_max_per_host = idle_max_per_host
+
+        self.mailboxes: Dict[uuid.UUID, MailboxConfig] = {}
+        # (due, seq, client_id); an entry is current only while _due[client_id] == due
+        self._heap: List[Tuple[float, int, uuid.UUID]] = []
+        self._due: Dict[uuid.UUID, float] = {}
+        self._seq = itertools.count()
+        self._failures: Counter = Counter()
+        self._polling: Dict[uuid.UUID, asyncio.Task] = {}
+        self._watchers: Dict[uuid.UUID, asyncio.Task] = {}
+        self._watchers_per_host: Counter = Counter()
+        self._checked: set = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self.checks = 0
+        self.messages = 0
+        self.invoices = 0
+        self.failed = 0
+
+    # Scheduling
+
+    def schedule(self, client_id: uuid.UUID, delay: float) -> None:
+        due = time.monotonic() + max(delay, 0.0)
+        self._due[client_id] = due
+        heapq.heappush(self._heap, (due, next(self._seq), client_id))
+        if self._heap[0][2] == client_id:
+            self._wake.set()
+
+    def _initial_delay(self, mailbox: MailboxConfig) -> float:
+        delay = 0.0
+        if mailbox.last_check is not None:
+            delay = mailbox.interval - (datetime.utcnow() - mailbox.last_check).total_seconds()
+        # Spread mailboxes that are all due at start-up
+        return max(delay, 0.0) + random.uniform(0, min(mailbox.interval, 30.0))
+
+    def _retry_delay(self, mailbox: MailboxConfig, client_id: uuid.UUID) -> float:
+        self._failures[client_id] += 1
+        return mailbox.interval * 2 ** min(self._failures[client_id], settings.EMAIL_MAX_RETRIES)
+
+    async def refresh(self) -> None:
+        """Reload the mailbox list; new mailboxes are scheduled, removed ones dropped."""
+        loaded = {m.client_id: m for m in await self.store.load()}
+        for client_id in set(self.mailboxes) - set(loaded):
+            self._drop(client_id)
+        for client_id, mailbox in loaded.items():
+            current = self.mailboxes.get(client_id)
+            if current is None:
+                self.mailboxes[client_id] = mailbox
+                self.schedule(client_id, self._initial_delay(mailbox))
+            elif _settings_of(current) != _settings_of(mailbox):
+                # Ours are at least as recent as the stored watermarks
+                mailbox.watermarks = {**mailbox.watermarks, **current.watermarks}
+                self.mailboxes[client_id] = mailbox
+                watcher = self._watchers.get(client_id)
+                if watcher is not None:
+                    watcher.cancel()
+                elif client_id not in self._due and client_id not in self._polling:
+                    self.schedule(client_id, 0)
+        logger.info(f"Email poller: {len(self.mailboxes)} mailboxes, {len(self._watchers)} on IDLE")
+
+    def _drop(self, client_id: uuid.UUID) -> None:
+        self.mailboxes.pop(client_id, None)
+        self._due.pop(client_id, None)
+        self._failures.pop(client_id, None)
+        watcher = self._watchers.get(client_id)
+        if watcher is not None:
+            watcher.cancel()
+
+    # Main loop
+
+    async def run(self) -> None:
+        """Run until :meth:`stop` is called, then let in-flight checks finish."""
+        await self.refresh()
+        background = [
+            asyncio.create_task(self._refresh_loop()),
+            asyncio.create_task(self._flush_loop()),
+        ]
+        try:
+            while not self._stopping.is_set():
+                self._wake.clear()
+                await self._start_due()
+                delay = self._heap[0][0] - time.monotonic() if self._heap else self.refresh_interval
+                await self._sleep(delay)
+        finally:
+            for watcher in list(self._watchers.values()):
+                watcher.cancel()
+            await asyncio.gather(*self._polling.values(), *self._watchers.values(), return_exceptions=True)
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            await self._flush_checked()
+            await self.pool.close()
+            logger.info(
+                f"Email poller stopped (checks={self.checks}, messages={self.messages}, "
+                f"invoices={self.invoices}, failed={self.failed})"
+            )
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    async def _start_due(self) -> None:
+        while self._heap and self._heap[0][0] <= time.monotonic() and not self._stopping.is_set():
+            due, _, client_id = heapq.heappop(self._heap)
+            if self._due.get(client_id) != due:
+                continue  # rescheduled or dropped since
+            del self._due[client_id]
+            if client_id in self._polling or client_id in self._watchers:
+                continue
+            await self._slots.acquire()
+            self._polling[client_id] = asyncio.create_task(self._poll(client_id))
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=max(seconds, 0.0))
+        except asyncio.TimeoutError:
+            pass
+
+    # Checking a mailbox
+
+    async def _check_folders(self, mailbox: MailboxConfig, connection: ImapConnection,
+                             folders: List[str]) -> bool:
+        """Fetch and store new mail of ``folders``; True if more is waiting."""
+        more = False
+        for folder in folders:
+            watermark, messages, pending = await connection.fetch_new(mailbox, folder, self.batch_size)
+            if watermark != mailbox.watermarks.get(folder):
+                self.invoices += await self.store.save(mailbox, folder, watermark, messages)
+                mailbox.watermarks[folder] = watermark
+                self._checked.discard(mailbox.client_id)
+            else:
+                self._checked.add(mailbox.client_id)
+            self.messages += len(messages)
+            more = more or pending
+        self.checks += 1
+        mailbox.last_check = datetime.utcnow()
+        self._failures.pop(mailbox.client_id, None)
+        return more
+
+    def _can_idle(self, mailbox: MailboxConfig, connection: ImapConnection) -> bool:
+        return (
+            mailbox.interval <= self.idle_max_interval
+            and len(mailbox.folders) == 1
+            and connection.supports_idle
+            and self._watchers_per_host[mailbox.host_key] < self.idle_max_per_host
+        )
+
+    async def _poll(self, client_id: uuid.UUID) -> None:
+        mailbox = self.mailboxes.get(client_id)
+        try:
+            if mailbox is None:
+                return
+            async with self.pool.acquire(mailbox) as connection:
+                more = await self._check_folders(mailbox, connection, mailbox.folders)
+                idle = not more and self._can_idle(mailbox, connection)
+        except Exception as e:
+            self.failed += 1
+            delay = self._retry_delay(mailbox, client_id)
+            logger.warning(f"Mailbox check of client {client_id} failed ({e}); retrying in {delay:.0f}s")
+            self._reschedule(client_id, mailbox, delay)
+            return
+        finally:
+            self._polling.pop(client_id, None)
+            self._slots.release()
+
+        if idle and self.mailboxes.get(client_id) is mailbox and not self._stopping.is_set():
+            self._watchers_per_host[mailbox.host_key] += 1
+            self._watchers[client_id] = asyncio.create_task(self._watch(mailbox))
+        else:
+            self._reschedule(client_id, mailbox, 0 if more else mailbox.interval)
+
+    def _reschedule(self, client_id: uuid.UUID, mailbox: MailboxConfig, delay: float) -> None:
+        current = self.mailboxes.get(client_id)
+        if current is None or self._stopping.is_set():
+            return
+        # Settings changed while it was being checked: check again with the new ones
+        self.schedule(client_id, delay if current is mailbox else 0)
+
+    async def _watch(self, mailbox: MailboxConfig) -> None:
+        """Hold a connection in IDLE on the mailbox's folder and fetch whenever the server reports mail."""
+        client_id = mailbox.client_id
+        delay = mailbox.interval
+        try:
+            async with self.pool.acquire(mailbox) as connection:
+                while self.mailboxes.get(client_id) is mailbox and not self._stopping.is_set():
+                    while await self._check_folders(mailbox, connection, mailbox.folders):
+                        pass
+                    await connection.wait_for_mail()
+        except asyncio.CancelledError:
+            delay = 0
+        except Exception as e:
+            self.failed += 1
+            delay = self._retry_delay(mailbox, client_id)
+            logger.warning(f"IDLE on mailbox of client {client_id} ended ({e}); polling again in {delay:.0f}s")
+        finally:
+            self._watchers_per_host[mailbox.host_key] -= 1
+            self._watchers.pop(client_id, None)
+            self._reschedule(client_id, mailbox, delay)
+
+    # Background
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Reloading mailboxes failed: {e}")
+
+    async def _flush_checked(self) -> None:
+        checked, self._checked = self._checked, set()
+        try:
+            await self.store.touch(checked, datetime.utcnow())
+        except Exception as e:
+            logger.error(f"Recording mailbox checks failed: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_checked()
+            closed = await self.pool.prune()
+            if closed:
+                logger.debug(f"Closed {closed} idle IMAP connections")
+
+
+def _settings_of(mailbox: MailboxConfig) -> tuple:
+    return mailbox.account_key, mailbox.password, tuple(mailbox.folders), mailbox.interval, tuple(mailbox.senders)
+
+
+async def main(concurrency: int) -> None:
+    import signal
+
+    poller = EmailPoller(concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, poller.stop)
+    await poller.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client mailbox poller")
+    parser.add_argument("--concurrency", type=int, default=settings.EMAIL_POLL_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if not settings.DEBUG else logging.DEBUG,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main(args.concurrency))
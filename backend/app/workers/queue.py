@@ -0,0 +1,223 @@
+"""
+Lease-based access to the processing_queue table.
+
+Jobs are claimed in batches with ``FOR UPDATE SKIP LOCKED`` so any number of
+workers can drain the table concurrently without blocking on each other or
+picking the same row twice. A claimed job carries a lease (``locked_by`` +
+``lease_expires_at``) that the owning worker renews with heartbeats; if the
+worker dies the reaper hands the job back to the pending pool.
+"""
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Sequence
+import random
+import uuid
+
+from sqlalchemy import select, update, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.processing_queue import ProcessingQueue
+
+# Database clock in UTC, so lease arithmetic never depends on worker clock skew
+db_utcnow = func.timezone("utc", func.now())
+
+
+def _lease_interval(seconds: float):
+    return func.make_interval(0, 0, 0, 0, 0, 0, seconds)
+
+
+async def enqueue(
+    db: AsyncSession,
+    client_id: uuid.UUID,
+    task_type: str,
+    priority: int = 5,
+    **fields: Any,
+) -> ProcessingQueue:
+    """Add a job to the queue."""
+    job = ProcessingQueue(client_id=client_id, task_type=task_type, priority=priority, **fields)
+    db.add(job)
+    await db.flush()
+    return job
+
+
+async def claim_batch(
+    db: AsyncSession,
+    worker_id: str,
+    limit: int = settings.QUEUE_BATCH_SIZE,
+    task_types: Optional[Sequence[str]] = None,
+    lease_seconds: int = settings.QUEUE_LEASE_SECONDS,
+) -> List[ProcessingQueue]:
+    """
+    Claim up to ``limit`` pending jobs ordered by (priority, created_at).
+
+    Rows locked by another worker's in-flight claim are skipped instead of
+    waited on, which keeps claim latency flat as the number of workers grows.
+    """
+    candidates = (
+        select(ProcessingQueue.id)
+        .where(
+            ProcessingQueue.status == "pending",
+            ProcessingQueue.available_at <= db_utcnow,
+        )
+        .order_by(ProcessingQueue.priority, ProcessingQueue.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if task_types:
+        candidates = candidates.where(ProcessingQueue.task_type.in_(task_types))
+
+    stmt = (
+        update(ProcessingQueue)
+        .where(ProcessingQueue.id.in_(candidates.scalar_subquery()))
+        .values(
+            status="processing",
+            locked_by=worker_id,
+            lease_expires_at=db_utcnow + _lease_interval(lease_seconds),
+            attempts=ProcessingQueue.attempts + 1,
+            started_at=datetime.utcnow().isoformat(),
+            error_message=None,
+        )
+        .returning(ProcessingQueue)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    jobs = list(result.scalars().all())
+    await db.commit()
+    jobs.sort(key=lambda j: (j.priority, j.created_at))
+    return jobs
+
+
+async def heartbeat(
+    db: AsyncSession,
+    worker_id: str,
+    job_ids: Sequence[uuid.UUID],
+    lease_seconds: int = settings.QUEUE_LEASE_SECONDS,
+) -> set:
+    """
+    Extend the lease on jobs still held by ``worker_id``.
+
+    Returns the ids whose lease was renewed; anything missing has been
+    reclaimed and must not be completed by this worker.
+    """
+    if not job_ids:
+        return set()
+    stmt = (
+        update(ProcessingQueue)
+        .where(
+            ProcessingQueue.id.in_(list(job_ids)),
+            ProcessingQueue.locked_by == worker_id,
+            ProcessingQueue.status == "processing",
+        )
+        .values(lease_expires_at=db_utcnow + _lease_interval(lease_seconds))
+        .returning(ProcessingQueue.id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    renewed = set(result.scalars().all())
+    await db.commit()
+    return renewed
+
+
+async def complete(
+    db: AsyncSession,
+    worker_id: str,
+    job_id: uuid.UUID,
+    result: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Mark a job completed. Returns False if the lease was lost."""
+    stmt = (
+        update(ProcessingQueue)
+        .where(ProcessingQueue.id == job_id, ProcessingQueue.locked_by == worker_id)
+        .values(
+            status="completed",
+            result=result or {},
+            completed_at=datetime.utcnow().isoformat(),
+            locked_by=None,
+            lease_expires_at=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    res = await db.execute(stmt)
+    await db.commit()
+    return res.rowcount == 1
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff (with jitter) before the next attempt, in seconds."""
+    ceiling = min(
+        settings.QUEUE_RETRY_BACKOFF * (2 ** max(attempts - 1, 0)),
+        settings.QUEUE_RETRY_BACKOFF_MAX,
+    )
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def fail(
+    db: AsyncSession,
+    worker_id: str,
+    job: ProcessingQueue,
+    error: str,
+    max_attempts: int = settings.QUEUE_MAX_ATTEMPTS,
+) -> bool:
+    """
+    Record a failed attempt.
+
+    The job goes back to ``pending`` with a backoff delay until it has used
+    ``max_attempts``, after which it is parked as ``failed``. Returns False if
+    the lease was lost.
+    """
+    values: Dict[str, Any] = {
+        "error_message": error[:5000],
+        "locked_by": None,
+        "lease_expires_at": None,
+    }
+    if job.attempts >= max_attempts:
+        values["status"] = "failed"
+        values["completed_at"] = datetime.utcnow().isoformat()
+    else:
+        values["status"] = "pending"
+        values["available_at"] = db_utcnow + _lease_interval(retry_delay(job.attempts))
+
+    stmt = (
+        update(ProcessingQueue)
+        .where(ProcessingQueue.id == job.id, ProcessingQueue.locked_by == worker_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    res = await db.execute(stmt)
+    await db.commit()
+    return res.rowcount == 1
+
+
+async def release_expired(db: AsyncSession, limit: int = 1000) -> int:
+    """
+    Return jobs whose lease has expired to the pending pool.
+
+    Jobs that already used all their attempts are marked failed instead.
+    """
+    expired = (
+        select(ProcessingQueue.id)
+        .where(
+            ProcessingQueue.status == "processing",
+            ProcessingQueue.lease_expires_at < db_utcnow,
+        )
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    exhausted = ProcessingQueue.attempts >= settings.QUEUE_MAX_ATTEMPTS
+
+    stmt = (
+        update(ProcessingQueue)
+        .where(ProcessingQueue.id.in_(expired))
+        .values(
+            status=case((exhausted, "failed"), else_="pending"),
+            locked_by=None,
+            lease_expires_at=None,
+            available_at=db_utcnow,
+            error_message="Lease expired",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    res = await db.execute(stmt)
+    await db.commit()
+    return res.rowcount
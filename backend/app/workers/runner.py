@@ -0,0 +1,213 @@
+"""
+Processing queue worker.
+
+Run one or more of these per host:
+
+    python -m app.workers.runner --concurrency 8
+
+Each worker claims jobs in batches, runs up to ``concurrency`` of them at a
+time, keeps their leases alive with a heartbeat and periodically returns
+jobs abandoned by crashed workers to the queue.
+"""
+from typing import Optional, Dict, Any, Callable, Awaitable, Sequence
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.processing_queue import ProcessingQueue
+from app.workers import queue
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[ProcessingQueue], Awaitable[Optional[Dict[str, Any]]]]
+
+# task_type -> coroutine handling one job
+HANDLERS: Dict[str, Handler] = {}
+
+
+def register(task_type: str) -> Callable[[Handler], Handler]:
+    """Decorator registering a handler for a queue task type."""
+    def decorator(func: Handler) -> Handler:
+        HANDLERS[task_type] = func
+        return func
+    return decorator
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class QueueWorker:
+    """Claims, runs and acknowledges processing_queue jobs."""
+
+    def __init__(
+        self,
+        handlers: Optional[Dict[str, Handler]] = None,
+        worker_id: Optional[str] = None,
+        concurrency: int = settings.QUEUE_BATCH_SIZE,
+        batch_size: int = settings.QUEUE_BATCH_SIZE,
+        task_types: Optional[Sequence[str]] = None,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        poll_interval: float = settings.QUEUE_POLL_INTERVAL,
+        heartbeat_interval: float = settings.QUEUE_HEARTBEAT_INTERVAL,
+        reap_interval: float = settings.QUEUE_LEASE_SECONDS / 2,
+    ):
+        self.handlers = handlers if handlers is not None else HANDLERS
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.task_types = list(task_types) if task_types else list(self.handlers) or None
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.reap_interval = reap_interval
+
+        self._in_flight: Dict[uuid.UUID, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._stopping = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+
+    async def run(self) -> None:
+        """Run until :meth:`stop` is called, then drain in-flight jobs."""
+        logger.info(f"Queue worker {self.worker_id} started (concurrency={self.concurrency})")
+        background = [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._reaper_loop()),
+        ]
+        try:
+            while not self._stopping.is_set():
+                claimed = await self.run_once()
+                if not claimed:
+                    await self._sleep(self.poll_interval)
+        finally:
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            logger.info(
+                f"Queue worker {self.worker_id} stopped "
+                f"(processed={self.processed}, failed={self.failed})"
+            )
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run_once(self) -> int:
+        """Claim one batch sized to the free slots and start it. Returns the number claimed."""
+        free = self.concurrency - len(self._in_flight)
+        if free <= 0:
+            # Wait for a slot instead of spinning on the database
+            await self._slots.acquire()
+            self._slots.release()
+            return 1
+
+        async with self.session_factory() as db:
+            jobs = await queue.claim_batch(
+                db,
+                self.worker_id,
+                limit=min(free, self.batch_size),
+                task_types=self.task_types,
+            )
+
+        for job in jobs:
+            await self._slots.acquire()
+            task = self._in_flight[job.id] = asyncio.create_task(self._execute(job))
+            # A callback rather than a finally: a task cancelled before it starts never runs its body
+            task.add_done_callback(lambda _, job_id=job.id: self._release(job_id))
+        return len(jobs)
+
+    def _release(self, job_id: uuid.UUID) -> None:
+        self._in_flight.pop(job_id, None)
+        self._slots.release()
+
+    async def _execute(self, job: ProcessingQueue) -> None:
+        try:
+            handler = self.handlers.get(job.task_type)
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler registered for task type '{job.task_type}'")
+                result = await handler(job)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Job {job.id} ({job.task_type}) attempt {job.attempts} failed: {e}")
+                async with self.session_factory() as db:
+                    await queue.fail(db, self.worker_id, job, str(e))
+                return
+
+            async with self.session_factory() as db:
+                if await queue.complete(db, self.worker_id, job.id, result):
+                    self.processed += 1
+                else:
+                    logger.warning(f"Job {job.id} lease lost before completion; result discarded")
+        except Exception as e:
+            logger.error(f"Failed to acknowledge job {job.id}: {e}", exc_info=True)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            ids = list(self._in_flight)
+            if not ids:
+                continue
+            try:
+                async with self.session_factory() as db:
+                    renewed = await queue.heartbeat(db, self.worker_id, ids)
+                for job_id in set(ids) - renewed:
+                    task = self._in_flight.get(job_id)
+                    if task is not None:
+                        logger.warning(f"Lease on job {job_id} was lost; cancelling")
+                        task.cancel()
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e}")
+
+    async def _reaper_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                async with self.session_factory() as db:
+                    released = await queue.release_expired(db)
+                if released:
+                    logger.info(f"Released {released} jobs with expired leases")
+            except Exception as e:
+                logger.error(f"Lease reaper failed: {e}")
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(concurrency: int, task_types: Optional[Sequence[str]]) -> None:
+    import signal
+    # Imported for their @register side effects
+    import app.services.accounting_export  # noqa: F401
+    import app.services.ocr_service  # noqa: F401
+    import app.services.whatsapp  # noqa: F401
+
+    worker = QueueWorker(concurrency=concurrency, task_types=task_types)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processing queue worker")
+    parser.add_argument("--concurrency", type=int, default=settings.QUEUE_BATCH_SIZE)
+    parser.add_argument("--task-type", action="append", dest="task_types")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if not settings.DEBUG else logging.DEBUG,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main(args.concurrency, args.task_types))
@@ -0,0 +1,188 @@
+"""
+WhatsApp fallback poller.
+
+    python -m app.workers.whatsapp_poller --concurrency 20
+
+Webhooks (``/webhooks/whatsapp``) deliver messages as they arrive; this
+sweep reads recent chat history for whatever they missed (WAHA restarts,
+webhook outages) and for deployments without a webhook secret. Every
+WHATSAPP_POLL_INTERVAL seconds it picks the sessions that are due:
+``whatsapp_check_frequency`` minutes after their last check, or
+WHATSAPP_FALLBACK_POLL_INTERVAL seconds once webhooks are configured. Up to
+``concurrency`` sessions are polled at once over the shared WAHA client.
+Messages already queued by the webhook are skipped by the queue's unique
+index, so the two paths never queue a message twice.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, List
+import argparse
+import asyncio
+import logging
+import uuid
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.client import Client
+from app.services.whatsapp import MediaMessage, WahaClient, enqueue_media, get_waha_client
+
+logger = logging.getLogger(__name__)
+
+# History re-read before the last check, for messages WAHA stored late
+OVERLAP_SECONDS = 60
+
+
+@dataclass
+class WhatsAppSession:
+    client_id: uuid.UUID
+    session: str
+    monitored: List[str]
+    interval: float  # seconds between checks
+    last_check: Optional[datetime] = None
+
+    @property
+    def due_at(self) -> Optional[datetime]:
+        return self.last_check + timedelta(seconds=self.interval) if self.last_check else None
+
+
+def check_interval(frequency_minutes: Optional[float]) -> float:
+    if settings.WHATSAPP_WEBHOOK_SECRET:
+        return float(settings.WHATSAPP_FALLBACK_POLL_INTERVAL)
+    return (frequency_minutes or 2.0) * 60
+
+
+def _parse_check(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+class SessionStore:
+    """Reads the WhatsApp-enabled clients and records what a poll found."""
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def load(self) -> List[WhatsAppSession]:
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(Client.id, Client.whatsapp_session_id, Client.monitored_phone_numbers,
+                       Client.whatsapp_check_frequency, Client.whatsapp_last_check)
+                .where(Client.whatsapp_enabled.is_(True), Client.is_active.is_(True),
+                       Client.deleted_at.is_(None), Client.whatsapp_session_id.isnot(None))
+            )).all()
+        return [
+            WhatsAppSession(
+                client_id=row.id,
+                session=row.whatsapp_session_id,
+                monitored=list(row.monitored_phone_numbers or []),
+                interval=check_interval(row.whatsapp_check_frequency),
+                last_check=_parse_check(row.whatsapp_last_check),
+            )
+            for row in rows
+        ]
+
+    async def save(self, session: WhatsAppSession, messages: List[MediaMessage], checked_at: datetime) -> int:
+        async with self.session_factory() as db:
+            queued = await enqueue_media(db, session.client_id, messages)
+            await db.execute(
+                update(Client).where(Client.id == session.client_id)
+                .values(whatsapp_last_check=checked_at.isoformat())
+            )
+            await db.commit()
+        return queued
+
+
+class WhatsAppPoller:
+    def __init__(self, store: Optional[SessionStore] = None, waha: Optional[WahaClient] = None,
+                 concurrency: int = settings.WHATSAPP_POLL_CONCURRENCY,
+                 interval: float = settings.WHATSAPP_POLL_INTERVAL):
+        self.store = store or SessionStore()
+        self.waha = waha or get_waha_client()
+        self.concurrency = concurrency
+        self.interval = interval
+        self._stopping = asyncio.Event()
+        self.checks = 0
+        self.failed = 0
+        self.queued = 0
+
+    def due(self, sessions: List[WhatsAppSession], now: datetime) -> List[WhatsAppSession]:
+        return [s for s in sessions if s.due_at is None or s.due_at <= now]
+
+    async def sweep(self) -> int:
+        """Poll every due session once. Returns jobs queued."""
+        now = datetime.utcnow()
+        due = self.due(await self.store.load(), now)
+        if not due:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def poll(session: WhatsAppSession) -> int:
+            async with semaphore:
+                return await self.poll(session)
+
+        queued = sum(await asyncio.gather(*(poll(s) for s in due)))
+        logger.info(f"Polled {len(due)} WhatsApp sessions, queued {queued} media messages")
+        return queued
+
+    async def poll(self, session: WhatsAppSession) -> int:
+        checked_at = datetime.utcnow()
+        since = None
+        if session.last_check:
+            since = int((session.last_check - datetime(1970, 1, 1)).total_seconds()) - OVERLAP_SECONDS
+        try:
+            messages = await self.waha.recent_media(session.session, session.monitored, since)
+            queued = await self.store.save(session, messages, checked_at)
+        except Exception as e:
+            # last_check stays put: the next sweep retries the same window
+            self.failed += 1
+            logger.warning(f"WhatsApp poll of session {session.session!r} failed: {e}")
+            return 0
+        self.checks += 1
+        self.queued += queued
+        return queued
+
+    async def run(self) -> None:
+        logger.info(f"WhatsApp poller started (concurrency={self.concurrency})")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self.sweep()
+                except Exception as e:
+                    logger.error(f"WhatsApp sweep failed: {e}")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.waha.close()
+        logger.info("WhatsApp poller stopped")
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+async def main(concurrency: int) -> None:
+    import signal
+
+    poller = WhatsAppPoller(concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, poller.stop)
+    await poller.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WhatsApp fallback poller")
+    parser.add_argument("--concurrency", type=int, default=settings.WHATSAPP_POLL_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if not settings.DEBUG else logging.DEBUG,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main(args.concurrency))
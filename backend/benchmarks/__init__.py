@@ -0,0 +1 @@
+# Performance benchmarks (run against local services, not part of the app)
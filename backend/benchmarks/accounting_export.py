@@ -0,0 +1,169 @@
+"""
+Accounting export benchmark against the local mock accounting server.
+
+Exports ``--invoices`` approved invoices (``--lines`` line items each) to
+mock QuickBooks and Xero accounts:
+
+* serial: one invoice per call, one call at a time, waiting out 429s
+  (measured on ``--serial-invoices`` and projected),
+* engine: ``AccountingExporter`` with the providers' batch endpoints and
+  per-account rate limits,
+
+and reports invoices/second, calls, 429s and the most calls the mock saw in
+flight per account. With ``--flaky`` the mock loses some answers after
+creating the documents; the engine is re-run until every invoice is
+exported and the mock must not have created any document twice.
+
+No database is needed: invoices live in memory.
+
+    cd backend
+    python -m benchmarks.accounting_export --invoices 1000 --latency 0.1 --flaky 0.05
+"""
+from datetime import date, timedelta
+import argparse
+import asyncio
+import time
+import uuid
+
+import aiohttp
+
+from app.core.config import settings
+from app.models.invoice import Invoice, InvoiceLineItem
+from app.services.accounting_export import (
+    UNCONFIRMED_PREFIX, AccountingExporter, ExportStore, ExportTarget, QuickBooksProvider,
+)
+from benchmarks.accounting_mock import MockAccounting
+
+
+def make_invoices(count: int, lines: int, client_id: uuid.UUID) -> list:
+    invoices = []
+    for i in range(count):
+        items = [
+            InvoiceLineItem(line_number=n + 1, description=f"Item {n}", quantity=2.0, unit_price=12.5,
+                            total_price=25.0, tax_amount=0.0, account_code="6000")
+            for n in range(lines)
+        ]
+        invoices.append(Invoice(
+            id=uuid.uuid4(), client_id=client_id, organization_id=client_id, status="approved",
+            invoice_number=f"INV-{i:06d}", invoice_date=date(2026, 9, 1) + timedelta(days=i % 30),
+            vendor_name=f"Vendor {i % 40}", currency="USD", total_amount=25.0 * lines,
+            line_items=items, accounting_synced=False,
+        ))
+    return sorted(invoices, key=lambda invoice: invoice.id)
+
+
+class MemoryExportStore(ExportStore):
+    def __init__(self, target: ExportTarget, invoices: list):
+        super().__init__(session_factory=None)
+        self._target = target
+        self.invoices = {invoice.id: invoice for invoice in invoices}
+
+    async def target(self, integration_id):
+        return self._target
+
+    def _exportable(self, client_id):
+        return [i for i in self.invoices.values() if i.status == "approved" and i.accounting_id is None]
+
+    async def unconfirmed(self, client_id):
+        return [i for i in self._exportable(client_id) if (i.export_error or "").startswith(UNCONFIRMED_PREFIX)]
+
+    async def pending(self, client_id, after, limit):
+        found = [i for i in self._exportable(client_id)
+                 if not (i.export_error or "").startswith(UNCONFIRMED_PREFIX) and (after is None or i.id > after)]
+        return sorted(found, key=lambda invoice: invoice.id)[:limit]
+
+    async def mark_sent(self, invoice_ids, key):
+        for invoice_id in invoice_ids:
+            self.invoices[invoice_id].export_error = f"{UNCONFIRMED_PREFIX}{key}"
+
+    async def record(self, system, outcomes):
+        for outcome in outcomes:
+            invoice = self.invoices[outcome.invoice_id]
+            invoice.export_error = outcome.error
+            if outcome.accounting_id is not None:
+                invoice.accounting_system, invoice.accounting_id = system, outcome.accounting_id
+                invoice.accounting_synced, invoice.status = True, "exported"
+
+    async def finish(self, target, status, error):
+        pass
+
+
+async def serial(mock: MockAccounting, provider: QuickBooksProvider, invoices: list) -> float:
+    """One bill per call through the single-bill endpoint, waiting out 429s."""
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        for invoice in invoices:
+            while True:
+                async with http.post(f"{mock.base_url}/v3/company/{provider.realm_id}/bill",
+                                     json=provider.document(invoice)) as response:
+                    if response.status != 429:
+                        break
+                    await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+    return len(invoices) / (time.perf_counter() - start)
+
+
+async def engine(mock: MockAccounting, integration_type: str, invoices: list, args) -> None:
+    target = ExportTarget(
+        integration_id=uuid.uuid4(), client_id=invoices[0].client_id, organization_id=invoices[0].client_id,
+        integration_type=integration_type,
+        options={"default_vendor_ref": "56", "expense_account_ref": "7"},
+        credentials={"access_token": "token", "realm_id": "4620816365", "tenant_id": str(uuid.uuid4())},
+    )
+    store = MemoryExportStore(target, invoices)
+    exporter = AccountingExporter(store=store, max_retries=args.retries, backoff=0.5)
+    requests, throttled = mock.requests, mock.throttled
+    start = time.perf_counter()
+    runs = 0
+    while True:
+        runs += 1
+        summary = await exporter.export(target.integration_id)
+        if not summary.undelivered:
+            break
+        assert runs < 10, "export did not converge"
+    elapsed = time.perf_counter() - start
+    # Rejected invoices are tried again by every run, so count end states
+    exported = sum(i.accounting_id is not None for i in invoices)
+    failed = len(invoices) - exported
+    await exporter.close()
+    account = "qb:" if integration_type == "quickbooks" else "xero:"
+    in_flight = max(v for k, v in mock.max_in_flight.items() if k.startswith(account) and not k.endswith(":single"))
+    print(f"{integration_type:<10} engine : {exported / elapsed:8.1f} invoices/s  {elapsed:6.1f}s  "
+          f"{mock.requests - requests} calls, {mock.throttled - throttled} throttled, {in_flight} in flight max, "
+          f"{runs} run(s), {failed} rejected")
+    assert not any((i.export_error or "").startswith(UNCONFIRMED_PREFIX) for i in invoices)
+
+
+async def run(args) -> None:
+    mock = MockAccounting(latency=args.latency, flaky=args.flaky, reject=args.reject)
+    runner = await mock.start()
+    settings.QUICKBOOKS_API_URL = mock.base_url
+    settings.XERO_API_URL = mock.base_url
+    client_id = uuid.uuid4()
+    print(f"{args.invoices} invoices x {args.lines} lines, {args.latency * 1000:.0f}ms per call, "
+          f"{args.flaky:.0%} of answers lost\n")
+
+    provider = QuickBooksProvider({"access_token": "token", "realm_id": "serial"}, {"default_vendor_ref": "56"})
+    sample = make_invoices(args.serial_invoices, args.lines, client_id)
+    flaky, mock.flaky = mock.flaky, 0.0
+    rate = await serial(mock, provider, sample)
+    mock.flaky = flaky
+    print(f"quickbooks serial : {rate:8.1f} invoices/s  (projected {args.invoices / rate:6.1f}s)")
+
+    for integration_type in ("quickbooks", "xero"):
+        await engine(mock, integration_type, make_invoices(args.invoices, args.lines, client_id), args)
+
+    print(f"\nreplayed answers  : {mock.replayed}, duplicates created: {mock.duplicates()}")
+    assert mock.duplicates() == 0, "documents created twice"
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--serial-invoices", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.1, help="mock seconds per call")
+    parser.add_argument("--flaky", type=float, default=0.05, help="share of answers lost after creating")
+    parser.add_argument("--reject", type=float, default=0.01, help="share of documents failing validation")
+    parser.add_argument("--retries", type=int, default=3, help="attempts per batch before a run gives up on it")
+    asyncio.run(run(parser.parse_args()))
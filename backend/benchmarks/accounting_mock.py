@@ -0,0 +1,219 @@
+"""
+Local mock of the QuickBooks Online and Xero APIs (plus a custom API), for
+the export benchmark and manual tests.
+
+Endpoints, with each provider's per-account limits enforced the way the
+real APIs do (429 with Retry-After past the limit):
+
+* ``POST /v3/company/{realm}/batch?requestid=`` (30 items, 40 calls/min and
+  10 in flight per company; ``requestid`` answers a resent request from
+  cache)
+* ``POST /v3/company/{realm}/bill`` (one bill, 500 calls/min)
+* ``POST /api.xro/2.0/Invoices`` (``Xero-tenant-id``, ``Idempotency-Key``;
+  60 calls/min and 5 in flight per tenant)
+* ``POST /custom/invoices`` and ``/custom/invoices/batch``
+
+``--reject`` makes that share of documents fail validation; ``--flaky``
+makes that share of calls answer 503 *after* creating the documents, as
+when a response is lost, which only idempotency keys make safe to retry.
+Created documents are kept per invoice to count duplicates.
+
+    cd backend
+    python -m benchmarks.accounting_mock --port 8010
+"""
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+
+from aiohttp import web
+
+QB_BATCH_LIMIT = 30
+
+
+class MockAccounting:
+    def __init__(self, latency: float = 0.1, reject: float = 0.0, flaky: float = 0.0, seed: int = 7):
+        self.latency = latency
+        self.reject = reject
+        self.flaky = flaky
+        self.rng = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.created: Dict[str, List[str]] = defaultdict(list)  # our invoice id -> documents created
+        self.answers: Dict[tuple, dict] = {}  # (account, idempotency key) -> first answer
+        self.calls: Dict[str, deque] = defaultdict(deque)  # account:endpoint -> call times in the last minute
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.max_in_flight: Dict[str, int] = defaultdict(int)
+        self.requests = 0
+        self.throttled = 0
+        self.replayed = 0
+        self.base_url = ""
+
+    def _admit(self, account: str, per_minute: int, concurrency: Optional[int]) -> Optional[web.Response]:
+        """429 response when a call would exceed the account's limits, else None."""
+        now = time.monotonic()
+        window = self.calls[account]
+        while window and window[0] <= now - 60:
+            window.popleft()
+        if len(window) >= per_minute:
+            self.throttled += 1
+            retry_after = max(1, math.ceil(window[0] + 60 - now))
+            return web.json_response({"error": "rate limit"}, status=429, headers={"Retry-After": str(retry_after)})
+        if concurrency is not None and self.in_flight[account] >= concurrency:
+            self.throttled += 1
+            return web.json_response({"error": "concurrency limit"}, status=429, headers={"Retry-After": "1"})
+        window.append(now)
+        return None
+
+    async def _call(self, account: str, per_minute: int, concurrency: Optional[int], key: Optional[str], create):
+        self.requests += 1
+        if key and (account, key) in self.answers:
+            self.replayed += 1
+            return web.json_response(self.answers[(account, key)])
+        rejected = self._admit(account, per_minute, concurrency)
+        if rejected is not None:
+            return rejected
+        self.in_flight[account] += 1
+        self.max_in_flight[account] = max(self.max_in_flight[account], self.in_flight[account])
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            answer = create()
+        finally:
+            self.in_flight[account] -= 1
+        if key:
+            self.answers[(account, key)] = answer
+        if self.flaky and self.rng.random() < self.flaky:
+            return web.json_response({"error": "upstream timeout"}, status=503)
+        return web.json_response(answer)
+
+    def _create(self, reference: str) -> Optional[str]:
+        if self.reject and self.rng.random() < self.reject:
+            return None
+        document_id = str(next(self.ids))
+        self.created[reference].append(document_id)
+        return document_id
+
+    @staticmethod
+    def _qb_reference(bill: dict) -> str:
+        return (bill.get("PrivateNote") or "").rsplit(" ", 1)[-1]
+
+    async def qb_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        items = body.get("BatchItemRequest", [])
+        if len(items) > QB_BATCH_LIMIT:
+            return web.json_response({"Fault": {"Error": [{"Message": "Too many batch items"}]}}, status=400)
+
+        def create():
+            answers = []
+            for item in items:
+                bill_id = self._create(self._qb_reference(item["Bill"]))
+                if bill_id is None:
+                    answers.append({"bId": item["bId"], "Fault": {"type": "ValidationFault", "Error": [
+                        {"Message": "Business Validation Error", "Detail": "Invalid account reference"}]}})
+                else:
+                    answers.append({"bId": item["bId"], "Bill": {**item["Bill"], "Id": bill_id}})
+            return {"BatchItemResponse": answers}
+
+        return await self._call(f"qb:{request.match_info['realm']}:batch", 40, 10,
+                                request.query.get("requestid"), create)
+
+    async def qb_bill(self, request: web.Request) -> web.Response:
+        bill = await request.json()
+
+        def create():
+            bill_id = self._create(self._qb_reference(bill))
+            if bill_id is None:
+                return {"Fault": {"Error": [{"Message": "Business Validation Error"}]}}
+            return {"Bill": {**bill, "Id": bill_id}}
+
+        return await self._call(f"qb:{request.match_info['realm']}:single", 500, 10,
+                                request.query.get("requestid"), create)
+
+    async def xero_invoices(self, request: web.Request) -> web.Response:
+        tenant = request.headers.get("Xero-tenant-id")
+        if not tenant:
+            return web.json_response({"Title": "Forbidden"}, status=403)
+        documents = (await request.json()).get("Invoices", [])
+
+        def create():
+            answers = []
+            for document in documents:
+                invoice_id = self._create(document.get("Reference", ""))
+                if invoice_id is None:
+                    answers.append({**document, "HasErrors": True, "StatusAttributeString": "ERROR",
+                                    "ValidationErrors": [{"Message": "Account code is not a valid code"}]})
+                else:
+                    answers.append({**document, "InvoiceID": f"xero-{invoice_id}", "StatusAttributeString": "OK"})
+            return {"Invoices": answers}
+
+        return await self._call(f"xero:{tenant}", 60, 5, request.headers.get("Idempotency-Key"), create)
+
+    async def custom_invoice(self, request: web.Request) -> web.Response:
+        document = await request.json()
+
+        def create():
+            document_id = self._create(document.get("id", ""))
+            return {"error": "rejected"} if document_id is None else {"id": f"custom-{document_id}"}
+
+        return await self._call("custom", 600, None, request.headers.get("Idempotency-Key"), create)
+
+    async def custom_batch(self, request: web.Request) -> web.Response:
+        documents = (await request.json()).get("invoices", [])
+
+        def create():
+            results = []
+            for document in documents:
+                document_id = self._create(document.get("id", ""))
+                results.append({"error": "rejected"} if document_id is None else {"id": f"custom-{document_id}"})
+            return {"results": results}
+
+        return await self._call("custom", 600, None, request.headers.get("Idempotency-Key"), create)
+
+    def duplicates(self) -> int:
+        return sum(len(ids) - 1 for ids in self.created.values() if len(ids) > 1)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/v3/company/{realm}/batch", self.qb_batch)
+        app.router.add_post("/v3/company/{realm}/bill", self.qb_bill)
+        app.router.add_post("/api.xro/2.0/Invoices", self.xero_invoices)
+        app.router.add_post("/custom/invoices", self.custom_invoice)
+        app.router.add_post("/custom/invoices/batch", self.custom_batch)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound = site._server.sockets[0].getsockname()
+        self.base_url = f"http://{bound[0]}:{bound[1]}"
+        return runner
+
+
+async def serve(args) -> None:
+    mock = MockAccounting(latency=args.latency, reject=args.reject, flaky=args.flaky)
+    runner = await mock.start(port=args.port)
+    print(json.dumps({
+        "QUICKBOOKS_API_URL": mock.base_url,
+        "XERO_API_URL": mock.base_url,
+        "custom api_url": f"{mock.base_url}/custom",
+    }, indent=2))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per call")
+    parser.add_argument("--reject", type=float, default=0.0, help="share of documents failing validation")
+    parser.add_argument("--flaky", type=float, default=0.0, help="share of calls answering 503 after creating")
+    asyncio.run(serve(parser.parse_args()))
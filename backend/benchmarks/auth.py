@@ -0,0 +1,73 @@
+"""
+Auth dependency micro-benchmark.
+
+Compares the per-request cost of the previous AuthChecker path (decode and
+verify the JWT every time, linear permission scan) with the cached path,
+for a token reused across requests and for a spread of distinct tokens.
+
+    cd backend
+    python -m benchmarks.auth --requests 20000 --tokens 50
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.core.security import AuthChecker, claims_cache, create_access_token, decode_token
+
+PERMISSIONS = [f"perm:{i}" for i in range(40)] + ["invoices:read"]
+
+
+async def legacy_check(token: str, required_role: str, required_permission: str) -> dict:
+    """The previous AuthChecker.__call__ body."""
+    payload = decode_token(token)
+    if payload.get("type") != "access":
+        raise HTTPException(status_code=401, detail="Invalid token type")
+    user_role = payload.get("role")
+    if user_role != required_role and user_role != "super_admin":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    if required_permission not in payload.get("permissions", []) and payload.get("role") != "super_admin":
+        raise HTTPException(status_code=403, detail=f"Missing permission: {required_permission}")
+    return payload
+
+
+async def run(requests: int, tokens: list) -> None:
+    checker = AuthChecker(required_role="admin", required_permission="invoices:read")
+    credentials = [HTTPAuthorizationCredentials(scheme="Bearer", credentials=t) for t in tokens]
+
+    started = time.perf_counter()
+    for i in range(requests):
+        await legacy_check(tokens[i % len(tokens)], "admin", "invoices:read")
+    legacy = time.perf_counter() - started
+
+    claims_cache.clear()
+    started = time.perf_counter()
+    for i in range(requests):
+        await checker(credentials[i % len(credentials)])
+    cached = time.perf_counter() - started
+
+    print(f"{len(tokens):>6} token(s): legacy {legacy / requests * 1e6:8.2f} us/req   "
+          f"cached {cached / requests * 1e6:8.2f} us/req   speedup {legacy / cached:5.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    def token(i: int) -> str:
+        return create_access_token(
+            {"sub": f"user-{i}", "role": "admin", "organization_id": "org", "permissions": PERMISSIONS},
+            expires_delta=timedelta(minutes=30),
+        )
+
+    asyncio.run(run(args.requests, [token(0)]))
+    asyncio.run(run(args.requests, [token(i) for i in range(args.tokens)]))
+
+
+if __name__ == "__main__":
+    main()
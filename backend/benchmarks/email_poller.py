@@ -0,0 +1,236 @@
+"""
+Email poller benchmark against a local fake IMAP server.
+
+Starts an in-process IMAP server (the subset the poller uses: LOGIN,
+SELECT, UID SEARCH, UID FETCH, IDLE) with one account per simulated
+client, runs EmailPoller over ``--clients`` mailboxes for ``--seconds``
+while mail is delivered at random, and reports:
+
+* checks/second and pooled connection reuse,
+* the most connections the server saw open at once (must stay within
+  EMAIL_MAX_CONNECTIONS_PER_HOST),
+* delivery latency (message appended -> stored) for polled and IDLE
+  mailboxes,
+* that every delivered message was stored exactly once.
+
+No database is needed: mailboxes and stored messages live in memory.
+
+    cd backend
+    python -m benchmarks.email_poller --clients 5000 --seconds 30
+"""
+from collections import Counter
+from datetime import datetime
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+from app.services.mailbox import ImapPool, MailboxConfig
+from app.workers.email_poller import EmailPoller, MailboxStore
+
+UIDVALIDITY = 1700000000
+
+
+def make_message(client: int, number: int) -> bytes:
+    return (
+        f"From: vendor{number % 7}@example.com\r\n"
+        f"To: client{client}@example.com\r\n"
+        f"Message-ID: <{client}.{number}@bench>\r\n"
+        f"Subject: Invoice {number}\r\n\r\n"
+        f"Invoice {number} attached.\r\n"
+    ).encode()
+
+
+class FakeImapServer:
+    """Just enough IMAP4rev1 for the poller, with IDLE."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.mailboxes = {}  # username -> [(uid, raw)]
+        self.delivered_at = {}  # (username, uid) -> monotonic time
+        self.idling = {}  # username -> set of writers in IDLE
+        self.open_connections = 0
+        self.max_open_connections = 0
+        self.logins = 0
+
+    def deliver(self, username: str, raw: bytes) -> None:
+        messages = self.mailboxes.setdefault(username, [])
+        uid = messages[-1][0] + 1 if messages else 1
+        messages.append((uid, raw))
+        self.delivered_at[(username, uid)] = time.monotonic()
+        for writer in self.idling.get(username, ()):
+            writer.write(f"* {len(messages)} EXISTS\r\n".encode())
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.open_connections += 1
+        self.max_open_connections = max(self.max_open_connections, self.open_connections)
+        user = None
+        try:
+            writer.write(b"* OK fake IMAP ready\r\n")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+                command, _, args = rest.partition(" ")
+                command = command.upper()
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if command == "CAPABILITY":
+                    writer.write(b"* CAPABILITY IMAP4rev1 IDLE\r\n")
+                elif command == "LOGIN":
+                    user = args.split(" ")[0].strip('"')
+                    self.logins += 1
+                    self.mailboxes.setdefault(user, [])
+                elif command == "SELECT":
+                    messages = self.mailboxes[user]
+                    next_uid = messages[-1][0] + 1 if messages else 1
+                    writer.write(f"* {len(messages)} EXISTS\r\n* OK [UIDVALIDITY {UIDVALIDITY}] UIDs valid\r\n"
+                                 f"* OK [UIDNEXT {next_uid}] next\r\n".encode())
+                elif command == "UID" and args.upper().startswith("SEARCH"):
+                    writer.write(f"* SEARCH {' '.join(map(str, self._search(user, args[7:])))}\r\n".encode())
+                elif command == "UID" and args.upper().startswith("FETCH"):
+                    wanted = {int(uid) for uid in args.split(" ")[1].split(",")}
+                    for seq, (uid, raw) in enumerate(self.mailboxes[user], start=1):
+                        if uid in wanted:
+                            writer.write(f"* {seq} FETCH (UID {uid} BODY[] {{{len(raw)}}}\r\n".encode() + raw + b")\r\n")
+                elif command == "IDLE":
+                    writer.write(b"+ idling\r\n")
+                    self.idling.setdefault(user, set()).add(writer)
+                    done = await reader.readline()
+                    self.idling[user].discard(writer)
+                    if not done:
+                        break
+                    writer.write(f"{tag} OK IDLE terminated\r\n".encode())
+                    continue
+                elif command == "LOGOUT":
+                    writer.write(f"* BYE\r\n{tag} OK LOGOUT completed\r\n".encode())
+                    break
+                writer.write(f"{tag} OK {command} completed\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.open_connections -= 1
+            for writers in self.idling.values():
+                writers.discard(writer)
+            writer.close()
+
+    def _search(self, user: str, criteria: str) -> list:
+        uids = [uid for uid, _ in self.mailboxes[user]]
+        parts = criteria.split()
+        if parts[:1] == ["UID"]:
+            if parts[1] == "*":
+                return uids[-1:]
+            low = int(parts[1].split(":")[0])
+            # Like real servers, "n:*" includes the highest UID even below n
+            return [uid for uid in uids if uid >= low] or uids[-1:]
+        return uids  # SINCE: everything is from today
+
+
+class MemoryMailboxStore(MailboxStore):
+    def __init__(self, mailboxes, server: FakeImapServer, idle_interval: float):
+        super().__init__(session_factory=None)
+        self.mailboxes = mailboxes
+        self.server = server
+        self.stored = Counter()
+        self.latencies = {"poll": [], "idle": []}
+        self.idle_clients = {m.client_id for m in mailboxes if m.interval <= idle_interval}
+
+    async def load(self):
+        return self.mailboxes
+
+    async def save(self, mailbox, folder, watermark, messages):
+        now = time.monotonic()
+        kind = "idle" if mailbox.client_id in self.idle_clients else "poll"
+        for message in messages:
+            key = (mailbox.username, message.uid)
+            self.stored[key] += 1
+            self.latencies[kind].append(now - self.server.delivered_at[key])
+        return 0
+
+    async def touch(self, client_ids, checked_at):
+        pass
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args) -> None:
+    server = FakeImapServer(args.latency)
+    imap = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = imap.sockets[0].getsockname()[1]
+
+    rng = random.Random(7)
+    organization_id = uuid.uuid4()
+    mailboxes = [
+        MailboxConfig(
+            client_id=uuid.uuid4(), organization_id=organization_id, host="127.0.0.1", port=port,
+            ssl=False, username=f"client{i}", password="secret", folders=["INBOX"],
+            interval=args.idle_interval if i < args.idle_clients else args.interval,
+            last_check=datetime.utcnow(),
+        )
+        for i in range(args.clients)
+    ]
+    store = MemoryMailboxStore(mailboxes, server, args.idle_interval)
+    poller = EmailPoller(
+        store=store,
+        pool=ImapPool(max_per_host=args.max_connections),
+        concurrency=args.concurrency,
+        idle_max_interval=args.idle_interval,
+        idle_max_per_host=args.idle_clients,
+    )
+
+    async def deliver():
+        count = 0
+        while True:
+            await asyncio.sleep(1 / args.rate)
+            client = rng.randrange(args.clients)
+            server.deliver(f"client{client}", make_message(client, count))
+            count += 1
+
+    print(f"{args.clients} mailboxes ({args.idle_clients} on IDLE), checked every {args.interval:.0f}s, "
+          f"{args.rate} messages/s for {args.seconds}s, {args.max_connections} connections max\n")
+    running = asyncio.create_task(poller.run())
+    delivering = asyncio.create_task(deliver())
+    await asyncio.sleep(args.seconds)
+    delivering.cancel()
+    # One more interval so every delivered message is due at least once
+    await asyncio.sleep(args.interval + 1)
+    poller.stop()
+    await running
+    imap.close()
+
+    delivered = set(server.delivered_at)
+    missing = delivered - set(store.stored)
+    repeated = [key for key, n in store.stored.items() if n > 1]
+    print(f"checks          : {poller.checks} ({poller.checks / (args.seconds + args.interval + 1):.0f}/s), "
+          f"failed {poller.failed}")
+    print(f"connections     : {poller.pool.opened} opened, {poller.pool.reused} reused, "
+          f"max open {server.max_open_connections}")
+    for kind, values in store.latencies.items():
+        print(f"latency {kind:<7} : p50 {percentile(values, 0.5):6.2f}s  p95 {percentile(values, 0.95):6.2f}s  "
+              f"({len(values)} messages)")
+    print(f"stored          : {len(store.stored)}/{len(delivered)} delivered, "
+          f"{len(missing)} missing, {len(repeated)} stored twice")
+    assert server.max_open_connections <= args.max_connections, "connection limit exceeded"
+    assert not missing and not repeated, "messages lost or duplicated"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--idle-clients", type=int, default=4, help="mailboxes checked often enough for IDLE")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between checks of a mailbox")
+    parser.add_argument("--idle-interval", type=float, default=5.0, help="their check interval")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--rate", type=float, default=50.0, help="messages delivered per second")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-connections", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="server delay per command, seconds")
+    asyncio.run(run(parser.parse_args()))
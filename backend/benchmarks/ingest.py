@@ -0,0 +1,147 @@
+"""
+Bulk invoice ingestion benchmark.
+
+Runs against a local Postgres (DATABASE_URL, or --database-url). Inserts
+``--invoices`` synthetic parsed invoices (``--lines`` line items each) for
+one client three ways and reports rows/second:
+
+* ``orm``: one Invoice + line items added and flushed per invoice, the
+  upload path's pattern (a round trip per row, ORM events per object);
+* ``insert``: ingest_invoices() with multi-row INSERTs;
+* ``copy``: ingest_invoices() with COPY.
+
+The ORM baseline only writes rows, while ingest_invoices() also runs
+vendor normalization and duplicate detection, so the comparison favours
+the baseline. Each method gets its own client so the batches don't flag
+each other.
+
+    cd backend
+    python -m benchmarks.ingest --invoices 10000 --lines 5 --batch-size 1000
+
+The benchmark only touches rows it created and deletes them afterwards.
+"""
+from datetime import date, timedelta
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+from sqlalchemy import text, delete, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.core.config import settings
+from app.core.security import generate_encryption_key
+from app.models import (
+    Base, Organization, Client, Invoice, InvoiceLineItem, InvoiceDuplicateKey, InvoiceRollup,
+)
+from app.services.ingest import ingest_invoices
+
+METHODS = ("orm", "insert", "copy")
+
+
+def make_items(invoices: int, lines: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    items = []
+    for i in range(invoices):
+        line_items = [
+            {"description": f"Item {n} of invoice {i}", "quantity": rng.randint(1, 10),
+             "unit_price": round(rng.uniform(1, 500), 2)}
+            for n in range(lines)
+        ]
+        items.append({
+            "invoice_number": f"BENCH-{i}",
+            "invoice_date": (date(2023, 1, 1) + timedelta(days=rng.randint(0, 700))).isoformat(),
+            "vendor_name": f"Vendor {rng.randint(1, 500)}",
+            "total_amount": round(sum(l["quantity"] * l["unit_price"] for l in line_items), 2) or 10.0,
+            "category": rng.choice(["Office Supplies", "Software", "Travel", None]),
+            "ocr_raw_text": f"Invoice BENCH-{i} " + " ".join(l["description"] for l in line_items),
+            "line_items": line_items,
+        })
+    return items
+
+
+async def setup(session_factory, engine) -> tuple:
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    org_id = uuid.uuid4()
+    clients = {method: uuid.uuid4() for method in METHODS}
+    async with session_factory() as db:
+        db.add(Organization(id=org_id, name="Ingest benchmark", slug=f"bench-{org_id.hex[:12]}",
+                            encryption_key=generate_encryption_key()))
+        await db.flush()
+        for method, client_id in clients.items():
+            db.add(Client(id=client_id, name=f"Ingest benchmark ({method})", organization_id=org_id,
+                          require_manual_review=False))
+        await db.commit()
+    return org_id, clients
+
+
+async def teardown(session_factory, org_id, client_ids) -> None:
+    async with session_factory() as db:
+        invoice_ids = select(Invoice.id).where(Invoice.client_id.in_(client_ids))
+        await db.execute(delete(InvoiceLineItem).where(InvoiceLineItem.invoice_id.in_(invoice_ids)))
+        await db.execute(delete(InvoiceDuplicateKey).where(InvoiceDuplicateKey.client_id.in_(client_ids)))
+        await db.execute(delete(InvoiceRollup).where(InvoiceRollup.client_id.in_(client_ids)))
+        await db.execute(delete(Invoice).where(Invoice.client_id.in_(client_ids)))
+        await db.execute(delete(Client).where(Client.id.in_(client_ids)))
+        await db.execute(delete(Organization).where(Organization.id == org_id))
+        await db.commit()
+
+
+async def ingest_orm(db: AsyncSession, org_id, client_id, batch: list) -> None:
+    for item in batch:
+        lines = item["line_items"]
+        invoice = Invoice(client_id=client_id, organization_id=org_id, source="api",
+                          **{k: v for k, v in item.items() if k not in ("line_items", "invoice_date")},
+                          invoice_date=date.fromisoformat(item["invoice_date"]))
+        invoice.line_items = [
+            InvoiceLineItem(line_number=n, total_price=round(l["quantity"] * l["unit_price"], 2), **l)
+            for n, l in enumerate(lines, start=1)
+        ]
+        db.add(invoice)
+        await db.flush()
+    await db.commit()
+
+
+async def run(args) -> None:
+    engine = create_async_engine(args.database_url, pool_size=4, max_overflow=0)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    items = make_items(args.invoices, args.lines)
+    org_id, clients = await setup(session_factory, engine)
+    rows = args.invoices * (1 + args.lines)
+    try:
+        print(f"{args.invoices} invoices x {args.lines} line items, batches of {args.batch_size}\n")
+        print(f"{'method':<8} {'seconds':>9} {'invoices/s':>12} {'rows/s':>10}")
+        baseline = None
+        for method in METHODS:
+            client_id = clients[method]
+            started = time.perf_counter()
+            async with session_factory() as db:
+                for start in range(0, len(items), args.batch_size):
+                    batch = items[start:start + args.batch_size]
+                    if method == "orm":
+                        await ingest_orm(db, org_id, client_id, batch)
+                    else:
+                        results = await ingest_invoices(db, org_id, batch, client_id=client_id, method=method)
+                        errors = [r.error for r in results if r.error]
+                        assert not errors, f"{method}: {errors[:3]}"
+            seconds = time.perf_counter() - started
+            baseline = baseline or seconds
+            print(f"{method:<8} {seconds:>9.2f} {args.invoices / seconds:>12.0f} {rows / seconds:>10.0f}"
+                  f"  ({baseline / seconds:.1f}x)")
+    finally:
+        await teardown(session_factory, org_id, list(clients.values()))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--invoices", type=int, default=10000)
+    parser.add_argument("--lines", type=int, default=5, help="line items per invoice")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_LIMIT)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Login throughput vs. latency of unrelated endpoints.
+
+Runs an in-process FastAPI app with a /login endpoint (bcrypt verify) and
+a trivial /ping endpoint, drives concurrent logins while pinging, and
+reports logins/second and ping latency percentiles for two variants:
+
+* blocking: verify_password called directly in the async endpoint
+* offloaded: averify_password on the bounded hashing pool
+
+    cd backend
+    python -m benchmarks.login --rounds 12 --logins 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from passlib.context import CryptContext
+
+from app.core import security
+from app.core.security import PasswordHasher
+
+PING_INTERVAL = 0.01  # seconds
+
+
+def build_app(context: CryptContext, stored_hash: str, offload: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login():
+        if offload:
+            valid = await security.averify_password("correct horse", stored_hash)
+        else:
+            valid = context.verify("correct horse", stored_hash)
+        if not valid:
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def drive(app: FastAPI, logins: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = logins
+        statuses = {}
+        ping_latencies = []
+        done = asyncio.Event()
+
+        async def login_worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.post("/login")
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def pinger():
+            # Latency is measured from when each ping was due, so pings that
+            # could not even be sent while the loop was blocked count too
+            due = time.perf_counter()
+            while True:
+                await client.get("/ping")
+                ping_latencies.append((time.perf_counter() - due) * 1000)
+                due += PING_INTERVAL
+                # Once logins are over, stop when no ping is overdue any more
+                if done.is_set() and due > time.perf_counter():
+                    break
+                # Always yield: in-process requests may complete without suspending
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+
+        ping_task = asyncio.create_task(pinger())
+        started = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ping_task
+
+    ping_latencies.sort()
+    return {
+        "logins_per_second": logins / elapsed,
+        "statuses": statuses,
+        "ping_p50": statistics.median(ping_latencies),
+        "ping_p99": ping_latencies[min(len(ping_latencies) - 1, int(len(ping_latencies) * 0.99))],
+        "pings": len(ping_latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-limit", type=int, default=32)
+    args = parser.parse_args()
+
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds)
+    stored_hash = context.hash("correct horse")
+    security.pwd_context = context
+    security.password_hasher = PasswordHasher(args.workers, args.queue_limit)
+
+    print(f"bcrypt rounds={args.rounds}, {args.logins} logins, concurrency {args.concurrency}, "
+          f"{args.workers} hash workers, queue limit {args.queue_limit}")
+    print(f"{'variant':<10} {'logins/s':>9} {'ping p50 ms':>12} {'ping p99 ms':>12} {'pings':>6}  statuses")
+    for variant, offload in (("blocking", False), ("offloaded", True)):
+        result = asyncio.run(drive(build_app(context, stored_hash, offload), args.logins, args.concurrency))
+        print(f"{variant:<10} {result['logins_per_second']:>9.1f} {result['ping_p50']:>12.2f} "
+              f"{result['ping_p99']:>12.2f} {result['pings']:>6}  {result['statuses']}")
+    security.password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Image preprocessing micro-benchmark.
+
+Generates a synthetic scan corpus (text-like strokes, slight skew, scanner
+noise, uneven lighting) and reports megapixels/second for each step.
+
+    cd backend
+    python -m benchmarks.preprocessing --pages 16 --width 2550 --height 3300
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from app.services.image_preprocessing import ImagePreprocessor, PreprocessConfig
+
+
+def synthetic_scan(rng: np.random.Generator, width: int, height: int, skew: float) -> np.ndarray:
+    page = np.full((height, width), 245, dtype=np.uint8)
+    line_height = max(12, height // 60)
+    for y in range(line_height * 3, height - line_height * 3, int(line_height * 1.6)):
+        x = width // 12
+        while x < width - width // 12:
+            word = int(rng.integers(line_height, line_height * 6))
+            cv2.rectangle(page, (x, y), (min(x + word, width - width // 12), y + line_height // 2),
+                          int(rng.integers(10, 60)), -1)
+            x += word + line_height
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+    page = cv2.warpAffine(page, matrix, (width, height), borderValue=245)
+    # Uneven lighting + sensor noise
+    gradient = np.linspace(-25, 10, width, dtype=np.float32)[None, :]
+    noisy = page.astype(np.float32) + gradient + rng.normal(0, 8, page.shape).astype(np.float32)
+    gray = np.clip(noisy, 0, 255).astype(np.uint8)
+    return np.repeat(gray[..., None], 3, axis=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--width", type=int, default=2550)  # US Letter at 300 DPI
+    parser.add_argument("--height", type=int, default=3300)
+    parser.add_argument("--max-size", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--binarize", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    corpus = [
+        synthetic_scan(rng, args.width, args.height, float(rng.uniform(-4, 4)))
+        for _ in range(args.pages)
+    ]
+    config = PreprocessConfig(max_size=args.max_size, binarize=args.binarize)
+    preprocessor = ImagePreprocessor(config)
+
+    totals = {}
+    for _ in range(args.repeat):
+        result = preprocessor.run(corpus)
+        for step, timing in result.timings.items():
+            seconds, megapixels = totals.get(step, (0.0, 0.0))
+            totals[step] = (seconds + timing.seconds, megapixels + timing.megapixels)
+
+    corpus_mp = args.pages * args.width * args.height / 1e6
+    print(f"corpus: {args.pages} pages, {args.width}x{args.height}, {corpus_mp:.1f} MP, x{args.repeat}")
+    print(f"{'step':<10} {'ms/page':>10} {'MP/s':>10}")
+    all_seconds = 0.0
+    for step, (seconds, megapixels) in totals.items():
+        all_seconds += seconds
+        print(f"{step:<10} {seconds * 1000 / (args.pages * args.repeat):>10.2f} {megapixels / seconds:>10.1f}")
+    print(f"{'total':<10} {all_seconds * 1000 / (args.pages * args.repeat):>10.2f} "
+          f"{corpus_mp * args.repeat / all_seconds:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
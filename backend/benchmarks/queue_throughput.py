@@ -0,0 +1,119 @@
+"""
+Processing queue throughput benchmark.
+
+Runs against a local Postgres (DATABASE_URL, or --database-url). Seeds
+``--jobs`` no-op jobs, starts ``--workers`` QueueWorker instances in one
+process and reports jobs/second plus a double-processing check.
+
+    cd backend
+    python -m benchmarks.queue_throughput --jobs 20000 --workers 8 --batch-size 20
+
+The benchmark only touches rows it created and deletes them afterwards.
+"""
+from collections import Counter
+import argparse
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import text, delete, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.core.config import settings
+from app.core.security import generate_encryption_key
+from app.models import Base, Organization, Client, ProcessingQueue
+from app.workers.runner import QueueWorker
+
+TASK_TYPE = "benchmark_noop"
+
+
+async def setup(session_factory, engine, jobs: int) -> tuple:
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    org_id, client_id = uuid.uuid4(), uuid.uuid4()
+    async with session_factory() as db:
+        db.add(Organization(id=org_id, name="Queue benchmark", slug=f"bench-{org_id.hex[:12]}",
+                            encryption_key=generate_encryption_key()))
+        await db.flush()
+        db.add(Client(id=client_id, name="Queue benchmark", organization_id=org_id))
+        await db.flush()
+        rows = [
+            {"id": uuid.uuid4(), "client_id": client_id, "task_type": TASK_TYPE, "priority": i % 10}
+            for i in range(jobs)
+        ]
+        for start in range(0, len(rows), 5000):
+            await db.execute(insert(ProcessingQueue), rows[start:start + 5000])
+        await db.commit()
+    return org_id, client_id
+
+
+async def teardown(session_factory, org_id, client_id) -> None:
+    async with session_factory() as db:
+        await db.execute(delete(ProcessingQueue).where(ProcessingQueue.client_id == client_id))
+        await db.execute(delete(Client).where(Client.id == client_id))
+        await db.execute(delete(Organization).where(Organization.id == org_id))
+        await db.commit()
+
+
+async def run(args) -> None:
+    engine = create_async_engine(args.database_url, pool_size=args.workers * 2 + 4, max_overflow=0)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    org_id, client_id = await setup(session_factory, engine, args.jobs)
+    seen: Counter = Counter()
+    finished = asyncio.Event()
+    done = 0
+
+    async def noop(job):
+        nonlocal done
+        seen[job.id] += 1
+        if args.work_ms:
+            await asyncio.sleep(args.work_ms / 1000)
+        done += 1
+        if done >= args.jobs:
+            finished.set()
+        return {}
+
+    workers = [
+        QueueWorker(
+            handlers={TASK_TYPE: noop},
+            worker_id=f"bench-{i}",
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            session_factory=session_factory,
+            poll_interval=0.05,
+        )
+        for i in range(args.workers)
+    ]
+    try:
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(w.run()) for w in workers]
+        await finished.wait()
+        for w in workers:
+            w.stop()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        duplicates = sum(1 for count in seen.values() if count > 1)
+        print(f"jobs:        {args.jobs}")
+        print(f"workers:     {args.workers} x concurrency {args.concurrency}, batch {args.batch_size}")
+        print(f"elapsed:     {elapsed:.2f}s")
+        print(f"throughput:  {args.jobs / elapsed:,.0f} jobs/s")
+        print(f"per worker:  {', '.join(str(w.processed) for w in workers)}")
+        print(f"duplicates:  {duplicates}")
+    finally:
+        await teardown(session_factory, org_id, client_id)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--work-ms", type=float, default=0.0, help="simulated handler time per job")
+    asyncio.run(run(parser.parse_args()))
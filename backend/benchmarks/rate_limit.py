@@ -0,0 +1,110 @@
+"""
+Rate limiter overhead benchmark.
+
+Calls a minimal ASGI app directly (no server, no sockets) ``--requests``
+times with and without RateLimitMiddleware, spread over ``--callers``
+bearer-token users, and reports the added time per request. With
+``--redis-url`` the limiter also syncs to that Redis every
+RATE_LIMIT_SYNC_INTERVAL while the requests run, and a second limiter
+sharing the Redis checks that two processes together stay near one limit.
+
+    cd backend
+    python -m benchmarks.rate_limit --requests 200000 --callers 1000
+    python -m benchmarks.rate_limit --redis-url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter, RateLimitMiddleware, user_policy
+from app.core.security import create_access_token
+
+
+async def endpoint(scope, receive, send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def make_scopes(callers: int) -> list:
+    return [
+        {
+            "type": "http", "method": "GET", "path": "/api/v1/invoices", "client": ("10.0.0.1", 40000),
+            "headers": [
+                (b"host", b"api"),
+                (b"authorization", f"Bearer {create_access_token({'sub': f'user-{i}', 'role': 'admin'})}".encode()),
+            ],
+        }
+        for i in range(callers)
+    ]
+
+
+async def measure(app, scopes: list, requests: int) -> tuple:
+    statuses = {}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses[message["status"]] = statuses.get(message["status"], 0) + 1
+
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scopes[i % len(scopes)], receive, send)
+    return (time.perf_counter() - start) / requests, statuses
+
+
+async def shared_limit(redis_url: str) -> None:
+    """Two limiters (processes) on one Redis: how close to one limit do they stay together?"""
+    limiters = [RateLimiter(backend="redis", redis_url=redis_url, sync_interval=0.01) for _ in range(2)]
+    policy = ((60, 500), (3600, 10000))
+    identity = f"user:bench-{time.time()}"
+    for limiter in limiters:
+        await limiter.start()
+    allowed = 0
+    for _ in range(2000):
+        for limiter in limiters:
+            allowed += limiter.hit(identity, policy)[0]
+        await asyncio.sleep(0.0005)
+    for limiter in limiters:
+        await limiter.stop()
+    print(f"shared limit    : {allowed} allowed by 2 processes against a limit of 500 "
+          f"(one process alone would allow 500 each)")
+
+
+async def run(args) -> None:
+    settings.RATE_LIMIT_PER_MINUTE = settings.RATE_LIMIT_PER_HOUR = 10 ** 9
+    scopes = make_scopes(args.callers)
+    limiter = RateLimiter(backend="redis" if args.redis_url else "local", redis_url=args.redis_url or "")
+    wrapped = RateLimitMiddleware(endpoint, limiter=limiter)
+
+    # Warm the token claims cache, as a running API would have
+    await measure(wrapped, scopes, len(scopes))
+    bare, _ = await measure(endpoint, scopes, args.requests)
+    if args.redis_url:
+        await limiter.start()
+    limited, statuses = await measure(wrapped, scopes, args.requests)
+    if args.redis_url:
+        await limiter.stop()
+
+    print(f"{args.requests} requests over {args.callers} callers, backend {limiter.backend}\n")
+    print(f"bare app        : {bare * 1e6:7.2f} us/request")
+    print(f"rate limited    : {limited * 1e6:7.2f} us/request  (+{(limited - bare) * 1e6:.2f} us)  {statuses}")
+    print(f"limiter         : {limiter.stats()}")
+
+    settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_PER_HOUR = 60, 1000
+    refusing = RateLimitMiddleware(endpoint, limiter=RateLimiter(backend="local"))
+    _, statuses = await measure(refusing, scopes[:1], 100)
+    print(f"one caller x100 : {statuses} at {user_policy()[0][1]}/minute")
+    if args.redis_url:
+        await shared_limit(args.redis_url)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--callers", type=int, default=1000)
+    parser.add_argument("--redis-url", default=None, help="sync to this Redis (its keys are written)")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,163 @@
+"""
+Full-text search benchmark on a synthetic invoice corpus.
+
+Runs against a local Postgres (DATABASE_URL, or --database-url). Seeds
+``--invoices`` invoices for one client server-side (generate_series; OCR
+text drawn from a skewed vocabulary so some words are common and some
+rare), builds their search vectors, and times each query two ways:
+
+* ``ILIKE '%term%'`` over ocr_raw_text, what a text filter costs without
+  an index (sequential scan over large TEXT values, unranked);
+* ``search_invoices()``: GIN lookup on search_vector, ranked, highlighted.
+
+    cd backend
+    python -m benchmarks.search --invoices 1000000
+
+The benchmark only touches rows it created and deletes them afterwards
+(unless --keep).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import text, delete, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.core.config import settings
+from app.core.security import generate_encryption_key
+from app.models import Base, Organization, Client, Invoice
+from app.services.invoice_listing import InvoiceFilters
+from app.services.search import reindex_statement, search_invoices
+
+CHUNK = 100000
+
+WORDS = (
+    "invoice total amount due payment terms net tax vat subtotal quantity unit price description "
+    "consulting services hardware software license subscription support maintenance shipping freight "
+    "office supplies paper toner printer laptop monitor keyboard cable adapter travel hotel flight "
+    "taxi meals catering conference training workshop marketing advertising hosting cloud storage "
+    "electricity water gas rent lease insurance legal accounting audit repair cleaning security"
+).split()
+
+QUERIES = ["invoice", "consulting", "toner cartridge", "\"cloud hosting\"", "w7731", "audit -legal"]
+
+
+def vocabulary(size: int, seed: int = 7) -> list:
+    """Common invoice words first, then synthetic rare tokens; sampling is skewed toward the front."""
+    rng = random.Random(seed)
+    rare = [f"w{i}" for i in range(size - len(WORDS))]
+    rng.shuffle(rare)
+    return WORDS + rare
+
+
+async def setup(session_factory, engine, invoices: int, vocab: list) -> tuple:
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    org_id, client_id = uuid.uuid4(), uuid.uuid4()
+    async with session_factory() as db:
+        db.add(Organization(id=org_id, name="Search benchmark", slug=f"bench-{org_id.hex[:12]}",
+                            encryption_key=generate_encryption_key()))
+        await db.flush()
+        db.add(Client(id=client_id, name="Search benchmark", organization_id=org_id))
+        await db.commit()
+
+    seed_sql = text("""
+        INSERT INTO invoices (id, client_id, organization_id, invoice_number, invoice_date, vendor_name,
+                              total_amount, currency, is_expense, source, status, needs_review,
+                              accounting_synced, is_duplicate, ocr_raw_text, created_at, updated_at)
+        SELECT gen_random_uuid(), :client_id, :org_id, 'INV-' || g, DATE '2020-01-01' + (g % 2000),
+               'Vendor ' || (g % 5000), round((random() * 5000)::numeric, 2), 'USD', true, 'benchmark',
+               (ARRAY['processed', 'approved', 'exported'])[1 + g % 3], false, false, false,
+               (SELECT string_agg(
+                           (CAST(:vocab AS text[]))[1 + floor(power(random(), 3) * :vocab_size)::int], ' ')
+                FROM generate_series(1, 120 + g % 80)),
+               now(), now()
+        FROM generate_series(:start, :stop) AS g
+    """)
+    started = time.perf_counter()
+    async with session_factory() as db:
+        for start in range(0, invoices, CHUNK):
+            stop = min(start + CHUNK, invoices) - 1
+            await db.execute(seed_sql, {"client_id": client_id, "org_id": org_id, "vocab": vocab,
+                                        "vocab_size": len(vocab), "start": start, "stop": stop})
+            await db.commit()
+            print(f"  seeded {stop + 1:>9} invoices  ({time.perf_counter() - started:.0f}s)")
+
+        await db.execute(reindex_statement(select(Invoice.id).where(Invoice.client_id == client_id)))
+        await db.commit()
+        print(f"  search vectors built  ({time.perf_counter() - started:.0f}s)")
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE invoices"))
+    return org_id, client_id
+
+
+async def teardown(session_factory, org_id, client_id) -> None:
+    async with session_factory() as db:
+        await db.execute(delete(Invoice).where(Invoice.client_id == client_id))
+        await db.execute(delete(Client).where(Client.id == client_id))
+        await db.execute(delete(Organization).where(Organization.id == org_id))
+        await db.commit()
+
+
+async def timed(repeat: int, fn) -> tuple:
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples), result
+
+
+async def run(args) -> None:
+    engine = create_async_engine(args.database_url, pool_size=4, max_overflow=0)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    print(f"Seeding {args.invoices} invoices...")
+    org_id, client_id = await setup(session_factory, engine, args.invoices, vocabulary(args.vocabulary))
+    filters = InvoiceFilters(organization_id=org_id, client_id=client_id)
+    ilike_sql = text("""
+        SELECT id FROM invoices
+        WHERE client_id = :client_id AND deleted_at IS NULL AND ocr_raw_text ILIKE :pattern
+        ORDER BY created_at DESC LIMIT :limit
+    """)
+    try:
+        print(f"\n{'query':<20} {'ILIKE med/max ms':>20} {'tsvector med/max ms':>22} {'hits':>6}")
+        async with session_factory() as db:
+            for q in QUERIES:
+                term = q.strip('"').split(" -")[0]
+
+                async def ilike():
+                    return (await db.execute(ilike_sql, {"client_id": client_id, "pattern": f"%{term}%",
+                                                         "limit": args.limit})).all()
+
+                async def ranked():
+                    return await search_invoices(db, q, filters, limit=args.limit)
+
+                ilike_med, ilike_max, _ = await timed(args.repeat, ilike)
+                ranked_med, ranked_max, hits = await timed(args.repeat, ranked)
+                print(f"{q:<20} {ilike_med:>10.1f}/{ilike_max:<9.1f} {ranked_med:>11.1f}/{ranked_max:<10.1f} "
+                      f"{len(hits):>6}")
+            if hits:
+                print(f"\nSample headline: {hits[0]['headline'][:160]}")
+    finally:
+        if args.keep:
+            print(f"\nKept corpus: organization {org_id}, client {client_id}")
+        else:
+            await teardown(session_factory, org_id, client_id)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--invoices", type=int, default=1000000)
+    parser.add_argument("--vocabulary", type=int, default=20000, help="distinct words in OCR text")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="leave the corpus in place")
+    asyncio.run(run(parser.parse_args()))
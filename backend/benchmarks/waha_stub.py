@@ -0,0 +1,160 @@
+"""
+Local stand-in for the WAHA API, for the WhatsApp benchmark and manual tests.
+
+Serves the endpoints the platform uses, with a configurable per-request
+delay:
+
+* ``GET /api/{session}/chats``
+* ``GET /api/{session}/chats/{chatId}/messages`` (``filter.timestamp.gte``,
+  ``limit``)
+* ``GET /api/files/{name}`` (media, a small PDF)
+
+``WahaStub.webhook_event()`` builds the payload WAHA would post to
+``/webhooks/whatsapp`` for a message, and ``sign()`` its HMAC header.
+
+    cd backend
+    python -m benchmarks.waha_stub --sessions 100 --port 3001
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+from aiohttp import web
+
+MEDIA = b"%PDF-1.4\n" + b"0" * (256 * 1024) + b"\n%%EOF\n"
+
+
+class WahaStub:
+    def __init__(self, sessions: int = 100, chats: int = 3, messages: int = 5, latency: float = 0.0,
+                 api_key: Optional[str] = None, media: bytes = MEDIA):
+        self.latency = latency
+        self.api_key = api_key
+        self.media = media
+        self.requests = 0
+        self.peers = set()  # client (host, port) pairs seen: one per TCP connection
+        now = int(time.time())
+        self.history: Dict[str, Dict[str, List[dict]]] = {}
+        for s in range(sessions):
+            session = f"session{s}"
+            self.history[session] = {
+                f"1555{s:04d}{c:03d}@c.us": [
+                    self.message(session, f"1555{s:04d}{c:03d}", m, now - 60 * (messages - m))
+                    for m in range(messages)
+                ]
+                for c in range(chats)
+            }
+        self.base_url = ""
+
+    def message(self, session: str, number: str, m: int, timestamp: int) -> dict:
+        message_id = f"false_{number}@c.us_{session}{m:06d}"
+        media = m % 2 == 0  # every other message is a document
+        return {
+            "id": message_id,
+            "timestamp": timestamp,
+            "from": f"{number}@c.us",
+            "fromMe": False,
+            "body": "" if media else f"Hello {m}",
+            "hasMedia": media,
+            "media": {
+                "url": f"{{base}}/api/files/{message_id}.pdf",
+                "mimetype": "application/pdf",
+                "filename": f"invoice-{m}.pdf",
+            } if media else None,
+        }
+
+    def webhook_event(self, session: str, message: dict) -> dict:
+        return {"event": "message", "session": session, "payload": self._resolve(message)}
+
+    @staticmethod
+    def sign(body: bytes, secret: str) -> Dict[str, str]:
+        return {
+            "X-Webhook-Hmac": hmac.new(secret.encode(), body, hashlib.sha512).hexdigest(),
+            "X-Webhook-Hmac-Algorithm": "sha512",
+        }
+
+    def media_count(self) -> int:
+        return sum(m["hasMedia"] for chats in self.history.values() for h in chats.values() for m in h)
+
+    def _resolve(self, message: dict) -> dict:
+        if not message["hasMedia"]:
+            return message
+        media = dict(message["media"], url=message["media"]["url"].replace("{base}", self.base_url))
+        return dict(message, media=media)
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info("peername") if request.transport else None)
+        if self.api_key and request.headers.get("X-Api-Key") != self.api_key:
+            raise web.HTTPUnauthorized()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def chats(self, request: web.Request) -> web.Response:
+        chats = self.history.get(request.match_info["session"])
+        if chats is None:
+            raise web.HTTPNotFound()
+        limit = int(request.query.get("limit", 100))
+        return web.json_response([
+            {"id": chat_id, "conversationTimestamp": history[-1]["timestamp"]}
+            for chat_id, history in list(chats.items())[:limit]
+        ])
+
+    async def messages(self, request: web.Request) -> web.Response:
+        history = self.history.get(request.match_info["session"], {}).get(request.match_info["chat_id"], [])
+        since = int(request.query.get("filter.timestamp.gte", 0))
+        limit = int(request.query.get("limit", 100))
+        found = [self._resolve(m) for m in history if m["timestamp"] >= since]
+        return web.json_response(found[-limit:][::-1])
+
+    async def file(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "application/pdf"})
+        response.content_length = len(self.media)
+        await response.prepare(request)
+        for start in range(0, len(self.media), 64 * 1024):
+            await response.write(self.media[start:start + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/api/{session}/chats", self.chats)
+        app.router.add_get("/api/{session}/chats/{chat_id}/messages", self.messages)
+        app.router.add_get("/api/files/{name}", self.file)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound = site._server.sockets[0].getsockname()
+        self.base_url = f"http://{bound[0]}:{bound[1]}"
+        return runner
+
+
+async def serve(args) -> None:
+    stub = WahaStub(sessions=args.sessions, latency=args.latency, api_key=args.api_key)
+    runner = await stub.start(port=args.port)
+    session = next(iter(stub.history))
+    chat_id = next(iter(stub.history[session]))
+    event = json.dumps(stub.webhook_event(session, stub.history[session][chat_id][0]))
+    print(f"WAHA stub on {stub.base_url} ({args.sessions} sessions)\nsample webhook event: {event}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--latency", type=float, default=0.0, help="delay per request, seconds")
+    parser.add_argument("--api-key", default=None)
+    asyncio.run(serve(parser.parse_args()))
@@ -0,0 +1,147 @@
+"""
+WhatsApp polling benchmark against the local WAHA stub.
+
+Polls ``--sessions`` WAHA sessions and downloads their media twice:
+
+* naive: one session after another, a new HTTP session (and connection)
+  per request, media read whole into memory,
+* pooled: ``WhatsAppPoller`` over one pooled ``WahaClient`` with
+  ``--concurrency`` sessions at once, media streamed into storage.
+
+and reports wall time, requests and TCP connections opened. The webhook signature check is exercised on a stub event.
+No database is needed: sessions and queued messages live in memory.
+
+    cd backend
+    python -m benchmarks.whatsapp --sessions 500 --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+
+import aiohttp
+
+from app.core.config import settings
+from app.services import storage, whatsapp
+from app.services.whatsapp import WahaClient, media_messages
+from app.workers.whatsapp_poller import SessionStore, WhatsAppPoller, WhatsAppSession
+from benchmarks.waha_stub import WahaStub
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, sessions):
+        super().__init__(session_factory=None)
+        self.sessions = sessions
+        self.queued = {}
+
+    async def load(self):
+        return self.sessions
+
+    async def save(self, session, messages, checked_at):
+        new = [m for m in messages if (session.client_id, m.id) not in self.queued]
+        for m in new:
+            self.queued[(session.client_id, m.id)] = m
+        session.last_check = checked_at
+        return len(new)
+
+
+async def naive(stub: WahaStub, sessions: list) -> tuple:
+    found = 0
+    for session in sessions:
+        async with aiohttp.ClientSession() as http:
+            async with http.get(f"{stub.base_url}/api/{session.session}/chats") as response:
+                chats = await response.json()
+        for chat in chats:
+            async with aiohttp.ClientSession() as http:
+                async with http.get(f"{stub.base_url}/api/{session.session}/chats/{chat['id']}/messages",
+                                    params={"downloadMedia": "true"}) as response:
+                    history = await response.json()
+            for message in media_messages(history):
+                async with aiohttp.ClientSession() as http:
+                    async with http.get(message.url) as response:
+                        await response.read()
+                found += 1
+    return found
+
+
+async def pooled(stub: WahaStub, sessions: list, concurrency: int) -> tuple:
+    waha = WahaClient(base_url=stub.base_url, pool_size=concurrency)
+    store = MemorySessionStore(sessions)
+    poller = WhatsAppPoller(store=store, waha=waha, concurrency=concurrency)
+    await poller.sweep()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def download(message, client_id):
+        async with semaphore:
+            stored = await storage.save_stream(waha.stream_media(message.url), message.filename, client_id)
+            return stored.size
+
+    sizes = await asyncio.gather(*(download(m, client_id) for (client_id, _), m in store.queued.items()))
+    assert poller.failed == 0, "polls failed"
+    await waha.close()
+    return len(sizes), sum(sizes)
+
+
+def check_webhook(stub: WahaStub) -> None:
+    settings.WHATSAPP_WEBHOOK_SECRET = "bench-secret"
+    session = next(iter(stub.history))
+    message = next(iter(stub.history[session].values()))[0]
+    body = json.dumps(stub.webhook_event(session, message)).encode()
+    headers = stub.sign(body, settings.WHATSAPP_WEBHOOK_SECRET)
+    whatsapp.verify_signature(body, headers["X-Webhook-Hmac"], headers["X-Webhook-Hmac-Algorithm"])
+    try:
+        whatsapp.verify_signature(body + b" ", headers["X-Webhook-Hmac"], headers["X-Webhook-Hmac-Algorithm"])
+    except whatsapp.WebhookRejected:
+        pass
+    else:
+        raise AssertionError("tampered webhook accepted")
+    assert len(media_messages([json.loads(body)["payload"]])) == 1
+    print("webhook         : signature verified, tampered body rejected")
+
+
+def sessions_of(stub: WahaStub) -> list:
+    return [
+        WhatsAppSession(client_id=uuid.uuid4(), session=name, monitored=[], interval=120.0)
+        for name in stub.history
+    ]
+
+
+async def run(args) -> None:
+    stub = WahaStub(sessions=args.sessions, chats=args.chats, messages=args.messages, latency=args.latency)
+    runner = await stub.start()
+    expected = stub.media_count()
+    print(f"{args.sessions} sessions x {args.chats} chats, {expected} media messages, "
+          f"{args.latency * 1000:.0f}ms per request\n")
+    check_webhook(stub)
+
+    stub.requests, stub.peers = 0, set()
+    start = time.perf_counter()
+    found = await naive(stub, sessions_of(stub))
+    elapsed = time.perf_counter() - start
+    print(f"naive           : {elapsed:7.2f}s  {stub.requests} requests  {len(stub.peers)} connections  "
+          f"({found} media)")
+    assert found == expected
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings.STORAGE_PATH = directory
+        stub.requests, stub.peers = 0, set()
+        start = time.perf_counter()
+        found, size = await pooled(stub, sessions_of(stub), args.concurrency)
+        elapsed = time.perf_counter() - start
+    print(f"pooled          : {elapsed:7.2f}s  {stub.requests} requests  {len(stub.peers)} connections  "
+          f"({found} media streamed, {size / 2**20:.0f} MiB stored)")
+    assert found == expected
+    assert len(stub.peers) <= args.concurrency, "connection pool exceeded"
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub delay per request, seconds")
+    parser.add_argument("--concurrency", type=int, default=settings.WHATSAPP_POLL_CONCURRENCY)
+    asyncio.run(run(parser.parse_args()))